@@ -1,6 +1,12 @@
 import numpy as np
 import types
-import copy
+import json
+import os
+import shutil
+import hashlib
+import tempfile
+from timeit import default_timer
+from functools import partial
 version = '0.2.1.1'
 
 """
@@ -102,55 +108,319 @@ process signals from higher classes.
     slicing/sampling rate to be a fraction of the bunch spacing in the case of
     multi bunch simulations.
 
+    ### Multi-channel signals
+    -------------------------
+    Signals from several channels sharing the same bin set (e.g. x and y
+    planes, or multiple pickups using the same signal processing model) can
+    be processed together by stacking them into a 2D array with a shape
+    (n_channels, n_bins). The signal processors operate along the last axis
+    and the precomputed operators are shared by the channels. A location of
+    the signal must be common for all the channels, but a value of beta
+    function can be given separately to each channel by using a column
+    array, i.e. with a shape (n_channels, 1). Note that the turn-by-turn
+    processors (registers, combiners) use a common tune for all the channels.
+
+    ### Precision
+    -------------
+    The signal processors honor the precision of the input signal, i.e.
+    a single precision (float32) signal is processed by using single
+    precision operators and the output signal is in single precision.
+    Signals of the other types are processed in double precision (float64).
+    The precision of a ProcessorChain can be set by using the argument dtype,
+    which halves the memory traffic of the chain in single precision. Single
+    precision is typically sufficient for signals which have been quantized
+    by an ADC with 8-16 bits.
+
+    ### Fixed-point signals
+    -----------------------
+    A quantized signal can be given as integer codes (e.g. int16 or int32)
+    instead of the values, which models the fixed-point arithmetic of digital
+    electronics (e.g. an FPGA) and reduces the memory traffic. The value of
+    one code is given in the parameters (parameters['scale']), i.e. the value
+    of the signal is signal*parameters['scale']. The scale is None for
+    the floating point signals. Fixed-point signals are generated by
+    the quantizers (e.g. ADC(..., code_dtype=np.int16)) and they are
+    converted back to values by a DAC.
+
+    The processors of the digital signal processing (e.g. FIRFilter,
+    TurnFIRFilter and Upsampler) keep the integer codes. The filter
+    coefficients are rounded to fixed-point numbers with a given number of
+    bits (coefficient_bits), the products are accumulated as integers, which
+    are saturated to the given width of the accumulator (accumulator_bits),
+    and the result is rounded back to the codes of the input signal. The
+    linear processors (e.g. LinearTransform) handle the codes as floating
+    point numbers and keep the scale. The processors based on multiplication
+    and addition (e.g. IdealAmplifier, NoiseGate and NoiseGenerator) convert
+    the codes to values at their input, because their operations depend on
+    the values. The feedback objects convert the codes of the kick signals
+    to values, i.e. a chain without a DAC gives the correct kicks.
+
 The signal itself does not contain any information about what is the signal
 class or how the bins are located in the physical space. Thus, this
 information is given in parallel to the signal to the signal processors
-by using a dictionary *parameters*.
+by using an immutable object *parameters*, which can be read like the
+standard parameter dictionary (e.g. parameters['bin_edges']).
 
-The standard (minimal) prototype for the parameter dictionary is following,
-but it is also allowed to add additional information to be carried between
-the signal processors:
+The standard (minimal) prototype for the parameters is following. Because
+the object is immutable, modified parameters are created by using the method
+replace(...), and the sampling history is tracked by a reference to
+the parent parameters instead of copying it:
 """
 
-def Parameters(signal_class=0, bin_edges=np.array([]), n_segments=0,
-               n_bins_per_segment=0, segment_ref_points=np.array([]),
-               previous_parameters = [], location=0, beta=1.):
+def _frozen_array(value):
+    if isinstance(value, np.ndarray) and (value.dtype == np.float64) and \
+            (not value.flags.writeable):
+        return value
+    value = np.array(value, dtype=float)
+    value.flags.writeable = False
+    return value
+
+
+def _hashable(value):
+    if isinstance(value, np.ndarray):
+        return (value.shape, value.tostring())
+    elif isinstance(value, UniformBinSet):
+        return value.key
+    else:
+        return value
+
+
+# a value for a bin set, which has not been checked yet
+_UNKNOWN = object()
+
+
+class Parameters(object):
+    """
+    Signal parameters. The object is immutable, i.e. a modified copy can be
+    created by using the method replace(...). The values can be read by using
+    attributes or keys of the standard parameter dictionary (e.g.
+    parameters['bin_edges']).
     """
-    Returns a prototype for signal parameters.
 
-    Parameters
-    ----------
-    class : int
-        A signal class
-    bin_edges : NumPy array
-        A 2D numpy array, which is equal length to the signal. Each row
-        includes two floating point numbers, the edge positions of
-        the bin in the physical space (time [s]).
-    n_segments : int
-        A number of equal length and equally binned segments where to
-        the signal can be divided
-    n_bins_per_segment : int
-        A number of bins per segment. `len(bin_edges)/n_segments`
-    segment_ref_points : NumPy array
-        A numpy array of the reference point for the segments
-    previous_parameters : array
-        A list of Parameter objects, which tracks how the samping is changed
-        during the signal processing
-    location : float
-        A location of the signal in betatron phase.
-    beta : float
-        A vale of beta function in the source of the signal. Value 1
-        is neutral for signal processing
-    """
-    return {'class': signal_class,
-            'bin_edges': bin_edges,
-            'n_segments': n_segments,
-            'n_bins_per_segment': n_bins_per_segment,
-            'segment_ref_points': segment_ref_points,
-            'previous_parameters': previous_parameters,
-            'location': location,
-            'beta': beta
-            }
+    __slots__ = ('signal_class', '_bin_edges', '_bin_set', 'n_segments',
+                 'n_bins_per_segment', 'segment_ref_points', 'parent',
+                 'location', 'beta', 'scale', '_hash')
+
+    _keys = ('class', 'bin_edges', 'n_segments', 'n_bins_per_segment',
+             'segment_ref_points', 'previous_parameters', 'location', 'beta',
+             'scale')
+
+    def __init__(self, signal_class=0, bin_edges=np.array([]), n_segments=0,
+                 n_bins_per_segment=0, segment_ref_points=np.array([]),
+                 previous_parameters=None, location=0, beta=1., scale=None):
+        """
+        Parameters
+        ----------
+        signal_class : int
+            A signal class
+        bin_edges : NumPy array or UniformBinSet
+            A 2D numpy array, which is equal length to the signal. Each row
+            includes two floating point numbers, the edge positions of
+            the bin in the physical space (time [s]). If a UniformBinSet is
+            given, the edges are calculated only when they are requested.
+        n_segments : int
+            A number of equal length and equally binned segments where to
+            the signal can be divided
+        n_bins_per_segment : int
+            A number of bins per segment. `len(bin_edges)/n_segments`
+        segment_ref_points : NumPy array
+            A numpy array of the reference point for the segments
+        previous_parameters : Parameters or list
+            Parameters of the signal before the sampling was changed. The
+            history of the sampling is tracked by a reference, i.e. the last
+            item of a list is used as a parent.
+        location : float
+            A location of the signal in betatron phase.
+        beta : float
+            A vale of beta function in the source of the signal. Value 1
+            is neutral for signal processing
+        scale : float
+            A value of one integer code of a fixed-point signal. None for
+            the floating point signals.
+        """
+        if isinstance(previous_parameters, (list, tuple)):
+            if len(previous_parameters) > 0:
+                parent = previous_parameters[-1]
+            else:
+                parent = None
+        else:
+            parent = previous_parameters
+
+        if isinstance(bin_edges, UniformBinSet):
+            bin_set = bin_edges
+            bin_edges = None
+        else:
+            bin_set = _UNKNOWN
+            bin_edges = _frozen_array(bin_edges)
+        segment_ref_points = _frozen_array(segment_ref_points)
+
+        set_value = super(Parameters, self).__setattr__
+        set_value('signal_class', signal_class)
+        set_value('_bin_edges', bin_edges)
+        set_value('_bin_set', bin_set)
+        set_value('n_segments', n_segments)
+        set_value('n_bins_per_segment', n_bins_per_segment)
+        set_value('segment_ref_points', segment_ref_points)
+        set_value('parent', parent)
+        set_value('location', location)
+        set_value('beta', beta)
+        set_value('scale', scale)
+
+        if parent is not None:
+            parent_hash = hash(parent)
+        else:
+            parent_hash = None
+
+        if bin_edges is None:
+            bin_key = _hashable(bin_set)
+        else:
+            bin_key = _hashable(bin_edges)
+
+        set_value('_hash', hash((signal_class, bin_key,
+                                 n_segments, n_bins_per_segment,
+                                 _hashable(segment_ref_points), parent_hash,
+                                 _hashable(location), _hashable(beta),
+                                 scale)))
+
+    @property
+    def bin_edges(self):
+        if self._bin_edges is None:
+            super(Parameters, self).__setattr__('_bin_edges',
+                                                self._bin_set.edges)
+        return self._bin_edges
+
+    @property
+    def bin_set(self):
+        """
+        A UniformBinSet describing the bins, or None if the bin set is not
+        uniform. The uniformity of explicitly given bin edges is checked on
+        the first request.
+        """
+        if self._bin_set is _UNKNOWN:
+            super(Parameters, self).__setattr__('_bin_set', uniform_bin_set(
+                    self._bin_edges, self.n_segments, self.n_bins_per_segment))
+        return self._bin_set
+
+    def _bin_representation(self):
+        if self._bin_edges is None:
+            return self._bin_set
+        else:
+            return self._bin_edges
+
+    @property
+    def previous_parameters(self):
+        """
+        A list of Parameters objects, which tracks how the samping is changed
+        during the signal processing (the oldest first)
+        """
+        previous_parameters = []
+        parent = self.parent
+        while parent is not None:
+            previous_parameters.append(parent)
+            parent = parent.parent
+        return previous_parameters[::-1]
+
+    def replace(self, **changes):
+        """
+        Returns a copy of the parameters, where the values given as keyword
+        arguments (e.g. location=0.5) are replaced.
+        """
+        values = {'signal_class': self.signal_class,
+                  'bin_edges': self._bin_representation(),
+                  'n_segments': self.n_segments,
+                  'n_bins_per_segment': self.n_bins_per_segment,
+                  'segment_ref_points': self.segment_ref_points,
+                  'previous_parameters': self.parent,
+                  'location': self.location,
+                  'beta': self.beta,
+                  'scale': self.scale}
+
+        if 'class' in changes:
+            changes['signal_class'] = changes.pop('class')
+        if 'parent' in changes:
+            changes['previous_parameters'] = changes.pop('parent')
+
+        for key in changes:
+            if key not in values:
+                raise ValueError('Unknown parameter ' + str(key))
+
+        values.update(changes)
+
+        return Parameters(**values)
+
+    def __getitem__(self, key):
+        if key == 'class':
+            return self.signal_class
+        elif key in self._keys:
+            return getattr(self, key)
+        else:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        raise TypeError('Parameters are immutable, use the method replace(...)')
+
+    def __setattr__(self, key, value):
+        raise TypeError('Parameters are immutable, use the method replace(...)')
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def get(self, key, default=None):
+        if key in self._keys:
+            return self[key]
+        else:
+            return default
+
+    def keys(self):
+        return list(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif not isinstance(other, Parameters):
+            return False
+        elif self._hash != other._hash:
+            return False
+        else:
+            return ((self.signal_class == other.signal_class) and
+                    np.array_equal(self.bin_edges, other.bin_edges) and
+                    (self.n_segments == other.n_segments) and
+                    (self.n_bins_per_segment == other.n_bins_per_segment) and
+                    np.array_equal(self.segment_ref_points,
+                                   other.segment_ref_points) and
+                    (self.parent == other.parent) and
+                    np.array_equal(self.location, other.location) and
+                    np.array_equal(self.beta, other.beta) and
+                    (self.scale == other.scale))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (Parameters, (self.signal_class, self._bin_representation(),
+                             self.n_segments, self.n_bins_per_segment,
+                             self.segment_ref_points, self.parent,
+                             self.location, self.beta, self.scale))
+
+    def __repr__(self):
+        return ('Parameters(class=' + str(self.signal_class) +
+                ', n_segments=' + str(self.n_segments) +
+                ', n_bins_per_segment=' + str(self.n_bins_per_segment) +
+                ', location=' + str(self.location) +
+                ', beta=' + str(self.beta) +
+                ', scale=' + str(self.scale) + ')')
 
 
 """
@@ -261,6 +531,61 @@ class MinimalChargeWeighter(object):
 
     Details of these processors can be found from the
     file processors/register.py.
+
+    ### Output buffer extension
+    ---------------------------
+    A signal processor supporting the output buffer extension accepts
+    an optional input parameter out for the method process(...). If an array
+    is given, the output signal is written into it and the same array is
+    returned, i.e. no new arrays are allocated for the output signal. The
+    array has the correct length for the output signal and it never shares
+    memory with the input signal.
+
+    The buffers are allocated and given by a ProcessorChain. Because the
+    buffers are reused on every call, a processor storing signals over
+    the turns (e.g. a register) must copy them.
+
+    ### Linear extension
+    --------------------
+    A signal processor supporting the linear extension is linear and time
+    invariant after the first call, i.e. the output signal is a product of
+    a fixed matrix and the input signal. This allows a ProcessorChain to fuse
+    adjacent linear processors (see the argument fuse). The processor might
+    provide the matrix as a sparse matrix by using the method
+    linear_operator(). Otherwise the matrix is determined by processing unit
+    impulses, which requires the support of multi-channel signals.
+
+    ### Segment extension
+    ---------------------
+    A signal processor supporting the segment extension processes the segments
+    of the signal independently, i.e. the output segments (and their bins)
+    depend only on the corresponding input segments and the number of
+    segments is not changed. Thus, a signal can be processed in parts, e.g.
+    the leading segment processors of a chain are run in the MPI ranks owning
+    the bunches before the signals are gathered (see feedback.py). The bins
+    of a resampled segment should not overlap with the other segments.
+
+    ### Trace extension
+    -------------------
+    Input and output signals of any signal processor can be captured by
+    giving an input parameter trace to the processor (e.g.
+    trace=Trace(depth=10, every=100, window=(0, 500), trigger=1e-3)). The
+    signals are copied into ring buffers of the given depth, which are
+    allocated once, and the captures can be read by indexing the attribute
+    trace of the processor. Tracing is implemented by the default macros and
+    it adds no cost to the processors without the input parameter.
+
+    ### Preparation
+    ---------------
+    The signal processors are initialized lazily on the first call of
+    the method process(...). A processor might also provide the method
+    prepare(parameters, *args, **kwargs), which runs the initialization for
+    the given input parameters without a signal and returns the parameters of
+    the output signal (None, if they are not known before the first signal).
+    A list of processors can be prepared by using the function prepare(...)
+    and independent lists in parallel by using the function
+    prepare_parallel(...), which allows to move the initialization costs away
+    from the first turn.
 """
 
 
@@ -292,6 +617,9 @@ def process(parameters, signal, processors, **kwargs):
         The processed signal
     """
 
+    if isinstance(processors, ProcessorChain):
+        return processors.process(parameters, signal, **kwargs)
+
     for processor in processors:
         parameters, signal = processor.process(parameters, signal, **kwargs)
 #        if signal is None:
@@ -301,6 +629,1401 @@ def process(parameters, signal, processors, **kwargs):
     return parameters, signal
 
 
+def prepare(parameters, processors, n_channels=None, **kwargs):
+    """
+    Initializes the signal processors for the signal described by the given
+    parameters without processing a signal (see the method prepare(...) of
+    the processors). The parameters are passed through the processors
+    until a processor without the method prepare(...) or unknown output
+    parameters is found. The rest of the processors are initialized on
+    the first call of process(...).
+
+    Parameters
+    ----------
+    parameters : dict
+        A standardized dict of the additional parameters describing the signal
+    processors : list
+        A list of signal processors.
+    n_channels : int
+        A number of channels in a multi-channel signal (None for a single
+        channel signal)
+    **kwargs : -
+        Other arguments which will be passed to the signal processors
+
+    Returns
+    -------
+    dict
+        The parameters of the output signal or None, if they are not known
+    """
+
+    if isinstance(processors, ProcessorChain):
+        return processors.prepare(parameters, n_channels=n_channels, **kwargs)
+
+    for processor in processors:
+        if (parameters is None) or (not hasattr(processor, 'prepare')):
+            return None
+        parameters = processor.prepare(parameters, **kwargs)
+
+    return parameters
+
+
+def signal_dtype(signal):
+    """
+    Returns the floating point type used for processing the signal, i.e.
+    float32 for single precision signals and float64 otherwise.
+    """
+    if getattr(signal, 'dtype', None) == np.float32:
+        return np.dtype(np.float32)
+    else:
+        return np.dtype(np.float64)
+
+
+def is_fixed_point(signal):
+    """
+    Returns True if the signal consists of integer codes (see fixed-point
+    signals).
+    """
+    dtype = getattr(signal, 'dtype', None)
+    return (dtype is not None) and (dtype.kind in 'iu')
+
+
+def fixed_point_coefficients(coefficients, n_bits):
+    """
+    Rounds the given coefficients to fixed-point numbers, which fit into
+    signed integers of the given number of bits.
+
+    Parameters
+    ----------
+    coefficients : NumPy array
+        The coefficients
+    n_bits : int
+        A number of bits in the coefficients (including the sign bit)
+
+    Returns
+    -------
+    NumPy array
+        The coefficients as integers (int64)
+    int
+        A number of fraction bits, i.e. the value of the integer coefficient
+        is coefficient*2**(-fraction_bits)
+    """
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    max_value = np.max(np.abs(coefficients)) if coefficients.size > 0 else 0.
+    if max_value > 0.:
+        fraction_bits = n_bits - 2 - int(np.floor(np.log2(max_value)))
+    else:
+        fraction_bits = n_bits - 1
+
+    max_code = 2**(n_bits-1) - 1
+    integer_coefficients = np.floor(coefficients*2.**fraction_bits + 0.5)
+    np.clip(integer_coefficients, -max_code, max_code,
+            out=integer_coefficients)
+
+    return integer_coefficients.astype(np.int64), fraction_bits
+
+
+def fixed_point_output(accumulator, fraction_bits, accumulator_bits, out):
+    """
+    Converts an accumulator of integer products (int64) into the codes of
+    the output signal. The accumulator is saturated to the given width,
+    the fraction bits of the coefficients are rounded away and the result is
+    saturated to the range of the output type. The accumulator is modified in
+    place.
+
+    Parameters
+    ----------
+    accumulator : NumPy array
+        The accumulated products as int64 numbers
+    fraction_bits : int
+        A number of fraction bits in the coefficients
+    accumulator_bits : int
+        A width of the accumulator (including the sign bit)
+    out : NumPy array
+        An integer array for the output codes
+
+    Returns
+    -------
+    NumPy array
+        The output array
+    """
+    max_value = 2**(accumulator_bits-1) - 1
+    np.clip(accumulator, -max_value, max_value, out=accumulator)
+
+    if fraction_bits > 0:
+        accumulator += 1 << (fraction_bits-1)
+        np.right_shift(accumulator, fraction_bits, out=accumulator)
+    elif fraction_bits < 0:
+        np.left_shift(accumulator, -fraction_bits, out=accumulator)
+
+    limits = np.iinfo(out.dtype)
+    np.clip(accumulator, limits.min, limits.max, out=accumulator)
+    np.copyto(out, accumulator, casting='unsafe')
+
+    return out
+
+
+def round_to_codes(signal, out):
+    """
+    Rounds a floating point signal to the nearest integer codes, which are
+    saturated to the range of the output array.
+    """
+    limits = np.iinfo(out.dtype)
+    rounded = np.floor(np.asarray(signal, dtype=np.float64) + 0.5)
+    np.clip(rounded, limits.min, limits.max, out=rounded)
+    np.copyto(out, rounded, casting='unsafe')
+
+    return out
+
+
+def to_values(parameters, signal, out=None):
+    """
+    Converts a fixed-point signal into floating point values (see fixed-point
+    signals). Other signals are returned as they are.
+
+    Returns
+    -------
+    Parameters
+        The parameters without the scale
+    NumPy array
+        The values of the signal
+    """
+    scale = parameters['scale']
+    if scale is None:
+        return parameters, signal
+
+    if out is None:
+        out = np.empty(np.shape(signal))
+    np.multiply(signal, scale, out=out)
+
+    return parameters.replace(scale=None), out
+
+
+def check_signal_classes(processors):
+    """
+    Checks that the signal classes of the consecutive signal processors are
+    compatible, i.e. the output signal class of a processor is equal or higher
+    than the input signal class of the next processor. Processors without
+    (or with not yet determined) signal classes break the check.
+
+    Parameters
+    ----------
+    processors : list
+        A list of signal processors.
+
+    Returns
+    -------
+    tuple
+        The input signal class of the first processor and the output signal
+        class of the last processor (None if unknown)
+    """
+
+    input_class = None
+    current_class = None
+
+    for i, processor in enumerate(processors):
+        signal_classes = getattr(processor, 'signal_classes', None)
+        if not isinstance(signal_classes, tuple):
+            current_class = None
+            continue
+
+        if i == 0:
+            input_class = signal_classes[0]
+
+        if (current_class is not None) and (current_class < signal_classes[0]):
+            raise ValueError('The output signal class ' + str(current_class) +
+                             ' of the processor ' + str(i - 1) +
+                             ' is not compatible with the input signal class ' +
+                             str(signal_classes[0]) + ' of the processor ' +
+                             str(i))
+        current_class = signal_classes[1]
+
+    return (input_class, current_class)
+
+
+class ProcessorChain(object):
+    """
+    A list of signal processors, which is built once and used for processing
+    the signal turn by turn. The compatibility of the signal classes is
+    checked when the chain is built and the lazy initializations of the signal
+    processors are run on the first call of the method process(...), after
+    which the signal is passed through the pre-bound process methods of the
+    processors without additional checks.
+
+    The chain is iterable, i.e. it can be used in the place of a list of
+    signal processors.
+
+    After the first call, the chain owns two output buffers, which are
+    given in turns to the processors supporting the output buffer extension.
+    Thus, the returned signal might be a view to the buffers of the chain, and
+    it is valid only until the next call of the method process(...). The
+    buffers are bound to the shape and the parameters of the first signal. If
+    a signal with a different shape or different parameters is given later,
+    the chain is initialized again for it.
+
+    The chain can also be initialized before the first signal by using
+    the method prepare(...), if all the processors support it.
+
+    The processors can be profiled by setting a Profiler object to the
+    attribute profiler, and the calls of the processors can be recorded to
+    a timeline by setting a Timeline object to the attribute timeline. The
+    calls initializing the chain are not included in the timeline or in
+    the values of the processors, but the profiler reports them separately.
+
+    If a dtype is given, the input signal is converted to it (float32 or
+    float64) and the signal is processed in that precision (see
+    the precision of the signals). By default, the precision of the first
+    input signal (or float64 for a prepared chain) is used for all the
+    signals.
+
+    If fusion is enabled, adjacent processors supporting the linear extension
+    are replaced by a single sparse operator, which is a product of their
+    operators (see the linear extension). Runs are fused only as long as the
+    number of non-zero elements in the product does not exceed the sum over
+    the operators, i.e. the fused operator is never more expensive to apply.
+    """
+    def __init__(self, processors, label='ProcessorChain', fuse=None,
+                 dtype=None):
+        """
+        Parameters
+        ----------
+        processors : list or ProcessorChain
+            A list of signal processors
+        label : string
+            A name of the chain
+        fuse : bool
+            If True, the runs of linear processors are fused into single
+            operators. By default, the value of a given chain is used or False.
+        dtype : NumPy dtype
+            A precision of the signal in the chain (np.float32 or np.float64).
+            By default, the value of a given chain or the precision of
+            the input signal is used.
+        """
+        if isinstance(processors, ProcessorChain):
+            if fuse is None:
+                fuse = processors.fuse
+            if dtype is None:
+                dtype = processors.dtype
+            processors = processors.processors
+
+        self.fuse = bool(fuse)
+
+        if dtype is None:
+            self.dtype = None
+        else:
+            self.dtype = np.dtype(dtype)
+            if self.dtype not in (np.float32, np.float64):
+                raise ValueError('The precision of the chain must be ' +
+                                 'float32 or float64.')
+
+        self.label = label
+        self.processors = list(processors)
+        self.signal_classes = check_signal_classes(self.processors)
+        self.extensions = get_processor_extensions(self.processors)
+        self.required_variables = get_processor_variables(self.processors)
+
+        self.input_parameters = None
+        self.output_parameters = None
+
+        self._input_shape = None
+        self._process_functions = None
+        self._uses_buffer = None
+        self._buffers = None
+        self._stages = None
+        self._signal_dtype = self.dtype
+        self._input_buffer = None
+
+        self.profiler = None
+        self.timeline = None
+
+    def __len__(self):
+        return len(self.processors)
+
+    def __iter__(self):
+        return iter(self.processors)
+
+    def __getitem__(self, idx):
+        return self.processors[idx]
+
+    @property
+    def initialized(self):
+        return self._process_functions is not None
+
+    @property
+    def stages(self):
+        """ The processors (or fused operators) called on each turn."""
+        if self._stages is None:
+            return list(self.processors)
+        return list(self._stages)
+
+    @property
+    def time_scale(self):
+        time_scale = 0.
+        for processor in self.processors:
+            time_scale = max(time_scale, getattr(processor, 'time_scale', 0.))
+        return time_scale
+
+    def time_support(self, bin_spacings):
+        """ The causal and anti-causal time support of the chain (see the
+            function time_support)."""
+        return time_support(self.processors, bin_spacings)
+
+    def process(self, parameters, signal, *args, **kwargs):
+        """
+        Processes the signal through the chain
+
+        Parameters
+        ----------
+        parameters : dict
+            A standardized dict of the additional parameters describing the
+            signal
+        signal : NumPy array
+            The signal
+        **kwargs : -
+            Other arguments which will be passed to the signal processors
+
+        Returns
+        -------
+        dict
+            Possibly modified dict of the signal parameters
+        NumPy array
+            The processed signal
+        """
+        if (signal is not None) and (self._signal_dtype is not None) and \
+                (getattr(signal, 'dtype', None) != self._signal_dtype):
+            signal = self._convert_input(signal)
+
+        if self._process_functions is None:
+            return self._init_profiled(parameters, signal, *args, **kwargs)
+
+        if (signal is not None) and (not self._is_bound(parameters, signal)):
+            # the buffers and the fused operators are valid only for
+            # the signal used in the initialization
+            self._reset()
+            return self._init_profiled(parameters, signal, *args, **kwargs)
+
+        if (self.profiler is not None) or (self.timeline is not None):
+            return self._process_instrumented(parameters, signal,
+                                              *args, **kwargs)
+
+        for process_function in self._process_functions:
+            parameters, signal = process_function(parameters, signal,
+                                                  *args, **kwargs)
+
+        return parameters, signal
+
+    def _init_profiled(self, parameters, signal, *args, **kwargs):
+        # The calls initializing the chain are recorded separately, because
+        # they include the initializations of the processors
+        if (self.profiler is None) or (signal is None):
+            return self._init_chain(parameters, signal, *args, **kwargs)
+
+        t_start = default_timer()
+        output = self._init_chain(parameters, signal, *args, **kwargs)
+        self.profiler.add_init(self, default_timer() - t_start)
+        return output
+
+    def _is_bound(self, parameters, signal):
+        # Checks that the signal has the shape and the parameters, which were
+        # used for initializing the chain. The parameters are usually
+        # the same object on every turn, i.e. they are compared only if not.
+        if np.shape(signal) != self._input_shape:
+            return False
+        if parameters is not self.input_parameters:
+            if parameters != self.input_parameters:
+                return False
+            self.input_parameters = parameters
+        return True
+
+    def _reset(self):
+        self._input_shape = None
+        self._process_functions = None
+        self._uses_buffer = None
+        self._buffers = None
+        self._stages = None
+
+    def _convert_input(self, signal):
+        # The input signal is copied to a buffer in the precision of the chain
+        if (self._input_buffer is None) or \
+                (self._input_buffer.shape != np.shape(signal)):
+            self._input_buffer = np.empty(np.shape(signal),
+                                          dtype=self._signal_dtype)
+        np.copyto(self._input_buffer, signal, casting='unsafe')
+        return self._input_buffer
+
+    def _process_instrumented(self, parameters, signal, *args, **kwargs):
+        if self.profiler is not None:
+            entries = self.profiler.entries(self)
+        else:
+            entries = [None] * len(self._stages)
+        timeline = self.timeline
+
+        for process_function, uses_buffer, entry, processor in zip(
+                self._process_functions, self._uses_buffer, entries,
+                self._stages):
+            input_signal = signal
+            t_start = default_timer()
+            parameters, signal = process_function(parameters, signal,
+                                                  *args, **kwargs)
+            t_end = default_timer()
+
+            if timeline is not None:
+                timeline.add(getattr(processor, 'label', None), 'processor',
+                             t_start, t_end, thread=self.label)
+
+            if entry is not None:
+                entry[2] += t_end - t_start
+                entry[1] += 1
+
+                if signal is None:
+                    entry[4] = 0
+                else:
+                    entry[4] = signal.nbytes
+                    # a new array has been allocated, if the output signal is
+                    # not in the chain buffers or the input signal
+                    if (not uses_buffer) and (signal is not input_signal):
+                        entry[3] += signal.nbytes
+
+        return parameters, signal
+
+    def prepare(self, parameters, n_channels=None, *args, **kwargs):
+        """
+        Initializes the processors and the chain for the signal described
+        by the given parameters without processing a signal (see the function
+        prepare(...)). If some of the processors do not support the
+        preparation, the chain is initialized on the first call of
+        the method process(...).
+
+        Parameters
+        ----------
+        parameters : dict
+            A standardized dict of the additional parameters describing the
+            signal
+        n_channels : int
+            A number of channels in a multi-channel signal (None for a single
+            channel signal)
+        **kwargs : -
+            Other arguments which will be passed to the signal processors
+
+        Returns
+        -------
+        dict
+            The parameters of the output signal or None, if they are not known
+        """
+        if self._process_functions is not None:
+            return self.output_parameters
+
+        def signal_shape(parameters):
+            if n_channels is None:
+                return (len(parameters['bin_edges']),)
+            else:
+                return (n_channels, len(parameters['bin_edges']))
+
+        input_parameters = parameters
+        input_shapes = []
+        stage_parameters = []
+        output_shapes = []
+        output_parameters = []
+
+        for i, processor in enumerate(self.processors):
+            if (parameters is None) or (not hasattr(processor, 'prepare')):
+                return None
+            self._check_signal_class(i, processor, parameters)
+
+            input_shapes.append(signal_shape(parameters))
+            stage_parameters.append(parameters)
+            parameters = processor.prepare(parameters, *args, **kwargs)
+            output_parameters.append(parameters)
+            if parameters is not None:
+                output_shapes.append(signal_shape(parameters))
+
+        if parameters is None:
+            return None
+
+        self.input_parameters = input_parameters
+        self.output_parameters = parameters
+        self._input_shape = input_shapes[0]
+        if self._signal_dtype is None:
+            self._signal_dtype = np.dtype(np.float64)
+        self._init_stages(input_shapes, stage_parameters, output_shapes,
+                          output_parameters, *args, **kwargs)
+
+        return parameters
+
+    def _check_signal_class(self, i, processor, parameters):
+        signal_classes = getattr(processor, 'signal_classes', None)
+        if isinstance(signal_classes, tuple) and (parameters is not None):
+            if parameters['class'] < signal_classes[0]:
+                raise ValueError('Signal class ' + str(parameters['class']) +
+                                 ' is not compatible with the processor ' +
+                                 str(i) + ' (' +
+                                 str(getattr(processor, 'label', None)) +
+                                 ')')
+
+    def _init_chain(self, parameters, signal, *args, **kwargs):
+        # The first signal is passed through the processors one by one, which
+        # runs the lazy initializations of the processors in the order of
+        # the chain. The signal classes are checked against the actual
+        # parameters of the signal. If there is no signal yet (e.g. an empty
+        # register in the beginning of the chain), the chain is initialized
+        # on the next call.
+        if signal is None:
+            return process(parameters, signal, self.processors, **kwargs)
+
+        if self._signal_dtype is None:
+            self._signal_dtype = signal_dtype(signal)
+            signal = np.asarray(signal, dtype=self._signal_dtype)
+
+        self.input_parameters = parameters
+        self._input_shape = np.shape(signal)
+        input_shapes = []
+        input_parameters = []
+        output_shapes = []
+        output_parameters = []
+
+        for i, processor in enumerate(self.processors):
+            self._check_signal_class(i, processor, parameters)
+
+            input_shapes.append(np.shape(signal))
+            input_parameters.append(parameters)
+            parameters, signal = processor.process(parameters, signal,
+                                                   *args, **kwargs)
+            output_parameters.append(parameters)
+            if signal is not None:
+                output_shapes.append(np.shape(signal))
+            else:
+                output_shapes.append(None)
+
+        self.output_parameters = parameters
+        self._init_stages(input_shapes, input_parameters, output_shapes,
+                          output_parameters, *args, **kwargs)
+
+        return parameters, signal
+
+    def _init_stages(self, input_shapes, input_parameters, output_shapes,
+                     output_parameters, *args, **kwargs):
+        self._stages = list(self.processors)
+        if self.fuse and (None not in output_shapes):
+            self._stages, output_shapes = self._fuse_linear_runs(
+                    input_shapes, input_parameters, output_shapes,
+                    output_parameters, *args, **kwargs)
+
+        self._init_buffers(output_shapes, self._signal_dtype)
+
+    def _fuse_linear_runs(self, input_shapes, input_parameters, output_shapes,
+                          output_parameters, *args, **kwargs):
+        # Greedily collects adjacent linear processors into groups, which are
+        # replaced by fused operators
+        stages = []
+        stage_shapes = []
+        group = []
+        operator = None
+        n_nonzero = 0
+
+        def close_group():
+            if len(group) > 1:
+                last = group[-1]
+                stages.append(FusedOperator(
+                        [self.processors[i] for i in group], operator,
+                        input_parameters[group[0]], output_parameters[last]))
+                stage_shapes.append(output_shapes[last])
+            elif len(group) == 1:
+                stages.append(self.processors[group[0]])
+                stage_shapes.append(output_shapes[group[0]])
+
+        for i, processor in enumerate(self.processors):
+            # fixed-point processors round the codes, i.e. they are not linear
+            if (not _is_fusable(processor)) or \
+                    (input_parameters[i].get('scale') is not None):
+                close_group()
+                group = []
+                operator = None
+                stages.append(processor)
+                stage_shapes.append(output_shapes[i])
+                continue
+
+            processor_operator = linear_operator(processor,
+                                                 input_parameters[i],
+                                                 input_shapes[i][-1],
+                                                 *args, **kwargs)
+            if operator is not None:
+                product = (processor_operator * operator).tocsr()
+                product.eliminate_zeros()
+                if product.nnz <= n_nonzero + processor_operator.nnz:
+                    group.append(i)
+                    operator = product
+                    n_nonzero += processor_operator.nnz
+                    continue
+                close_group()
+
+            group = [i]
+            operator = processor_operator
+            n_nonzero = processor_operator.nnz
+
+        close_group()
+
+        return stages, stage_shapes
+
+    def _init_buffers(self, output_shapes, dtype):
+        # Two buffers are shared between the processors supporting the output
+        # buffer extension. The output of a processor is written to the buffer
+        # which does not contain the input signal. A processor without the
+        # extension might return its input signal, i.e. the buffer in use is
+        # not changed after it.
+        buffer_lengths = [int(np.prod(shape)) for processor, shape
+                          in zip(self._stages, output_shapes)
+                          if (shape is not None) and
+                          ('output_buffer' in processor.extensions)]
+
+        if len(buffer_lengths) > 0:
+            max_length = max(buffer_lengths)
+            self._buffers = [np.zeros(max_length, dtype=dtype),
+                             np.zeros(max_length, dtype=dtype)]
+
+        self._process_functions = []
+        self._uses_buffer = []
+        occupied = 1
+
+        for processor, shape in zip(self._stages, output_shapes):
+            if (shape is not None) and ('output_buffer' in processor.extensions):
+                occupied = 1 - occupied
+                out = self._buffers[occupied][:int(np.prod(shape))].reshape(shape)
+                self._process_functions.append(partial(processor.process,
+                                                       out=out))
+                self._uses_buffer.append(True)
+            else:
+                self._process_functions.append(processor.process)
+                self._uses_buffer.append(False)
+
+
+def _is_fusable(processor):
+    extensions = getattr(processor, 'extensions', [])
+    # traced processors are kept in the chain, because their captures would
+    # be lost in the fused operator
+    return ('linear' in extensions) and ('trace' not in extensions)
+
+
+def linear_operator(processor, parameters, n_input, *args, **kwargs):
+    """
+    Returns a sparse matrix (scipy.sparse.csr_matrix), which corresponds to
+    a processor supporting the linear extension for the given input
+    parameters. If the processor does not provide the operator by itself
+    (the method linear_operator()), the matrix is determined by processing
+    unit impulses as multi-channel signals.
+
+    Parameters
+    ----------
+    processor : object
+        An initialized signal processor supporting the linear extension
+    parameters : Parameters
+        The input parameters of the processor
+    n_input : int
+        A number of bins in the input signal
+    """
+    from scipy.sparse import csr_matrix, vstack
+
+    operator = None
+    if hasattr(processor, 'linear_operator'):
+        operator = processor.linear_operator()
+
+    if operator is None:
+        # a number of impulses processed at once is limited by the memory
+        chunk_size = max(1, min(n_input, 2**22 // max(n_input, 1)))
+        columns = []
+        for i_from in xrange(0, n_input, chunk_size):
+            i_to = min(i_from + chunk_size, n_input)
+            impulses = np.zeros((i_to - i_from, n_input))
+            impulses[np.arange(i_to - i_from), np.arange(i_from, i_to)] = 1.
+            responses = processor.process(parameters, impulses,
+                                          *args, **kwargs)[1]
+            # the rows of the responses are the columns of the operator
+            columns.append(csr_matrix(responses))
+        operator = vstack(columns).T
+
+    operator = csr_matrix(operator)
+    operator.eliminate_zeros()
+    return operator
+
+
+class FusedOperator(object):
+    """
+    A sparse operator replacing a run of linear signal processors in
+    a ProcessorChain. The operator is valid only for the signal it was fused
+    for, i.e. a signal with different parameters or a different length is
+    passed through the processors one by one.
+    """
+    def __init__(self, processors, operator, input_parameters,
+                 output_parameters):
+        """
+        Parameters
+        ----------
+        processors : list
+            The fused processors
+        operator : scipy.sparse.csr_matrix
+            A product of the operators of the processors
+        input_parameters : Parameters
+            The input parameters of the first processor
+        output_parameters : Parameters
+            The output parameters of the last processor
+        """
+        from processors.cython_hacks import cython_csr_product
+
+        self.processors = processors
+        self.operator = operator
+        self.input_parameters = input_parameters
+        self.output_parameters = output_parameters
+
+        self._indptr = operator.indptr.astype(np.intc)
+        self._indices = operator.indices.astype(np.intc)
+        # the values of the operator in the precisions of the signals
+        self._data = {np.dtype(np.float64): operator.data.astype(np.float64)}
+        self._n_output, self._n_input = operator.shape
+        self._csr_product = cython_csr_product
+
+        self.signal_classes = (0, 0)
+        self.extensions = ['output_buffer', 'linear']
+        self.label = 'Fused(' + ', '.join(str(getattr(processor, 'label', None))
+                                          for processor in processors) + ')'
+        self.time_scale = max(getattr(processor, 'time_scale', 0.)
+                              for processor in processors)
+
+    def linear_operator(self):
+        return self.operator
+
+    def time_support(self, bin_spacings):
+        return time_support(self.processors, bin_spacings)
+
+    def process(self, parameters, signal, out=None, *args, **kwargs):
+        if (np.shape(signal)[-1] != self._n_input) or \
+                ((parameters is not self.input_parameters) and
+                 (parameters != self.input_parameters)):
+            for processor in self.processors:
+                parameters, signal = processor.process(parameters, signal,
+                                                       *args, **kwargs)
+            return parameters, signal
+
+        dtype = signal_dtype(signal)
+        data = self._data.get(dtype, None)
+        if data is None:
+            data = self._data[np.dtype(np.float64)].astype(dtype)
+            self._data[dtype] = data
+
+        if out is None:
+            out = np.zeros(np.shape(signal)[:-1] + (self._n_output,),
+                           dtype=dtype)
+
+        if out.ndim == 1:
+            self._csr_product(self._indptr, self._indices, data,
+                              self._n_input,
+                              np.ascontiguousarray(signal, dtype=dtype),
+                              out)
+        else:
+            for input_channel, output_channel in zip(signal, out):
+                self._csr_product(self._indptr, self._indices, data,
+                                  self._n_input,
+                                  np.ascontiguousarray(input_channel,
+                                                       dtype=dtype),
+                                  output_channel)
+
+        return self.output_parameters, out
+
+
+class Profiler(object):
+    """
+    Collects the wall time, the number of calls, the number of allocated
+    bytes and the size of the output signal of each signal processor in
+    the chains, to which the profiler is attached (see ProcessorChain). The
+    values are aggregated over the turns. The calls initializing the chains
+    are not included in the values of the processors, but their number and
+    wall time are collected separately for each chain.
+    """
+
+    _columns = ('chain', 'idx', 'label', 'calls', 'time', 'time_per_call',
+                'allocated_bytes', 'output_bytes')
+    _init_columns = ('chain', 'inits', 'time')
+
+    def __init__(self):
+        self._chains = {}
+        self._labels = {}
+        self._entries = {}
+        self._order = []
+        self._inits = {}
+        self._init_order = []
+
+    def _register(self, chain):
+        # The chains are identified by their ids, because the labels of
+        # different chains can be equal (e.g. the default labels). The label
+        # is stored for the display.
+        if id(chain) not in self._labels:
+            self._labels[id(chain)] = chain.label
+
+    def entries(self, chain):
+        """
+        Returns a list of entries [label, n_calls, wall_time, allocated_bytes,
+        output_bytes] for the processors of the chain, which are updated in
+        place by the chain.
+        """
+        entries = self._chains.get(id(chain), None)
+        if entries is None:
+            self._register(chain)
+            entries = []
+            for i, processor in enumerate(chain.stages):
+                entry = [getattr(processor, 'label', None), 0, 0., 0, 0]
+                self._entries[(id(chain), i)] = entry
+                self._order.append((id(chain), i))
+                entries.append(entry)
+            self._chains[id(chain)] = entries
+        return entries
+
+    def add_init(self, chain, wall_time):
+        """ Records a call, which initialized the given chain."""
+        entry = self._inits.get(id(chain), None)
+        if entry is None:
+            self._register(chain)
+            entry = [0, 0.]
+            self._inits[id(chain)] = entry
+            self._init_order.append(id(chain))
+        entry[0] += 1
+        entry[1] += wall_time
+
+    def reset(self):
+        """ Removes the collected data."""
+        self._chains = {}
+        self._labels = {}
+        self._entries = {}
+        self._order = []
+        self._inits = {}
+        self._init_order = []
+
+    @property
+    def total_time(self):
+        return sum(entry[2] for entry in self._entries.itervalues())
+
+    @property
+    def total_init_time(self):
+        return sum(entry[1] for entry in self._inits.itervalues())
+
+    def stats(self):
+        """
+        Returns a list of dicts, one for each processor, in the order the
+        processors were called. The time is given in seconds and
+        allocated_bytes is the total over all calls.
+        """
+        stats = []
+        for key in self._order:
+            label, n_calls, wall_time, allocated_bytes, output_bytes = \
+                    self._entries[key]
+            if n_calls > 0:
+                time_per_call = wall_time/float(n_calls)
+            else:
+                time_per_call = 0.
+            stats.append(dict(zip(self._columns,
+                                  (self._labels[key[0]], key[1], label,
+                                   n_calls, wall_time, time_per_call,
+                                   allocated_bytes, output_bytes))))
+        return stats
+
+    def init_stats(self):
+        """
+        Returns a list of dicts, one for each chain, including the number of
+        the calls initializing the chain and their total time in seconds.
+        """
+        return [dict(zip(self._init_columns,
+                         [self._labels[key]] + self._inits[key]))
+                for key in self._init_order]
+
+    def summary(self):
+        """ Returns the collected data as a printable table."""
+        total_time = self.total_time
+        lines = ['%-12s %3s %-20s %7s %10s %6s %12s %12s %10s' %
+                 ('chain', 'idx', 'label', 'calls', 'time [s]', '[%]',
+                  'per call [s]', 'alloc [B]', 'out [B]')]
+        for row in self.stats():
+            if total_time > 0.:
+                share = 100. * row['time'] / total_time
+            else:
+                share = 0.
+            lines.append('%-12s %3d %-20s %7d %10.4g %6.1f %12.4g %12d %10d' %
+                         (row['chain'], row['idx'], row['label'],
+                          row['calls'], row['time'], share,
+                          row['time_per_call'], row['allocated_bytes'],
+                          row['output_bytes']))
+
+        init_stats = self.init_stats()
+        if init_stats:
+            lines.append('')
+            lines.append('%-12s %7s %10s' % ('chain', 'inits', 'time [s]'))
+            for row in init_stats:
+                lines.append('%-12s %7d %10.4g' %
+                             (row['chain'], row['inits'], row['time']))
+        return '\n'.join(lines)
+
+
+class _Span(object):
+    # A context manager, which records the time spent in the block
+    __slots__ = ('timeline', 'name', 'category', 'thread', 't_start')
+
+    def __init__(self, timeline, name, category, thread):
+        self.timeline = timeline
+        self.name = name
+        self.category = category
+        self.thread = thread
+
+    def __enter__(self):
+        self.t_start = default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timeline.add(self.name, self.category, self.t_start,
+                          default_timer(), thread=self.thread)
+        return False
+
+
+class Timeline(object):
+    """
+    Records time spans (e.g. calls of signal processors, MPI communication and
+    kicks in the feedback objects), which can be written to a file in
+    the Chrome trace event format. The file can be opened, for example, in
+    chrome://tracing or in the Perfetto UI. In MPI simulations, each rank
+    writes its own file and the rank is used as a process id, which allows
+    merging the files.
+    """
+
+    def __init__(self, pid=None, max_events=None):
+        """
+        Parameters
+        ----------
+        pid : int
+            A process id of the events. By default, the MPI rank is used if
+            mpi4py is available, otherwise 0.
+        max_events : int
+            The maximum number of recorded spans. When it is reached, new
+            spans are not recorded anymore.
+        """
+        if pid is None:
+            try:
+                from mpi4py import MPI
+                pid = MPI.COMM_WORLD.Get_rank()
+            except ImportError:
+                pid = 0
+
+        self.pid = pid
+        self.max_events = max_events
+        self.enabled = True
+        self.clear()
+
+    def clear(self):
+        """ Removes the recorded spans."""
+        self._events = []
+        self._threads = {}
+        self.n_dropped = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def add(self, name, category, t_start, t_end, thread='main', args=None):
+        """
+        Adds a span. The times are given in seconds (timeit.default_timer).
+        """
+        if not self.enabled:
+            return
+        if (self.max_events is not None) and \
+                (len(self._events) >= self.max_events):
+            self.n_dropped += 1
+            return
+
+        tid = self._threads.get(thread, None)
+        if tid is None:
+            tid = len(self._threads)
+            self._threads[thread] = tid
+
+        event = {'name': str(name), 'cat': category, 'ph': 'X',
+                 'ts': t_start*1e6, 'dur': (t_end - t_start)*1e6,
+                 'pid': self.pid, 'tid': tid}
+        if args is not None:
+            event['args'] = args
+        self._events.append(event)
+
+    def span(self, name, category='feedback', thread='main'):
+        """
+        Returns a context manager, which records the time spent in the
+        with block.
+        """
+        return _Span(self, name, category, thread)
+
+    def events(self):
+        """ Returns the recorded events in the Chrome trace event format."""
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid,
+                     'tid': 0, 'args': {'name': 'rank ' + str(self.pid)}}]
+        for thread, tid in sorted(self._threads.items(), key=lambda x: x[1]):
+            metadata.append({'name': 'thread_name', 'ph': 'M',
+                             'pid': self.pid, 'tid': tid,
+                             'args': {'name': str(thread)}})
+        return metadata + self._events
+
+    def write(self, filename):
+        """
+        Writes the recorded events to a JSON file. A string '{rank}' in
+        the file name is replaced with the process id.
+        """
+        filename = filename.replace('{rank}', str(self.pid))
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events(),
+                       'displayTimeUnit': 'ms'}, f)
+        return filename
+
+
+# the attributes of the trace and debug macros, which do not change the
+# initialization products of a processor
+_UNDIGESTED_ATTRIBUTES = ('_macros', 'trace', 'process', 'process_org', 'debug',
+                          'input_parameters', 'input_signal',
+                          'output_parameters', 'output_signal')
+
+
+class _UncacheableValue(Exception):
+    # a value of the configuration of a processor can not be digested
+    pass
+
+
+def _update_digest(digest, value):
+    # Updates the digest with a value describing the configuration of
+    # a processor. Functions are described by their code, default arguments
+    # and closures. Values of unknown types (e.g. other processors) raise
+    # _UncacheableValue, because the products of the processor can not be
+    # identified without them.
+    if isinstance(value, Parameters):
+        digest.update('P')
+        for key in ('signal_class', 'n_segments', 'n_bins_per_segment',
+                    'location', 'bin_edges', 'segment_ref_points', 'beta'):
+            _update_digest(digest, getattr(value, key))
+        _update_digest(digest, value.parent)
+    elif isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise _UncacheableValue(value)
+        value = np.ascontiguousarray(value)
+        digest.update('A' + value.dtype.str + repr(value.shape))
+        digest.update(value.tostring())
+    elif isinstance(value, (tuple, list)):
+        digest.update('L' + str(len(value)))
+        for item in value:
+            _update_digest(digest, item)
+    elif isinstance(value, dict):
+        digest.update('D' + str(len(value)))
+        for key in sorted(value.keys()):
+            _update_digest(digest, key)
+            _update_digest(digest, value[key])
+    elif isinstance(value, (type(None), bool, int, long, float, complex, str,
+                            unicode, np.number)):
+        digest.update('V' + repr(value))
+    elif isinstance(value, types.FunctionType):
+        digest.update('F' + str(value.__module__) + '.' + value.__name__)
+        _update_digest(digest, value.func_code)
+        _update_digest(digest, value.func_defaults)
+        if value.func_closure is not None:
+            _update_digest(digest, [cell.cell_contents
+                                    for cell in value.func_closure])
+    elif isinstance(value, types.CodeType):
+        digest.update('C' + value.co_code)
+        _update_digest(digest, value.co_consts)
+        _update_digest(digest, value.co_names)
+    else:
+        raise _UncacheableValue(value)
+
+
+def init_key(processor, parameters, extra=None):
+    """
+    Returns a key for the initialization products of a processor, which
+    depends on the class and the configuration of the processor (i.e.
+    the values of its attributes before the initialization), the input
+    parameters and the given extra data. If the configuration includes
+    values, which can not be digested (e.g. other objects), None is
+    returned, i.e. the products of the processor are not cached.
+    """
+    digest = hashlib.sha1()
+    digest.update(version)
+    digest.update(type(processor).__module__ + '.' + type(processor).__name__)
+    try:
+        for name, value in sorted(vars(processor).items()):
+            if name not in _UNDIGESTED_ATTRIBUTES:
+                digest.update(name)
+                _update_digest(digest, value)
+        _update_digest(digest, parameters)
+        _update_digest(digest, extra)
+    except _UncacheableValue:
+        return None
+    return digest.hexdigest()
+
+
+class InitCache(object):
+    """
+    A content addressed on-disk cache for the initialization products of
+    the signal processors (e.g. impulse responses, transfer matrices and
+    resampling matrices). An entry is a directory of .npy files, which are
+    memory mapped (copy-on-write) when loaded. If the total size of the
+    entries exceeds the given limit, the least recently used entries are
+    removed. The cache can be shared between simultaneous jobs.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        """
+        Parameters
+        ----------
+        directory : string
+            A path to the cache directory, which is created if it does not
+            exist
+        max_bytes : int
+            The maximum total size of the cache files. If None, the size is
+            not limited.
+        """
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_bytes = max_bytes
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def key(self, processor, parameters, extra=None):
+        """ Returns a key for the initialization products or None, if they
+        can not be cached (see init_key)."""
+        return init_key(processor, parameters, extra)
+
+    def load(self, key):
+        """ Returns a dict of the arrays stored with the key or None."""
+        entry = os.path.join(self.directory, key)
+        try:
+            names = [name for name in os.listdir(entry) if name.endswith('.npy')]
+            arrays = {}
+            for name in names:
+                arrays[name[:-4]] = np.load(os.path.join(entry, name),
+                                            mmap_mode='c')
+            # the modification time of the entry is used for the LRU eviction
+            os.utime(entry, None)
+        except (OSError, IOError, ValueError):
+            return None
+
+        if len(arrays) == 0:
+            return None
+        return arrays
+
+    def store(self, key, arrays):
+        """ Stores a dict of arrays with the key."""
+        entry = os.path.join(self.directory, key)
+        if os.path.isdir(entry):
+            return
+
+        # the files are written to a temporary directory, which is renamed
+        # atomically, i.e. the other jobs never see incomplete entries
+        tmp_entry = tempfile.mkdtemp(prefix='.' + key, dir=self.directory)
+        try:
+            for name, value in arrays.items():
+                np.save(os.path.join(tmp_entry, name + '.npy'),
+                        np.asarray(value))
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # another job has stored the same entry
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            return
+
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes):
+        """ Removes the least recently used entries until the total size of
+        the cache is below the given number of bytes.
+        """
+        entries = []
+        total_size = 0
+        for key in os.listdir(self.directory):
+            entry = os.path.join(self.directory, key)
+            if key.startswith('.') or (not os.path.isdir(entry)):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, name))
+                           for name in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+            except OSError:
+                continue
+            total_size += size
+
+        for mtime, size, entry in sorted(entries):
+            if total_size <= max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
+
+    def clear(self):
+        """ Removes all entries."""
+        self.evict(0)
+
+
+_init_cache = None
+
+
+def set_init_cache(cache, max_bytes=None):
+    """
+    Sets the cache used by the signal processors for the initialization
+    products. The cache can be an InitCache object, a path to a directory or
+    None (the cache is not used). By default, the cache is set from the
+    environment variables PYHEADTAIL_FEEDBACK_CACHE (a directory) and
+    PYHEADTAIL_FEEDBACK_CACHE_SIZE (the maximum size in bytes).
+    """
+    global _init_cache
+    if (cache is None) or isinstance(cache, InitCache):
+        _init_cache = cache
+    else:
+        _init_cache = InitCache(cache, max_bytes)
+    return _init_cache
+
+
+def get_init_cache():
+    global _init_cache
+    if (_init_cache is None) and ('PYHEADTAIL_FEEDBACK_CACHE' in os.environ):
+        max_bytes = os.environ.get('PYHEADTAIL_FEEDBACK_CACHE_SIZE', None)
+        if max_bytes is not None:
+            max_bytes = int(float(max_bytes))
+        _init_cache = InitCache(os.environ['PYHEADTAIL_FEEDBACK_CACHE'],
+                                max_bytes)
+    return _init_cache
+
+
+# The initialization products calculated in the worker processes of
+# prepare_parallel(...) are recorded and given to the main process
+_recorded_products = None
+_prepared_products = None
+
+
+def cached_init(processor, parameters, compute, extra=None):
+    """
+    Returns the initialization products of a processor as a dict of arrays.
+    The products are loaded from the cache (see set_init_cache), if they
+    exist. Otherwise, they are calculated by calling the given function
+    without arguments and stored to the cache. The function must be called
+    before the initialization modifies the attributes of the processor.
+    """
+    cache = get_init_cache()
+    if (cache is None) and (_recorded_products is None) and \
+            (_prepared_products is None):
+        return compute()
+
+    key = init_key(processor, parameters, extra)
+    if key is None:
+        return compute()
+    if (_prepared_products is not None) and (key in _prepared_products):
+        return _prepared_products[key]
+
+    arrays = None
+    if cache is not None:
+        arrays = cache.load(key)
+    if arrays is None:
+        arrays = compute()
+        if cache is not None:
+            cache.store(key, arrays)
+
+    if _recorded_products is not None:
+        _recorded_products[key] = dict((name, np.asarray(value))
+                                       for name, value in arrays.items())
+    return arrays
+
+
+_prepare_jobs = None
+
+
+def _prepare_job(job):
+    processors, parameters, kwargs = job
+    return prepare(parameters, processors, **kwargs)
+
+
+def _record_prepare_job(idx):
+    # Runs in a forked worker process. The processors are copies of
+    # the processors in the main process, i.e. only the recorded
+    # initialization products are returned.
+    global _recorded_products
+    _recorded_products = {}
+    _prepare_job(_prepare_jobs[idx])
+    return _recorded_products
+
+
+def prepare_parallel(jobs, n_workers=None, pool='thread'):
+    """
+    Prepares independent lists of signal processors in parallel (see
+    the function prepare(...)), e.g. the processors of the horizontal and
+    vertical planes. The processors of a list are prepared in the given order.
+
+    Parameters
+    ----------
+    jobs : list
+        A list of tuples (processors, parameters) or
+        (processors, parameters, kwargs), where kwargs is a dict of arguments
+        for the function prepare(...) (e.g. n_channels and slice_sets)
+    n_workers : int
+        A maximum number of simultaneous workers. By default, the number of
+        CPUs is used.
+    pool : string
+        'thread' (default)
+            The processors are prepared in threads, which is useful only
+            if the initializations release the GIL (e.g. NumPy operations)
+        'process'
+            The initialization products (see cached_init) are calculated in
+            forked worker processes and the processors are initialized in
+            the main process by using them. This requires os.fork and must
+            not be used in MPI processes.
+        None
+            The processors are prepared sequentially
+
+    Returns
+    -------
+    list
+        The output parameters of the jobs (None, if not known)
+    """
+    global _prepare_jobs, _prepared_products
+
+    jobs = [tuple(job) + ({},) if len(job) == 2 else tuple(job)
+            for job in jobs]
+
+    if n_workers is None:
+        import multiprocessing
+        n_workers = multiprocessing.cpu_count()
+    n_workers = min(n_workers, len(jobs))
+
+    if (pool == 'process') and (not hasattr(os, 'fork')):
+        pool = 'thread'
+
+    if (pool is None) or (n_workers < 2):
+        return [_prepare_job(job) for job in jobs]
+    elif pool == 'thread':
+        from multiprocessing.pool import ThreadPool
+        workers = ThreadPool(n_workers)
+        try:
+            return workers.map(_prepare_job, jobs)
+        finally:
+            workers.close()
+            workers.join()
+    elif pool == 'process':
+        import multiprocessing
+        _prepare_jobs = jobs
+        workers = multiprocessing.Pool(n_workers)
+        try:
+            recorded = workers.map(_record_prepare_job, range(len(jobs)))
+        finally:
+            workers.close()
+            workers.join()
+            _prepare_jobs = None
+
+        _prepared_products = {}
+        for products in recorded:
+            _prepared_products.update(products)
+        try:
+            return [_prepare_job(job) for job in jobs]
+        finally:
+            _prepared_products = None
+    else:
+        raise ValueError('Unknown pool type ' + str(pool))
+
+
 def bin_widths(bin_edges):
     return (bin_edges[:, 1]-bin_edges[:, 0])
 
@@ -309,6 +2032,173 @@ def bin_mids(bin_edges):
     return (bin_edges[:, 0]+bin_edges[:, 1])/2.
 
 
+class UniformBinSet(object):
+    """
+    A compact description of a uniform bin set. The bins in each segment have
+    equal widths and follow each other without gaps, and the segments are
+    copies of the first segment shifted by the segment offsets. The bin edges
+    are calculated only when they are requested.
+    """
+
+    __slots__ = ('start', 'width', 'n_bins_per_segment', 'segment_offsets',
+                 '_edges')
+
+    def __init__(self, start, width, n_bins_per_segment,
+                 segment_offsets=(0.,)):
+        """
+        Parameters
+        ----------
+        start : float
+            The left edge of the first bin in the first segment
+        width : float
+            The width of the bins
+        n_bins_per_segment : int
+            A number of bins in each segment
+        segment_offsets : NumPy array
+            The offsets of the segments from the first segment
+        """
+        self.start = float(start)
+        self.width = float(width)
+        self.n_bins_per_segment = int(n_bins_per_segment)
+        self.segment_offsets = _frozen_array(segment_offsets)
+        self._edges = None
+
+    @property
+    def n_segments(self):
+        return len(self.segment_offsets)
+
+    def __len__(self):
+        return self.n_segments * self.n_bins_per_segment
+
+    @property
+    def key(self):
+        return (self.start, self.width, self.n_bins_per_segment,
+                self.segment_offsets.tostring())
+
+    @property
+    def segment_starts(self):
+        return self.start + self.segment_offsets
+
+    @property
+    def edges(self):
+        if self._edges is None:
+            z_bins = self.start + self.width * np.arange(self.n_bins_per_segment + 1)
+            segment_edges = z_bins_to_bin_edges(z_bins)
+            edges = segment_edges[np.newaxis, :, :] + \
+                self.segment_offsets[:, np.newaxis, np.newaxis]
+            self._edges = _frozen_array(edges.reshape(-1, 2))
+        return self._edges
+
+    @property
+    def mids(self):
+        segment_mids = self.width * (np.arange(self.n_bins_per_segment) + 0.5)
+        return (self.segment_starts[:, np.newaxis] +
+                segment_mids[np.newaxis, :]).reshape(-1)
+
+    @property
+    def is_sorted(self):
+        """
+        True if the segments are in order and they do not overlap
+        """
+        segment_length = self.n_bins_per_segment * self.width
+        tolerance = 1e-9 * self.width
+        return bool(np.all(np.diff(self.segment_starts) >= segment_length - tolerance))
+
+    @property
+    def is_contiguous(self):
+        """
+        True if all the bins are on a single grid without gaps
+        """
+        segment_length = self.n_bins_per_segment * self.width
+        tolerance = 1e-9 * self.width
+        return bool(np.all(np.abs(np.diff(self.segment_starts) - segment_length)
+                           <= tolerance))
+
+    def overlapping_bins(self, left, right):
+        """
+        Calculates closed form index ranges for the bins, which might overlap
+        with the given intervals. The ranges include one extra bin on both
+        sides, i.e. the exact overlap must be checked from the bin edges.
+
+        Parameters
+        ----------
+        left : NumPy array
+            Left edges of the intervals
+        right : NumPy array
+            Right edges of the intervals
+
+        Returns
+        -------
+        NumPy array
+            The first indexes of the ranges
+        NumPy array
+            The last indexes + 1 of the ranges
+        """
+        if not self.is_sorted:
+            raise ValueError('Index ranges can be calculated only for sorted bin sets')
+
+        n_bins = self.n_bins_per_segment
+        starts = self.segment_starts
+
+        segment_from = np.clip(np.searchsorted(starts, left, side='right') - 1,
+                               0, self.n_segments - 1)
+        local_from = np.floor((left - starts[segment_from]) / self.width)
+        local_from = np.clip(local_from, 0, n_bins).astype(int)
+        idx_from = np.clip(segment_from * n_bins + local_from - 1, 0, len(self))
+
+        segment_to = np.clip(np.searchsorted(starts, right, side='right') - 1,
+                             0, self.n_segments - 1)
+        local_to = np.ceil((right - starts[segment_to]) / self.width)
+        local_to = np.clip(local_to, 0, n_bins).astype(int)
+        idx_to = np.clip(segment_to * n_bins + local_to + 1, 0, len(self))
+
+        return idx_from, np.maximum(idx_to, idx_from)
+
+
+def uniform_bin_set(bin_edges, n_segments, n_bins_per_segment, rtol=1e-9):
+    """
+    Checks if the given bin edges form a uniform bin set.
+
+    Parameters
+    ----------
+    bin_edges : NumPy array
+        A 2D numpy array of the bin edges
+    n_segments : int
+        A number of segments
+    n_bins_per_segment : int
+        A number of bins per segment
+    rtol : float
+        A tolerance for the bin positions relative to the bin width
+
+    Returns
+    -------
+    UniformBinSet
+        A uniform description of the bin set or None if the bin set is not
+        uniform
+    """
+    if (n_segments < 1) or (n_bins_per_segment < 1) or \
+            (len(bin_edges) != n_segments * n_bins_per_segment):
+        return None
+
+    segment_edges = bin_edges.reshape(n_segments, n_bins_per_segment, 2)
+    starts = segment_edges[:, 0, 0]
+    width = (segment_edges[0, -1, 1] - starts[0]) / float(n_bins_per_segment)
+
+    if not (width > 0.):
+        return None
+
+    tolerance = rtol * width + 8. * np.finfo(float).eps * np.max(np.abs(bin_edges))
+
+    expected_from = starts[:, np.newaxis] + \
+        width * np.arange(n_bins_per_segment)[np.newaxis, :]
+
+    if np.any(np.abs(segment_edges[:, :, 0] - expected_from) > tolerance) or \
+            np.any(np.abs(segment_edges[:, :, 1] - (expected_from + width)) > tolerance):
+        return None
+
+    return UniformBinSet(starts[0], width, n_bins_per_segment, starts - starts[0])
+
+
 def bin_edges_to_z_bins(bin_edges):
     return np.append(bin_edges[:, 0], bin_edges[-1, 1])
 
@@ -388,6 +2278,62 @@ def get_processor_variables(processors, required_variables=None):
     return required_variables
 
 
+def time_support(processors, bin_spacings):
+    """
+    A function which determines how far in time the output signal of
+    the processors depends on the input signal. The supports of the processors
+    are summed over the chain, which gives the time window of the input
+    signal affecting each output bin.
+
+    A processor reports its support by the method
+    time_support(bin_spacings), which returns a tuple (causal, anticausal,
+    bin_spacing). The output value at time t depends on the input values
+    between t-causal and t+anticausal, and bin_spacing is the bin spacing of
+    the output signal. Processors without the method are assumed to have
+    a symmetric support given by their time_scale.
+
+    Parameters
+    ----------
+    processors : list
+        A list of signal processors.
+    bin_spacings : float or list
+        The bin spacing of the input signal [s]. A list includes also the
+        spacings of the previous bin sets (see Parameters.previous_parameters),
+        the last value being the spacing of the input signal.
+
+    Returns
+    -------
+    tuple
+        The causal and anti-causal supports [s] and the bin spacing of the
+        output signal
+    """
+
+    if isinstance(bin_spacings, (list, tuple)):
+        bin_spacings = list(bin_spacings)
+    else:
+        bin_spacings = [bin_spacings]
+
+    causal = 0.
+    anticausal = 0.
+
+    for processor in processors:
+        if hasattr(processor, 'time_support'):
+            processor_causal, processor_anticausal, bin_spacing = processor.time_support(bin_spacings)
+        else:
+            processor_causal = getattr(processor, 'time_scale', 0.)
+            processor_anticausal = processor_causal
+            bin_spacing = bin_spacings[-1]
+
+        causal += processor_causal
+        anticausal += processor_anticausal
+
+        # a resampled bin set
+        if bin_spacing != bin_spacings[-1]:
+            bin_spacings.append(bin_spacing)
+
+    return causal, anticausal, bin_spacings[-1]
+
+
 """
 ### MACROS
 ========
@@ -395,7 +2341,7 @@ def get_processor_variables(processors, required_variables=None):
 def default_macros(obj, label=None, **kwargs):
     func_list = []
 
-    func_list = func_list + debug_macro(obj, label=label, **kwargs)
+    func_list = func_list + trace_macro(obj, label=label, **kwargs)
     func_list = func_list + label_macro(obj, label=label, **kwargs)
     func_list = func_list + init_vatiables_macro(obj, **kwargs)
 
@@ -412,59 +2358,272 @@ def init_vatiables_macro(obj, **kwargs):
     return []
 
 
-def debug_macro(obj, **kwargs):
+class TraceRecord(object):
     """
-    A debug macro.
-    
-    If input parameter debug = True is given to the signal
-    processor, the input and output parameters and signals are stored
-    to the signal processor.
+    A captured call of a signal processor. The signals are views to the ring
+    buffers of the trace, i.e. they are valid until the record is
+    overwritten.
+    """
+
+    __slots__ = ('turn', 'window', 'input_parameters', 'input_signal',
+                 'output_parameters', 'output_signal')
+
+    def __init__(self, turn, window, input_parameters, input_signal,
+                 output_parameters, output_signal):
+        self.turn = turn
+        self.window = window
+        self.input_parameters = input_parameters
+        self.input_signal = input_signal
+        self.output_parameters = output_parameters
+        self.output_signal = output_signal
+
+    def bin_edges(self, source='input'):
+        """ Returns the bin edges corresponding to the captured signal."""
+        if source == 'input':
+            parameters = self.input_parameters
+        elif source == 'output':
+            parameters = self.output_parameters
+        else:
+            raise ValueError('Unknown value for the data source')
+
+        if parameters is None:
+            return None
+        return parameters['bin_edges'][self.window]
+
+
+class Trace(object):
+    """
+    Captures input and output signals of a signal processor into ring buffers,
+    which are allocated once. Only the latest captures are kept in the
+    memory, which allows tracing signals also in long simulations.
+    """
+
+    def __init__(self, depth=1, every=1, window=None, trigger=None,
+                 enabled=True):
+        """
+        Parameters
+        ----------
+        depth : int
+            A number of the latest captures kept in the buffers
+        every : int
+            Every Nth call of the processor (i.e. every Nth turn) is captured
+        window : tuple
+            A bin index range (from, to), which is captured from the input
+            and the output signals. By default, all bins are captured.
+        trigger : float or function
+            If a float is given, a call is captured only when the maximum
+            absolute value of the output signal exceeds the given value. A
+            function f(parameters, signal), which returns a boolean, can be
+            given for a custom condition.
+        enabled : bool
+            Signals are captured only if enabled is True
+        """
+        if depth < 1:
+            raise ValueError('The trace depth must be at least one.')
+        if every < 1:
+            raise ValueError('The capture interval must be at least one.')
+
+        self.depth = int(depth)
+        self.every = int(every)
+        if window is None:
+            self.window = slice(None)
+        else:
+            self.window = slice(window[0], window[1])
+        if (trigger is None) or callable(trigger):
+            self.trigger = trigger
+        else:
+            threshold = float(trigger)
+            self.trigger = lambda parameters, signal: \
+                    np.max(np.abs(signal)) > threshold
+        self.enabled = enabled
+
+        self.clear()
+
+    def clear(self):
+        """ Removes all captured signals and resets the call counter."""
+        self.n_calls = 0
+        self.n_captured = 0
+        self._turns = np.zeros(self.depth, dtype=int)
+        self._input_signals = None
+        self._output_signals = None
+        self._has_output = np.zeros(self.depth, dtype=bool)
+        self._input_parameters = [None]*self.depth
+        self._output_parameters = [None]*self.depth
+
+    def __len__(self):
+        return min(self.n_captured, self.depth)
+
+    def __getitem__(self, idx):
+        """ Returns a record, where the index 0 is the oldest capture."""
+        n_records = len(self)
+        if idx < 0:
+            idx += n_records
+        if (idx < 0) or (idx >= n_records):
+            raise IndexError('Trace index out of range')
+
+        slot = (self.n_captured - n_records + idx) % self.depth
+        if self._has_output[slot]:
+            output_signal = self._output_signals[slot]
+        else:
+            output_signal = None
+
+        return TraceRecord(self._turns[slot], self.window,
+                           self._input_parameters[slot],
+                           self._input_signals[slot],
+                           self._output_parameters[slot], output_signal)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def _allocate(self, signals, signal):
+        # Returns ring buffers matching to the windowed signal, if the
+        # existing buffers do not match
+        shape = (self.depth,) + np.shape(signal[..., self.window])
+        if (signals is None) or (signals.shape != shape) or \
+                (signals.dtype != signal.dtype):
+            return np.zeros(shape, dtype=signal.dtype)
+        else:
+            return None
+
+    def is_capturing(self):
+        """ Returns True, if the next call of the processor will be captured
+        (before the trigger condition is checked).
+        """
+        return self.enabled and (self.n_calls % self.every == 0)
+
+    def stage_input(self, parameters, signal):
+        # The input signal is copied to the next free slot, because the
+        # processor might modify the signal in place. The slot is committed in
+        # commit(...) only if the trigger condition is fulfilled.
+        new_signals = self._allocate(self._input_signals, signal)
+        if new_signals is not None:
+            # the old captures are lost when the signal shape changes
+            self._input_signals = new_signals
+            self.n_captured = 0
+
+        slot = self.n_captured % self.depth
+        np.copyto(self._input_signals[slot], signal[..., self.window])
+        return slot
+
+    def commit(self, slot, input_parameters, output_parameters, output_signal):
+        if (self.trigger is not None) and ((output_signal is None) or
+                (not self.trigger(output_parameters, output_signal))):
+            return False
+
+        if output_signal is not None:
+            new_signals = self._allocate(self._output_signals, output_signal)
+            if new_signals is not None:
+                if (self._output_signals is not None) and (slot != 0):
+                    # the old captures are lost when the signal shape changes
+                    np.copyto(self._input_signals[0],
+                              self._input_signals[slot])
+                    self._has_output[:] = False
+                    slot = 0
+                    self.n_captured = 0
+                self._output_signals = new_signals
+            np.copyto(self._output_signals[slot],
+                      output_signal[..., self.window])
+            self._has_output[slot] = True
+        else:
+            self._has_output[slot] = False
+
+        # the parameters are immutable, i.e. references can be stored
+        self._input_parameters[slot] = input_parameters
+        self._output_parameters[slot] = output_parameters
+        self._turns[slot] = self.n_calls
+        self.n_captured += 1
+        return True
+
+
+def trace_macro(obj, **kwargs):
+    """
+    A trace macro.
+
+    If input parameter trace is given to the signal processor, the input and
+    output signals are captured into bounded ring buffers (see the class
+    Trace). The value can be a Trace object or True (the latest call is
+    captured). If an input parameter debug is given, every call is also
+    captured while the attribute debug of the processor is True (i.e. the
+    debug mode can be turned on and off between the calls), and copies of the
+    latest captured signals and parameters are available from the attributes
+    input_parameters, input_signal, output_parameters and output_signal of
+    the signal processor.
+
+    The method process(...) of the processor is wrapped only when tracing is
+    requested, i.e. there are no costs when it is not used.
 
     Parameters
     ----------
     target_object : object
         A object which is operated (virtually always self)
-    label : string
-        A name of the signal processor
 
     Returns
     -------
-    object
-        A macro function, which is run in the process(...) method in the debug
-        mode is turn on.
+    list
+        Macro functions, which are run in the process(...) method after a
+        signal is captured.
     """
     def decorated_process(self, parameters, signal, *args, **kwargs):
-        input_parameters = parameters
-        input_signal = np.copy(signal)
+        trace = self.trace
+
+        # the debug mode is checked on every call
+        if (signal is None) or not (trace.is_capturing() or
+                                    getattr(self, 'debug', False)):
+            trace.n_calls += 1
+            return self.process_org(parameters, signal, *args, **kwargs)
 
+        slot = trace.stage_input(parameters, signal)
         output_parameters, output_signal = self.process_org(parameters, signal,
-                                                       *args, **kwargs)
+                                                            *args, **kwargs)
+        captured = trace.commit(slot, parameters, output_parameters,
+                                output_signal)
+        trace.n_calls += 1
 
-        for macro in self._macros:
-            macro(self, input_parameters, input_signal, output_parameters,
-                  output_signal, *args, **kwargs)
+        if captured:
+            for macro in self._macros:
+                macro(self, trace[-1], *args, **kwargs)
 
         return output_parameters, output_signal
 
-    def store_data(target_object, input_parameters, input_signal,
-                   output_parameters, output_signal, *args, **kwargs):
+    def store_data(target_object, record, *args, **kwargs):
+        # the signals of the record are views to the ring buffers of the
+        # trace, which are overwritten by the later captures
         if target_object.debug:
-            target_object.input_parameters = copy.copy(input_parameters)
-            target_object.input_signal = np.copy(input_signal)
-            target_object.output_parameters = copy.copy(output_parameters)
-            target_object.output_signal = np.copy(output_signal)
-
-    if 'debug' in kwargs:
+            target_object.input_parameters = record.input_parameters
+            target_object.input_signal = np.copy(record.input_signal)
+            target_object.output_parameters = record.output_parameters
+            if record.output_signal is None:
+                target_object.output_signal = None
+            else:
+                target_object.output_signal = np.copy(record.output_signal)
+
+    trace = kwargs.get('trace', None)
+    debug = kwargs.get('debug', None)
+
+    if (trace is None) or (trace is False):
+        if debug is None:
+            return []
+        # the calls are captured while the attribute debug is True. Tracing
+        # can also be turned on by setting trace.enabled = True
+        trace = Trace(enabled=False)
+    elif trace is True:
+        trace = Trace()
+
+    obj.extensions.append('trace')
+    setattr(obj, 'trace', trace)
+
+    obj.process_org = obj.process
+    obj.process = types.MethodType(decorated_process, obj)
+
+    if debug is not None:
         obj.extensions.append('debug')
 
-        setattr(obj, 'debug', kwargs['debug'])
+        setattr(obj, 'debug', debug)
         setattr(obj, 'input_parameters', None)
         setattr(obj, 'input_signal', None)
         setattr(obj, 'output_parameters', None)
         setattr(obj, 'output_signal', None)
 
-        obj.process_org = obj.process
-        obj.process = types.MethodType(decorated_process, obj)
-
         return [store_data]
     return []
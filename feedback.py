@@ -1,8 +1,10 @@
 import numpy as np
 import collections
-from PyHEADTAIL.mpi import mpi_data
-from core import get_processor_variables, process, Parameters
+from core import get_processor_variables, process, Parameters, ProcessorChain
+from core import Profiler, prepare_parallel, time_support
 from core import z_bins_to_bin_edges, append_bin_edges
+from processors.cython_hacks import cython_kick, cython_uniform_kick
+from processors.cython_hacks import cython_slice_moments, cython_indexed_kick
 from processors.register import VectorSumCombiner, CosineSumCombiner
 from processors.register import HilbertCombiner, DummyCombiner
 from scipy.constants import c
@@ -18,6 +20,424 @@ from inspect import isclass
 """
 
 
+class _NullSpan(object):
+    # A context manager used in the place of a timeline span, when no timeline
+    # is given
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NO_SPAN = _NullSpan()
+
+
+# The mean values of the coordinates, which are calculated in the single pass
+# slice moment kernel, and the corresponding coordinates of the bunch
+_fused_moments = {'mean_x': 'x', 'mean_xp': 'xp', 'mean_y': 'y',
+                  'mean_yp': 'yp', 'mean_z': 'z', 'mean_dp': 'dp'}
+
+
+def _bunch_indexes(superbunch):
+    # Groups the particles of a superbunch into the bunches by using a single
+    # np.bincount(...) over the bucket ids. Returns the bucket ids of the
+    # bunches, the bucket id of each particle, the index of the bunch for
+    # each particle and the number of particles in each bunch. The bunches
+    # are in the order of the longitudinal coordinates, i.e. in the same
+    # order as the slices of a slice set.
+    particle_bucket = np.asarray(superbunch.bucket_id).astype(np.intp)
+    n_particles_per_bucket = np.bincount(particle_bucket)
+    bucket_id = np.flatnonzero(n_particles_per_bucket)[::-1]
+    bunch_of_bucket = np.zeros(len(n_particles_per_bucket), dtype=np.intp)
+    bunch_of_bucket[bucket_id] = np.arange(len(bucket_id))
+    return (bucket_id, particle_bucket, bunch_of_bucket.take(particle_bucket),
+            n_particles_per_bucket.take(bucket_id))
+
+
+def _bucket_parameters(slicer, superbunch):
+    # Returns the circumference and h_bunch from the slicer or the superbunch
+    circumference = getattr(slicer, 'circumference', None)
+    h_bunch = getattr(slicer, 'h_bunch', None)
+    if (circumference is None) or (h_bunch is None):
+        circumference = getattr(superbunch, 'circumference', None)
+        h_bunch = getattr(superbunch, 'h_bunch', None)
+    if (circumference is None) or (h_bunch is None):
+        raise ValueError('The circumference and h_bunch must be given ' +
+                         'to the slicer for multiple bunches')
+    return circumference, h_bunch
+
+
+def _bunch_cuts(slicer, z, particle_bunch, n_particles, extent=True):
+    # Returns the longitudinal cuts of the bunches, shape (n_bunches, 2), in
+    # the same way as in the slicer, i.e. the given cuts, n_sigma_z or the
+    # extent of the bunch. The coordinates z are in the buckets. If the
+    # slicer has no cuts and extent is False, None is returned, i.e. all the
+    # particles are within the cuts.
+    z_cuts = getattr(slicer, 'z_cuts', None)
+    n_sigma_z = getattr(slicer, 'n_sigma_z', None)
+    cuts = np.empty((len(n_particles), 2))
+
+    if z_cuts is not None:
+        cuts[:, 0] = z_cuts[0]
+        cuts[:, 1] = z_cuts[1]
+    elif n_sigma_z:
+        # the standard deviation is the sample standard deviation as in
+        # PyHEADTAIL (zero for a single particle)
+        mean_z = np.bincount(particle_bunch, weights=z) / n_particles
+        dz = z - mean_z.take(particle_bunch)
+        sigma_z = np.sqrt(np.bincount(particle_bunch, weights=dz*dz) /
+                          np.maximum(n_particles - 1, 1))
+        cuts[:, 0] = mean_z - n_sigma_z * sigma_z
+        cuts[:, 1] = mean_z + n_sigma_z * sigma_z
+    elif extent:
+        cuts[:, 0] = np.inf
+        cuts[:, 1] = -np.inf
+        np.minimum.at(cuts[:, 0], particle_bunch, z)
+        np.maximum.at(cuts[:, 1], particle_bunch, z)
+        cuts[:, 1] += np.abs(cuts[:, 1]) * 1e-15
+    else:
+        return None
+
+    return cuts
+
+
+class _BunchSlices(object):
+    # A slice set emulation for the bunch-by-bunch mode, in which each bunch
+    # is a single slice. All the bunches are the slices of a single set, i.e.
+    # no objects are created for individual bunches. The mean values of the
+    # bunches are added as attributes (e.g. mean_xp).
+    def __init__(self, bucket_id, z_cuts, slice_index_of_particle,
+                 n_macroparticles_per_slice, circumference, h_bunch):
+        self.mode = 'bunch_by_bunch'
+        # the bucket ids of the bunches
+        self.bucket_id = bucket_id
+        # the longitudinal cuts of the bunches, shape (n_bunches, 2), in the
+        # coordinates of the buckets
+        self.z_cuts = z_cuts
+        # the index of the bunch for each particle, -1 for the particles
+        # outside the cuts
+        self.slice_index_of_particle = slice_index_of_particle
+        self.n_macroparticles_per_slice = n_macroparticles_per_slice
+        self.circumference = circumference
+        self.h_bunch = h_bunch
+        self._particles_within_cuts = None
+
+    @property
+    def n_slices(self):
+        return len(self.bucket_id)
+
+    @property
+    def particles_within_cuts(self):
+        if self._particles_within_cuts is None:
+            self._particles_within_cuts = np.flatnonzero(
+                    self.slice_index_of_particle >= 0)
+        return self._particles_within_cuts
+
+
+def _window_bunches(edges, windows):
+    # Returns a boolean mask of the bunches, whose extents (edges, shape
+    # (n_bunches, 2)) overlap with any of the windows (shape (n_windows, 2)).
+    # The overlapping bunches of each window are found by a binary search
+    # over the bunches sorted by the extents, and the index ranges are
+    # combined by using a difference array.
+    mask = np.zeros(len(edges), dtype=bool)
+    if (len(edges) == 0) or (len(windows) == 0):
+        return mask
+
+    order = np.argsort(edges[:, 0], kind='mergesort')
+    starts = edges[order, 0]
+    # the cumulative maximum keeps the ends sorted, if the bunches overlap
+    ends = np.maximum.accumulate(edges[order, 1])
+
+    i_from = np.searchsorted(ends, windows[:, 0], side='right')
+    i_to = np.searchsorted(starts, windows[:, 1], side='left')
+    valid = i_to > i_from
+
+    counts = np.zeros(len(edges) + 1, dtype=int)
+    np.add.at(counts, i_from[valid], 1)
+    np.add.at(counts, i_to[valid], -1)
+    mask[order] = np.cumsum(counts[:-1]) > 0
+    return mask
+
+
+class _GatheredSlices(object):
+    # A slice set emulation for the gathered slice statistics of a bunch. The
+    # statistics are views to a row of the exchange buffers, i.e. they are
+    # updated in place, when the statistics are gathered. The bins (z_bins)
+    # are exchanged only once.
+    def __init__(self, bucket_id, z_bins, row, fields, circumference, h_bunch):
+        self.bucket_id = bucket_id
+        self.z_bins = z_bins
+        self.circumference = circumference
+        self.h_bunch = h_bunch
+        for var, idx in fields:
+            setattr(self, var, row[idx])
+
+    @property
+    def n_slices(self):
+        return len(self.z_bins) - 1
+
+
+def _split_local_processors(processors):
+    # Splits a processor chain into the leading processors supporting the
+    # segment extension (see core.py), which can be run in the ranks owning
+    # the bunches, and the rest of the chain
+    n_local = 0
+    for processor in processors:
+        if 'segment' not in (processor.extensions or []):
+            break
+        n_local += 1
+
+    local_processors = ProcessorChain(processors.processors[:n_local],
+                                      label=processors.label + ' (local)',
+                                      fuse=processors.fuse,
+                                      dtype=processors.dtype)
+    processors = ProcessorChain(processors.processors[n_local:],
+                                label=processors.label, fuse=processors.fuse,
+                                dtype=processors.dtype)
+    return local_processors, processors
+
+
+def _segment_parameters(parameters, idx):
+    # The parameters of the segment idx of a signal. The previous parameters
+    # are divided into the segments in the same way.
+    parent = None
+    if parameters.parent is not None:
+        parent = _segment_parameters(parameters.parent, idx)
+
+    n_bins = parameters.n_bins_per_segment
+    return parameters.replace(
+            bin_edges=parameters.bin_edges[idx*n_bins:(idx+1)*n_bins],
+            n_segments=1,
+            segment_ref_points=parameters.segment_ref_points[idx:idx+1],
+            previous_parameters=parent)
+
+
+def _join_parameters(segment_parameters):
+    # The parameters of a signal consisting of the given segments in the bin
+    # order of the signal (see the function _segment_parameters)
+    parent = None
+    if segment_parameters[0].parent is not None:
+        parent = _join_parameters([parameters.parent for parameters
+                                   in segment_parameters])
+
+    return segment_parameters[0].replace(
+            bin_edges=np.concatenate([parameters.bin_edges for parameters
+                                      in segment_parameters]),
+            n_segments=sum(parameters.n_segments for parameters
+                           in segment_parameters),
+            segment_ref_points=np.concatenate(
+                    [parameters.segment_ref_points for parameters
+                     in segment_parameters]),
+            previous_parameters=parent)
+
+
+# An MPI tag for the exchanged slice statistics
+_GATHER_TAG = 2741
+
+
+def _local_bucket_id(bunch, slice_set):
+    # The bucket id of a local bunch
+    if hasattr(slice_set, 'bucket_id'):
+        return slice_set.bucket_id
+    return np.asarray(bunch.bucket_id)[0]
+
+
+class _WindowedGatherer(object):
+    # Gathers the slice statistics and the locally processed signal segments
+    # of the bunches in different MPI ranks. Each rank receives only the
+    # bunches within the influence windows of its local bunches. The exchange
+    # lists are built once from the extents of the bunches and the windows of
+    # all the ranks, and the data are exchanged by using point-to-point
+    # messages between the ranks. The lists are built again, when the key
+    # of the bunches changes in any of the ranks.
+    def __init__(self, variables):
+        self._variables = list(variables)
+
+        self._comm = None
+        self._waitall = None
+        self._key = None
+        self._fields = None
+        self._segment_fields = None
+        self._local_rows = None
+        # lists of (rank, buffer) and (rank, local bunch indexes, buffer)
+        self._receive = []
+        self._send = []
+        # the ranks and the indexes in the received data of the gathered
+        # slice sets
+        self._sources = None
+
+        # the gathered slice sets in the order of the descending bucket ids
+        # and the indexes of the local bunches in the list
+        self.slice_sets = None
+        self.local_indexes = None
+
+    @property
+    def initialized(self):
+        return self.slice_sets is not None
+
+    def is_current(self, key):
+        """ Returns True, if the exchange lists have been built for the given
+            key (e.g. the bucket ids of the local bunches) in all the ranks.
+            The method must be called in all the ranks."""
+        from mpi4py import MPI
+        return self._comm.allreduce(key == self._key, op=MPI.LAND)
+
+    def reset(self):
+        """ Removes the exchange lists, which are built again in the method
+            setup(...)."""
+        self._receive = []
+        self._send = []
+        self._sources = None
+        self.slice_sets = None
+        self.local_indexes = None
+
+    def setup(self, bucket_id, edges, windows, z_bins, circumference,
+              h_bunch, segments=(), key=None):
+        """
+        Builds the exchange lists. The method must be called in all the
+        ranks.
+
+        Parameters
+        ----------
+        bucket_id : NumPy array
+            The bucket ids of the local bunches
+        edges : NumPy array
+            The extents of the local bunches, shape (n_local_bunches, 2)
+        windows : NumPy array
+            The time windows affecting the kicks of the local bunches in the
+            same units as the extents, shape (n_local_bunches, 2)
+        z_bins : list
+            The bins of the local bunches
+        circumference : float
+        h_bunch : int
+        segments : list
+            A list of the names and the lengths of the signal segments, which
+            are exchanged in addition to the statistics
+        key : object
+            A comparable object identifying the local bunches and the windows
+            (see the method is_current(...))
+        """
+        # mpi4py is imported only when it is used
+        from mpi4py import MPI
+        if self._comm is None:
+            self._comm = MPI.COMM_WORLD.Dup()
+            self._waitall = MPI.Request.Waitall
+        rank = self._comm.Get_rank()
+        self._key = key
+
+        # the descriptors of the bunches in all the ranks
+        descriptors = self._comm.allgather((np.asarray(bucket_id, dtype=int),
+                                            np.reshape(edges, (-1, 2)),
+                                            np.reshape(windows, (-1, 2)),
+                                            [np.array(z, dtype=float)
+                                             for z in z_bins],
+                                            list(segments)))
+        if any(d[4] != list(segments) for d in descriptors):
+            raise ValueError('The lengths of the locally processed signal ' +
+                             'segments must be equal in all the ranks.')
+        all_z_bins = [z for d in descriptors for z in d[3]]
+        n_slices = max([len(z) - 1 for z in all_z_bins] + [0])
+        bunch_rank = np.concatenate([np.repeat(i, len(d[0]))
+                                     for i, d in enumerate(descriptors)])
+        bunch_index = np.concatenate([np.arange(len(d[0]))
+                                      for d in descriptors])
+        all_bucket_id = np.concatenate([d[0] for d in descriptors])
+        all_edges = np.concatenate([d[1] for d in descriptors])
+
+        # the statistical variables and the signal segments in a single row
+        # per bunch
+        self._fields = []
+        for i, var in enumerate(self._variables):
+            self._fields.append((var, slice(i * n_slices, (i + 1) * n_slices)))
+        row_length = len(self._variables) * n_slices
+        self._segment_fields = []
+        for name, length in segments:
+            self._segment_fields.append((name, slice(row_length,
+                                                     row_length + length)))
+            row_length += length
+        self._local_rows = np.zeros((len(descriptors[rank][0]), row_length))
+
+        # the local bunches needed by the other ranks
+        is_local = (bunch_rank == rank)
+        self._send = []
+        for i, d in enumerate(descriptors):
+            if i != rank:
+                needed = _window_bunches(all_edges, d[2]) & is_local
+                if np.any(needed):
+                    idx = bunch_index[needed]
+                    self._send.append((i, idx, np.zeros((len(idx), row_length))))
+
+        # the bunches of the other ranks needed by this rank. The rows of a
+        # rank are received in the order of the local indexes of the sender.
+        needed = _window_bunches(all_edges, descriptors[rank][2]) | is_local
+        rows = [None] * len(all_edges)
+        source = np.array(bunch_index)
+        for idx in np.flatnonzero(is_local):
+            rows[idx] = self._local_rows[bunch_index[idx]]
+        self._receive = []
+        for i in xrange(len(descriptors)):
+            received = np.flatnonzero(needed & (bunch_rank == i))
+            if (i != rank) and (len(received) > 0):
+                buffer = np.zeros((len(received), row_length))
+                self._receive.append((i, buffer))
+                source[received] = np.arange(len(received))
+                for idx, row in zip(received, buffer):
+                    rows[idx] = row
+
+        window = np.flatnonzero(needed)
+        window = window[np.argsort(-all_bucket_id[window], kind='mergesort')]
+        fields = self._fields + self._segment_fields
+        self.slice_sets = [_GatheredSlices(all_bucket_id[idx], all_z_bins[idx],
+                                           rows[idx], fields, circumference,
+                                           h_bunch) for idx in window]
+        self._sources = [(bunch_rank[idx], source[idx]) for idx in window]
+        position = np.zeros(len(all_edges), dtype=int)
+        position[window] = np.arange(len(window))
+        self.local_indexes = list(position[is_local])
+
+    def gather(self, local_slice_sets, segments=()):
+        """ Exchanges the statistics of the given local slice sets and
+            the signal segments given as a list of names and arrays
+            (n_local_bunches, length), and returns the gathered slice sets."""
+        for row, slice_set in zip(self._local_rows, local_slice_sets):
+            for var, idx in self._fields:
+                row[idx] = getattr(slice_set, var)
+        for (name, idx), (_, values) in zip(self._segment_fields, segments):
+            self._local_rows[:, idx] = values
+
+        requests = []
+        for rank, buffer in self._receive:
+            requests.append(self._comm.Irecv(buffer, source=rank,
+                                             tag=_GATHER_TAG))
+        for rank, idx, buffer in self._send:
+            np.take(self._local_rows, idx, axis=0, out=buffer)
+            requests.append(self._comm.Isend(buffer, dest=rank,
+                                             tag=_GATHER_TAG))
+        self._waitall(requests)
+
+        return self.slice_sets
+
+    def exchange(self, local_objects):
+        """ Exchanges the given objects of the local bunches (e.g. the
+            parameters of the signal segments) in the same way as the
+            statistics and returns them in the order of the gathered slice
+            sets. The objects are pickled, i.e. the method is intended for
+            exchanges during the initialization."""
+        rank = self._comm.Get_rank()
+        requests = []
+        for i, idx, buffer in self._send:
+            requests.append(self._comm.isend([local_objects[j] for j in idx],
+                                             dest=i, tag=_GATHER_TAG + 1))
+        received = {}
+        for i, buffer in self._receive:
+            received[i] = self._comm.recv(source=i, tag=_GATHER_TAG + 1)
+        self._waitall(requests)
+
+        return [local_objects[j] if i == rank else received[i][j]
+                for i, j in self._sources]
+
+
 class IdealBunchFeedback(object):
     """ The simplest possible feedback. It corrects a gain fraction of a mean xp/yp value of the bunch.
     """
@@ -34,11 +454,18 @@ class IdealBunchFeedback(object):
     def track(self,bunch):
         
         if self.multi_bunch:
-            bunch_list = bunch.split_to_views()
-            
-            for b in bunch_list:
-                b.xp -= self._gain_x *b.mean_xp()
-                b.yp -= self._gain_y*b.mean_yp()
+            # The mean values of all the bunches are calculated in a single
+            # pass over the particles, grouped by the bucket ids, and the
+            # corrections are applied in a single pass
+            bucket_id, _, particle_bunch, _ = _bunch_indexes(bunch)
+            bunch_index = particle_bunch.astype(np.int32)
+
+            n_macroparticles = np.zeros(len(bucket_id), dtype=np.int32)
+            means = np.zeros((2, len(bucket_id)))
+            cython_slice_moments(bunch_index, [bunch.xp, bunch.yp],
+                                 n_macroparticles, means)
+            cython_indexed_kick(bunch_index, self._gain_x * means[0], bunch.xp,
+                                self._gain_y * means[1], bunch.yp)
         else:
             bunch.xp -= self._gain_x *bunch.mean_xp()
             bunch.yp -= self._gain_y*bunch.mean_yp()
@@ -60,7 +487,11 @@ class IdealSliceFeedback(object):
 
     def track(self,bunch):
         
-        if self.multi_bunch:
+        if self.multi_bunch and \
+                (getattr(self._slicer, 'mode', None) == 'uniform_bin'):
+            self._track_bunches(bunch)
+
+        elif self.multi_bunch:
             bunch_list = bunch.split_to_views()
             
             for b in bunch_list:
@@ -81,13 +512,49 @@ class IdealSliceFeedback(object):
             bunch.xp[p_idx] -= self._gain_x * slice_set.mean_xp[s_idx]
             bunch.yp[p_idx] -= self._gain_y * slice_set.mean_yp[s_idx]
 
+    def _track_bunches(self, superbunch):
+        # The slices of all the bunches are uniform bin slices, i.e. the
+        # slice indexes are calculated for all the particles at once and the
+        # mean values of the slices in all the bunches are calculated in a
+        # single pass over the particles. The corrections are applied in a
+        # single pass.
+        circumference, h_bunch = _bucket_parameters(self._slicer, superbunch)
+        bucket_id, particle_bucket, particle_bunch, n_particles = \
+            _bunch_indexes(superbunch)
+
+        # the longitudinal coordinates in the buckets
+        z = superbunch.z + particle_bucket * (circumference / float(h_bunch))
+        cuts = _bunch_cuts(self._slicer, z, particle_bunch, n_particles)
+
+        n_slices = self._slicer.n_slices
+        slice_width = (cuts[:, 1] - cuts[:, 0]) / float(n_slices)
+        slice_index = np.floor((z - cuts[:, 0].take(particle_bunch)) /
+                               slice_width.take(particle_bunch))
+        outside = (slice_index < 0) | (slice_index >= n_slices)
+
+        index = (particle_bunch * n_slices).astype(np.int32)
+        index += slice_index.astype(np.int32)
+        index[outside] = -1
+
+        n_macroparticles = np.zeros(len(bucket_id) * n_slices, dtype=np.int32)
+        means = np.zeros((2, len(bucket_id) * n_slices))
+        cython_slice_moments(index, [superbunch.xp, superbunch.yp],
+                             n_macroparticles, means)
+        cython_indexed_kick(index, self._gain_x * means[0], superbunch.xp,
+                            self._gain_y * means[1], superbunch.yp)
 
 
 class GenericOneTurnMapObject(object):
+    # With MPI, the signals of the local bunches are read and processed
+    # through the leading segment processors in the ranks owning the bunches
+    # (see the method _process_local(...))
+    _local_readout = True
+
     def __init__(self, gain, slicer, processors_x, processors_y=None,
                  pickup_axis='divergence', kicker_axis=None, mpi=False,
                  phase_x=None, phase_y=None, location_x=0., location_y=0.,
-                 beta_x=1., beta_y=1., **kwargs):
+                 beta_x=1., beta_y=1., profile=False, timeline=None,
+                 dtype=None, bunch_by_bunch=False, **kwargs):
         
         if isinstance(gain, collections.Container):
             self._gain_x = gain[0]
@@ -97,9 +564,80 @@ class GenericOneTurnMapObject(object):
             self._gain_y = gain
         
         self._slicer = slicer
-        
+
+        # If the same processors are given to both planes, the x and y
+        # signals are stacked into a 2D signal and processed together
+        self._shared_chain = (processors_x is not None) and \
+                (processors_y is processors_x)
+
+        if self._shared_chain:
+            processors_x = ProcessorChain(processors_x, label='xy-planes',
+                                          dtype=dtype)
+            processors_y = processors_x
+            for processor in processors_x.processors:
+                if 'register' in getattr(processor, 'extensions', []):
+                    raise ValueError('The planes can not share processors ' +
+                                     'including registers, because the ' +
+                                     'registers use the tune of a single ' +
+                                     'plane.')
+        else:
+            if processors_x is not None:
+                processors_x = ProcessorChain(processors_x, label='x-plane',
+                                              dtype=dtype)
+            if processors_y is not None:
+                processors_y = ProcessorChain(processors_y, label='y-plane',
+                                              dtype=dtype)
+
+        # With MPI, the leading processors supporting the segment extension
+        # are run in the ranks owning the bunches before the signals are
+        # gathered, i.e. only the processed segments of the bunches are
+        # exchanged. The required slice statistics are determined from
+        # the whole chains.
+        self._required_variables = []
+        self._local_processors_x = None
+        self._local_processors_y = None
+        self._local_jobs = []
+        if mpi and self._local_readout:
+            for processors in (processors_x, processors_y):
+                if processors is not None:
+                    self._required_variables = get_processor_variables(
+                            processors, self._required_variables)
+
+            if self._shared_chain:
+                self._local_processors_x, processors_x = \
+                        _split_local_processors(processors_x)
+                processors_y = processors_x
+                self._local_processors_y = self._local_processors_x
+                self._local_jobs.append((('x', 'y'), self._local_processors_x))
+            else:
+                if processors_x is not None:
+                    self._local_processors_x, processors_x = \
+                            _split_local_processors(processors_x)
+                    self._local_jobs.append((('x',), self._local_processors_x))
+                if processors_y is not None:
+                    self._local_processors_y, processors_y = \
+                            _split_local_processors(processors_y)
+                    self._local_jobs.append((('y',), self._local_processors_y))
+
         self._processors_x = processors_x
         self._processors_y = processors_y
+
+        chains = [self._processors_x, self._processors_y,
+                  self._local_processors_x, self._local_processors_y]
+
+        if profile:
+            self.profiler = Profiler()
+            for processors in chains:
+                if processors is not None:
+                    processors.profiler = self.profiler
+        else:
+            self.profiler = None
+
+        self.timeline = timeline
+        if self.timeline is not None:
+            for processors in chains:
+                if processors is not None:
+                    processors.timeline = self.timeline
         
         # beam parameters
         self._pickup_axis = pickup_axis
@@ -116,7 +654,6 @@ class GenericOneTurnMapObject(object):
         self._signal_sets_y = None
         self._loc_signal_sets_x = None
         self._loc_signal_sets_y = None
-        self._required_variables = []
         if self._processors_x is not None:        
             if (self._pickup_axis == 'divergence') or (phase_x is not None):
                 self._required_variables.append('mean_xp')
@@ -136,18 +673,134 @@ class GenericOneTurnMapObject(object):
 #        # TODO: Normally n_macroparticles_per_slice is removed from
 #        #       the statistical variables. Check if it is not necessary.
 
+        # The mean values of the coordinates are calculated in a single pass
+        # over the particles (see the method _slice(...))
+        self._moment_variables = [var for var in self._required_variables
+                                  if var in _fused_moments]
+        self._other_variables = [var for var in self._required_variables
+                                 if (var not in _fused_moments) and
+                                 (var != 'n_macroparticles_per_slice')]
+
+        # In the bunch-by-bunch mode, each bunch of the superbunch is a single
+        # slice and the bunches are identified by the bucket ids of the
+        # particles (see the method _slice_bunches(...))
+        self._bunch_by_bunch = bunch_by_bunch
+        if self._bunch_by_bunch:
+            if mpi:
+                raise ValueError('The bunch-by-bunch mode can not be used ' +
+                                 'together with MPI')
+            if getattr(slicer, 'n_slices', 1) != 1:
+                raise ValueError('A slicer with a single slice is required ' +
+                                 'in the bunch-by-bunch mode')
+            if self._other_variables:
+                raise ValueError('Only the mean values and the numbers of ' +
+                                 'macroparticles are supported in the ' +
+                                 'bunch-by-bunch mode')
+
         self._mpi = mpi
         if self._mpi:
-            self._mpi_gatherer = mpi_data.MpiGatherer(self._slicer,
-                                                      self._required_variables)
+            # Only the statistics required by the processors after the local
+            # processing are gathered, if the signals are read locally
+            gathered_variables = []
+            if self._local_readout:
+                for processors in (self._processors_x, self._processors_y):
+                    if processors is not None:
+                        gathered_variables = get_processor_variables(
+                                processors, gathered_variables)
+            else:
+                gathered_variables = self._required_variables
+            self._mpi_gatherer = _WindowedGatherer(gathered_variables)
+        self._local_order = None
+        self._local_bunches = None
+        self._local_inputs = {}
+        self._local_outputs = {}
+        self._segment_index = None
+        self._segment_parameters = None
         self._parameters_x = None
         self._signal_x = None
         
         self._parameters_y = None
         self._signal_y = None
+
+        self._parameters_xy = None
+        self._signal_xy = None
+
+        self._kick_buffers = {}
+        self._readout_buffers = {}
+        self._phase_coefficients = {}
+        self._uniform_cuts = None
         
 
+    def prepare(self, bunch, n_workers=None, pool='thread'):
+        """
+        Initializes the signal processors before the first turn by using
+        the slice sets of the given bunch, i.e. the initialization costs
+        are not included in the first turn (see the function prepare_parallel
+        in core.py). The processors of the x and y planes are prepared in
+        parallel. If MPI is used, the method must be called in all the ranks,
+        because the slice sets are gathered.
+
+        Parameters
+        ----------
+        bunch : PyHEADTAIL bunch object
+        n_workers : int
+            A maximum number of parallel workers. By default, the number of
+            CPUs is used.
+        pool : string
+            'thread', 'process' or None (see prepare_parallel). By default,
+            the processors are prepared in threads. Forked worker processes
+            ('process') must be requested explicitly, and they can not be
+            used with MPI.
+        """
+        if (pool == 'process') and self._mpi:
+            raise ValueError('The MPI processes can not be forked, i.e. ' +
+                             'pool must be \'thread\' or None with MPI.')
+
+        bunch_list, local_slice_sets, signal_slice_sets_x, signal_slice_sets_y = self._get_slice_sets(bunch)
+
+        if (self._signal_x is None) and (self._signal_y is None):
+            self._init_signals(bunch_list, signal_slice_sets_x, signal_slice_sets_y)
+
+        with self._span('prepare'):
+            prepare_parallel(self._prepare_jobs(signal_slice_sets_x, signal_slice_sets_y),
+                             n_workers, pool)
+
+    def _prepare_jobs(self, signal_slice_sets_x, signal_slice_sets_y):
+        if self._shared_chain:
+            return [(self._processors_x, self._parameters_xy,
+                     {'n_channels': 2, 'slice_sets': signal_slice_sets_x})]
+
+        jobs = []
+        if self._processors_x is not None:
+            jobs.append((self._processors_x, self._parameters_x,
+                         {'slice_sets': signal_slice_sets_x}))
+        if self._processors_y is not None:
+            jobs.append((self._processors_y, self._parameters_y,
+                         {'slice_sets': signal_slice_sets_y}))
+        return jobs
+
+    def profile_stats(self):
+        """ Returns the profiled processor data (see Profiler.stats)."""
+        if self.profiler is None:
+            raise ValueError('Profiling is not enabled (use profile=True).')
+        return self.profiler.stats()
+
+    def profile_summary(self):
+        """ Returns the profiled processor data as a printable table."""
+        if self.profiler is None:
+            raise ValueError('Profiling is not enabled (use profile=True).')
+        return self.profiler.summary()
+
+    def _span(self, name, category='feedback'):
+        if self.timeline is None:
+            return _NO_SPAN
+        return self.timeline.span(name, category)
+
     def _init_signals(self, bunch_list, signal_slice_sets_x, signal_slice_sets_y):
+        if len(self._local_jobs) > 0:
+            self._init_joined_signals()
+            return
+
         beta_beam = bunch_list[0].beta
         
         
@@ -169,16 +822,74 @@ class GenericOneTurnMapObject(object):
             n_bins_per_segment = self._parameters_y['n_bins_per_segment']
             self._signal_y = np.zeros(n_segments * n_bins_per_segment)
 
+        if self._shared_chain:
+            if self._location_x != self._location_y:
+                raise ValueError('The locations of the x and y planes must ' +
+                                 'be equal, when the planes share processors.')
+            self._parameters_xy = self._parameters_x.replace(
+                    beta=np.array([[self._beta_x], [self._beta_y]]))
+            self._signal_xy = np.zeros((2, len(self._signal_x)))
+            self._signal_x = self._signal_xy[0]
+            self._signal_y = self._signal_xy[1]
+
+    def _init_joined_signals(self):
+        # The parameters of the gathered signals are joined from the
+        # parameters of the processed segments in the bin order of the signals
+        # and the signals are in the precision of the processed segments
+        for planes, processors in self._local_jobs:
+            if planes[0] == 'x':
+                signal_sets = self._signal_sets_x
+            else:
+                signal_sets = self._signal_sets_y
+            parameters = _join_parameters([self._segment_parameters[planes][idx]
+                                           for idx in reversed(signal_sets)])
+            length = parameters['n_segments'] * parameters['n_bins_per_segment']
+            dtype = self._local_outputs[planes][1]
+
+            if planes == ('x', 'y'):
+                self._parameters_xy = parameters
+                self._signal_xy = np.zeros((2, length), dtype=dtype)
+                self._signal_x = self._signal_xy[0]
+                self._signal_y = self._signal_xy[1]
+            elif planes == ('x',):
+                self._parameters_x = parameters
+                self._signal_x = np.zeros(length, dtype=dtype)
+            else:
+                self._parameters_y = parameters
+                self._signal_y = np.zeros(length, dtype=dtype)
+
     def _get_slice_sets(self, superbunch):
+        with self._span('get_slice_sets'):
+            # the uniform cuts are determined again for the new slice sets,
+            # once per turn
+            self._uniform_cuts = None
+            return self._collect_slice_sets(superbunch)
+
+    def _collect_slice_sets(self, superbunch):
         if self._mpi:
-            self._mpi_gatherer.gather(superbunch)
-            all_slice_sets = self._mpi_gatherer.bunch_by_bunch_data
-            local_slice_sets = self._mpi_gatherer.slice_set_list
-            bunch_list = self._mpi_gatherer.bunch_list
-            self._local_sets = self._mpi_gatherer.local_bunch_indexes
+            bunch_list = superbunch.split_to_views()
+            local_slice_sets = [self._slice(bunch) for bunch in bunch_list]
+            key = self._bunch_set_key(bunch_list, local_slice_sets)
+            if self._mpi_gatherer.initialized and \
+                    (not self._mpi_gatherer.is_current(key)):
+                self._reset_bunch_set()
+            if self._local_bunches is None:
+                self._init_local_bunches(superbunch, bunch_list, local_slice_sets)
+            with self._span('local_processing'):
+                segments = self._process_local(local_slice_sets, superbunch.beta)
+            if not self._mpi_gatherer.initialized:
+                self._init_gatherer(superbunch, local_slice_sets, segments, key)
+            with self._span('mpi_gather', 'mpi'):
+                all_slice_sets = self._mpi_gatherer.gather(local_slice_sets,
+                                                           segments)
+            self._local_sets = self._mpi_gatherer.local_indexes
+        elif self._bunch_by_bunch:
+            all_slice_sets = [self._slice_bunches(superbunch)]
+            local_slice_sets = all_slice_sets
+            bunch_list = [superbunch]
+            self._local_sets = [0]
         else:
-            all_slice_sets = [superbunch.get_slices(self._slicer,
-                                                    statistics=self._required_variables)]
+            all_slice_sets = [self._slice(superbunch)]
             local_slice_sets = all_slice_sets
             bunch_list = [superbunch]
             self._local_sets = [0]
@@ -216,11 +927,339 @@ class GenericOneTurnMapObject(object):
         
         return bunch_list, local_slice_sets, signal_slice_sets_x, signal_slice_sets_y
             
+    def _bunch_set_key(self, bunch_list, local_slice_sets):
+        # The bucket ids of the local bunches, which determine the windows of
+        # the gathered bunches
+        return tuple(_local_bucket_id(bunch, slice_set)
+                     for bunch, slice_set in zip(bunch_list, local_slice_sets))
+
+    def _reset_bunch_set(self):
+        # The bunch set has changed in some of the ranks, i.e. the exchange
+        # lists, the signal sets and the signals are initialized again
+        self._mpi_gatherer.reset()
+        self._local_order = None
+        self._local_bunches = None
+        self._local_inputs = {}
+        self._local_outputs = {}
+        self._segment_index = None
+        self._segment_parameters = None
+        self._signal_sets_x = None
+        self._signal_sets_y = None
+        self._loc_signal_sets_x = None
+        self._loc_signal_sets_y = None
+        self._parameters_x = None
+        self._signal_x = None
+        self._parameters_y = None
+        self._signal_y = None
+        self._parameters_xy = None
+        self._signal_xy = None
+
+    def _init_local_bunches(self, superbunch, bunch_list, local_slice_sets):
+        # The bucket ids and the bins of the local bunches are stored to slice
+        # set emulations, and the local bunches are ordered in the same way as
+        # the gathered slice sets (the descending bucket ids)
+        circumference, h_bunch = _bucket_parameters(self._slicer, superbunch)
+
+        self._local_bunches = []
+        for bunch, slice_set in zip(bunch_list, local_slice_sets):
+            self._local_bunches.append(_GatheredSlices(
+                    _local_bucket_id(bunch, slice_set),
+                    np.array(slice_set.z_bins), None, [], circumference,
+                    h_bunch))
+
+        bucket_id = [slice_set.bucket_id for slice_set in self._local_bunches]
+        self._local_order = np.argsort(-np.array(bucket_id, dtype=int),
+                                       kind='mergesort')
+
+    def _init_gatherer(self, superbunch, local_slice_sets, segments, key):
+        # The influence windows of the local bunches in the units of
+        # z/(c*beta), which are determined in the same way as in the method
+        # _parse_relevant_bunches(...) by using the supports of both planes
+        beta_beam = superbunch.beta
+
+        bucket_id = np.zeros(len(self._local_bunches), dtype=int)
+        edges = np.zeros((len(self._local_bunches), 2))
+        for i, slice_set in enumerate(self._local_bunches):
+            bucket_id[i] = slice_set.bucket_id
+            z_bins = slice_set.z_bins - bucket_id[i]*slice_set.circumference/float(slice_set.h_bunch)
+            edges[i] = np.min(z_bins), np.max(z_bins)
+        edges /= (c*beta_beam)
+
+        windows = self._gather_windows(edges, local_slice_sets, beta_beam)
+        self._mpi_gatherer.setup(bucket_id, edges, windows,
+                                 [slice_set.z_bins for slice_set
+                                  in self._local_bunches],
+                                 self._local_bunches[0].circumference,
+                                 self._local_bunches[0].h_bunch,
+                                 [(name, values.shape[1])
+                                  for name, values in segments], key)
+
+        # The parameters of the processed segments are exchanged once, and
+        # the parameters of the gathered signals are joined from them (see
+        # the method _init_signals(...))
+        if len(self._local_jobs) > 0:
+            self._segment_parameters = {}
+            for planes, processors in self._local_jobs:
+                parameters = self._local_outputs[planes][0]
+                local_parameters = [_segment_parameters(parameters, idx)
+                                    for idx in self._segment_index]
+                self._segment_parameters[planes] = \
+                        self._mpi_gatherer.exchange(local_parameters)
+
+    def _process_local(self, local_slice_sets, beta_beam):
+        # Reads the signals of the local bunches and processes them through
+        # the leading segment processors of the chains. The processed segments
+        # are returned as a list of names and arrays (n_local_bunches,
+        # n_bins_per_segment) in the order of the local bunches, which are
+        # gathered in the place of the slice statistics.
+        if len(self._local_jobs) == 0:
+            return []
+
+        slice_sets = [local_slice_sets[idx] for idx in self._local_order]
+        segments = []
+        for planes, processors in self._local_jobs:
+            if planes not in self._local_inputs:
+                self._init_local_input(planes, beta_beam)
+            parameters, signal = self._local_inputs[planes]
+
+            channels = signal.reshape(len(planes), -1)
+            for channel, plane in zip(channels, planes):
+                if plane == 'x':
+                    self._read_statistics(channel, slice_sets, 'x',
+                                          self._phase_x, self._beta_x)
+                else:
+                    self._read_statistics(channel, slice_sets, 'y',
+                                          self._phase_y, self._beta_y)
+
+            output_parameters, output_signal = process(parameters, signal,
+                                                       processors,
+                                                       slice_sets=slice_sets)
+            if planes not in self._local_outputs:
+                self._local_outputs[planes] = (output_parameters,
+                                               output_signal.dtype)
+
+            # the segments are in the reversed order of the bunches in
+            # the signal
+            output_signal = np.reshape(output_signal,
+                                       (len(planes), len(slice_sets), -1))
+            for channel, plane in zip(output_signal, planes):
+                segments.append(('segment_' + plane,
+                                 channel.take(self._segment_index, axis=0)))
+
+        return segments
+
+    def _init_local_input(self, planes, beta_beam):
+        # The parameters and the signal buffer of the local bunches. The bins
+        # of the bunches are shifted by the bucket positions in the same way
+        # as in the gathered signals.
+        local_bunches = [self._local_bunches[idx] for idx in self._local_order]
+        if planes[0] == 'x':
+            parameters = self._generate_parameters(local_bunches, self._location_x,
+                                                   self._beta_x, beta_beam)
+        else:
+            parameters = self._generate_parameters(local_bunches, self._location_y,
+                                                   self._beta_y, beta_beam)
+        length = parameters['n_segments'] * parameters['n_bins_per_segment']
+        if len(planes) > 1:
+            parameters = parameters.replace(
+                    beta=np.array([[self._beta_x], [self._beta_y]]))
+            signal = np.zeros((len(planes), length))
+        else:
+            signal = np.zeros(length)
+        self._local_inputs[planes] = (parameters, signal)
+
+        # the index of the segment of each local bunch in the signal
+        n_local = len(self._local_order)
+        position = np.zeros(n_local, dtype=int)
+        position[self._local_order] = np.arange(n_local)
+        self._segment_index = n_local - 1 - position
+
+    def _gather_windows(self, edges, local_slice_sets, beta_beam):
+        # The windows of the bunches gathered for the local bunches in
+        # the same units as the extents of the local bunches (edges), i.e.
+        # each rank processes the signal of its own bunches padded with
+        # the bunches within the time supports of both planes
+        causal = 0.
+        anticausal = 0.
+        if len(local_slice_sets) > 0:
+            for processors in (self._processors_x, self._processors_y):
+                if processors is not None:
+                    support = self._time_support(processors, local_slice_sets[0],
+                                                 beta_beam)
+                    causal = max(causal, support[0])
+                    anticausal = max(anticausal, support[1])
+
+        return edges + np.array([-anticausal, causal])
+
+    def _time_support(self, processors, slice_set, beta_beam):
+        # The causal and anti-causal support of the processors (see the
+        # function time_support in core.py) for the bins of the slice set.
+        # The processors run in the ranks owning the bunches are included.
+        bin_spacing = np.mean(np.diff(slice_set.z_bins))/(c*beta_beam)
+        if (processors is self._processors_x) and \
+                (self._local_processors_x is not None):
+            processors = list(self._local_processors_x) + list(processors)
+        elif (processors is self._processors_y) and \
+                (self._local_processors_y is not None):
+            processors = list(self._local_processors_y) + list(processors)
+        return time_support(processors, bin_spacing)[:2]
+
+    def _slice(self, bunch):
+        # The slice set is created in the same way as in the slicer, but
+        # the number of macroparticles and the mean values of the required
+        # coordinates are calculated in a single pass over the particles. The
+        # other statistics are calculated by PyHEADTAIL. If the fused
+        # calculation is not possible (e.g. GPU arrays), the slice set is
+        # created by PyHEADTAIL.
+        #
+        # The slice indexes of the particles depend only on the longitudinal
+        # coordinates, i.e. they are shared with the slice set stored to the
+        # bunch by an earlier object (e.g. another pickup, a kicker or a wake
+        # field) using the same slicer. The longitudinal trackers of
+        # PyHEADTAIL clean the stored slice sets (bunch.clean_slices()), when
+        # the longitudinal coordinates change. The mean values are always
+        # calculated, because the transverse coordinates may have changed.
+        coordinates = [getattr(bunch, _fused_moments[var])
+                       for var in self._moment_variables]
+
+        if (len(coordinates) == 0) or \
+                (not hasattr(self._slicer, 'compute_sliceset_kwargs')) or \
+                any((not isinstance(u, np.ndarray)) or (u.dtype != np.float64) or
+                    (not u.flags.c_contiguous) for u in coordinates):
+            return bunch.get_slices(self._slicer,
+                                    statistics=self._required_variables)
+
+        # PyHEADTAIL is imported only when it is used
+        from PyHEADTAIL.particles.slicing import SliceSet
+
+        stored_slice_sets = getattr(bunch, '_slice_sets', None)
+        if not isinstance(stored_slice_sets, dict):
+            stored_slice_sets = None
+        shared_slice_set = None
+        if stored_slice_sets is not None:
+            shared_slice_set = stored_slice_sets.get(self._slicer, None)
+
+        if (shared_slice_set is not None) and \
+                isinstance(shared_slice_set.slice_index_of_particle, np.ndarray):
+            sliceset_kwargs = dict(
+                    z_bins=shared_slice_set.z_bins,
+                    slice_index_of_particle=shared_slice_set.slice_index_of_particle,
+                    mode=shared_slice_set.mode)
+        else:
+            shared_slice_set = None
+            sliceset_kwargs = self._slicer.compute_sliceset_kwargs(bunch)
+            # the numbers of macroparticles are counted below (e.g. the uniform
+            # charge slicer gives them in the arguments)
+            sliceset_kwargs.pop('n_macroparticles_per_slice', None)
+        slice_index_of_particle = np.ascontiguousarray(
+                sliceset_kwargs['slice_index_of_particle'], dtype=np.int32)
+        sliceset_kwargs['slice_index_of_particle'] = slice_index_of_particle
+        sliceset_kwargs['beam_parameters'] = (
+                self._slicer.extract_beam_parameters(bunch))
+        sliceset_kwargs['beam_parameters']['is_sorted'] = False
+
+        n_slices = len(sliceset_kwargs['z_bins']) - 1
+        n_macroparticles = np.zeros(n_slices, dtype=np.int32)
+        means = np.zeros((len(coordinates), n_slices))
+        cython_slice_moments(slice_index_of_particle, coordinates,
+                             n_macroparticles, means)
+
+        slice_set = SliceSet(n_macroparticles_per_slice=n_macroparticles,
+                             **sliceset_kwargs)
+        for var, values in zip(self._moment_variables, means):
+            setattr(slice_set, var, values)
+        if self._other_variables:
+            self._slicer.add_statistics(slice_set, bunch,
+                                        self._other_variables)
+
+        # the new slice set is stored to the bunch as in bunch.get_slices(...),
+        # i.e. the later objects get the mean values of this turn. The cuts
+        # of the shared indexes (see the method _slice_set_cuts(...)) are
+        # kept.
+        if shared_slice_set is not None:
+            cuts = getattr(shared_slice_set, '_feedback_uniform_cuts', None)
+            if cuts is not None:
+                slice_set._feedback_uniform_cuts = cuts
+        if stored_slice_sets is not None:
+            stored_slice_sets[self._slicer] = slice_set
+
+        return slice_set
+
+    def _slice_bunches(self, superbunch):
+        # The bunch-by-bunch mode: the particles are grouped into the bunches
+        # by using a single np.bincount(...) over the bucket ids, and the
+        # mean values of the bunches are calculated in a single pass over the
+        # particles
+        circumference, h_bunch = _bucket_parameters(self._slicer, superbunch)
+        bucket_length = circumference / float(h_bunch)
+        bucket_id, particle_bucket, particle_bunch, n_particles = \
+            _bunch_indexes(superbunch)
+
+        # the longitudinal coordinates in the buckets, i.e. the opposite
+        # shift to the slice sets in the method _generate_parameters(...)
+        z = superbunch.z + particle_bucket * bucket_length
+
+        # without cuts, the extents of the bunches are needed only for the
+        # signal parameters
+        cuts = _bunch_cuts(self._slicer, z, particle_bunch, n_particles,
+                           extent=((self._signal_x is None) and
+                                   (self._signal_y is None)))
+
+        slice_index_of_particle = particle_bunch.astype(np.int32)
+        if cuts is not None:
+            outside = (z < cuts[:, 0].take(particle_bunch)) | \
+                      (z >= cuts[:, 1].take(particle_bunch))
+            slice_index_of_particle[outside] = -1
+
+        coordinates = [getattr(superbunch, _fused_moments[var])
+                       for var in self._moment_variables]
+        coordinates = [np.ascontiguousarray(u, dtype=np.float64)
+                       for u in coordinates]
+        n_macroparticles = np.zeros(len(bucket_id), dtype=np.int32)
+        means = np.zeros((len(coordinates), len(bucket_id)))
+        cython_slice_moments(slice_index_of_particle, coordinates,
+                             n_macroparticles, means)
+
+        bunch_slices = _BunchSlices(bucket_id, cuts, slice_index_of_particle,
+                                    n_macroparticles, circumference, h_bunch)
+        for var, values in zip(self._moment_variables, means):
+            setattr(bunch_slices, var, values)
+
+        return bunch_slices
+
+    def _generate_bunch_parameters(self, bunch_slices, location, beta, beta_beam):
+        # The parameters for the bunch-by-bunch mode, which are equal to the
+        # parameters generated from a list of slice sets with a single slice
+        z_bins = np.copy(bunch_slices.z_cuts)
+        if bunch_slices.n_slices > 1:
+            z_bins -= (bunch_slices.bucket_id[:, np.newaxis] *
+                       bunch_slices.circumference /
+                       float(bunch_slices.h_bunch))
+
+        bin_edges = (-1. * z_bins / (c * beta_beam))[::-1, ::-1]
+        segment_ref_points = (-1. * np.mean(z_bins, axis=1) /
+                              (c * beta_beam))[::-1]
+
+        parameters = Parameters(signal_class=0,
+                                bin_edges=np.ascontiguousarray(bin_edges),
+                                n_segments=bunch_slices.n_slices,
+                                n_bins_per_segment=1,
+                                segment_ref_points=segment_ref_points,
+                                location=location, beta=beta)
+
+        return parameters
+
     def _generate_parameters(self, signal_slice_sets, location, beta, beta_beam):
+        if isinstance(signal_slice_sets[0], _BunchSlices):
+            return self._generate_bunch_parameters(signal_slice_sets[0],
+                                                   location, beta, beta_beam)
+
         bin_edges = None
         segment_ref_points = []
     
-        if len(signal_slice_sets) > 1:
+        # with MPI, the bins are always shifted by the bucket positions,
+        # because the signals are joined from the segments of the ranks
+        if (len(signal_slice_sets) > 1) or self._mpi:
             circumference = signal_slice_sets[0].circumference
             h_bunch = signal_slice_sets[0].h_bunch
         else:
@@ -246,47 +1285,36 @@ class GenericOneTurnMapObject(object):
         n_bins_per_segment = len(bin_edges)/len(signal_slice_sets)
         segment_ref_points = np.array(segment_ref_points)
     
-        parameters = Parameters()
-        parameters['class'] = 0
-        parameters['bin_edges'] = bin_edges
-        parameters['n_segments'] = len(signal_slice_sets)
-        parameters['n_bins_per_segment'] = n_bins_per_segment
-        parameters['segment_ref_points'] = segment_ref_points
-        parameters['location'] = location
-        parameters['beta'] = beta
+        parameters = Parameters(signal_class=0, bin_edges=bin_edges,
+                                n_segments=len(signal_slice_sets),
+                                n_bins_per_segment=n_bins_per_segment,
+                                segment_ref_points=segment_ref_points,
+                                location=location, beta=beta)
     
         return parameters
     
     def _parse_relevant_bunches(self, local_slice_sets, all_slice_sets, processors, beta_beam):
+        if self._bunch_by_bunch:
+            # all the bunches are in the same set
+            return [0], [0]
+
         circumference = all_slice_sets[0].circumference
         h_bunch = all_slice_sets[0].h_bunch
-        
-        time_scale = 0.
-        
-        for processor in processors:
-            if processor.time_scale > time_scale:
-                time_scale = processor.time_scale
-        local_set_edges = np.zeros((len(local_slice_sets), 2))
-        
+
+        # The local bunches in the gathered slice sets
+        local_slice_sets = [all_slice_sets[idx] for idx in self._local_sets]
+        window_min, window_max = self._signal_window(processors, local_slice_sets,
+                                                     beta_beam)
+
         included_sets = []
         set_is_included = np.zeros(len(all_slice_sets), dtype=int)
         set_counter = np.zeros(len(all_slice_sets), dtype=int)
         
-        for i, slice_set in enumerate(local_slice_sets):
-            local_set_edges[i,0] = np.min(slice_set.z_bins-slice_set.bucket_id*circumference/float(h_bunch))/(c*beta_beam)
-            local_set_edges[i,1] = np.max(slice_set.z_bins-slice_set.bucket_id*circumference/float(h_bunch))/(c*beta_beam)
-
-            
-        
-        local_min = np.min(local_set_edges)
-        local_max = np.max(local_set_edges)
-        
         counter = 0
         for i, slice_set in enumerate(all_slice_sets):
             set_min = np.min(slice_set.z_bins-slice_set.bucket_id*circumference/float(h_bunch))/(c*beta_beam)
             set_max = np.max(slice_set.z_bins-slice_set.bucket_id*circumference/float(h_bunch))/(c*beta_beam)
-    #        print 'set_min ' + str(set_min) + ' and (local_min - time_scale)' + str((local_min - time_scale))
-            if (set_max > (local_min - time_scale)) and (set_min < (local_max + time_scale)):
+            if (set_max > window_min) and (set_min < window_max):
                 included_sets.append(i)
                 set_is_included[i] = 1
                 set_counter[i] = counter
@@ -306,92 +1334,287 @@ class GenericOneTurnMapObject(object):
         return included_sets, local_sets
     
     
+    def _signal_window(self, processors, local_slice_sets, beta_beam):
+        # The time window of the input signal affecting the output signal in
+        # the units of z/(c*beta). The signal time is -z/(c*beta), i.e. the
+        # bunches within the causal support are located at larger z than
+        # the local bunches.
+        circumference = local_slice_sets[0].circumference
+        h_bunch = local_slice_sets[0].h_bunch
+
+        causal, anticausal = self._time_support(processors, local_slice_sets[0],
+                                                beta_beam)
+
+        local_set_edges = np.zeros((len(local_slice_sets), 2))
+        for i, slice_set in enumerate(local_slice_sets):
+            local_set_edges[i,0] = np.min(slice_set.z_bins-slice_set.bucket_id*circumference/float(h_bunch))/(c*beta_beam)
+            local_set_edges[i,1] = np.max(slice_set.z_bins-slice_set.bucket_id*circumference/float(h_bunch))/(c*beta_beam)
+
+        return np.min(local_set_edges) - anticausal, np.max(local_set_edges) + causal
+
     def _read_signal(self, signal, signal_slice_sets, plane, betatron_phase,
-                    beta_value):     
-        if self._mpi:
-            n_slices_per_bunch = signal_slice_sets[0]._n_slices
-        else:
-            n_slices_per_bunch = signal_slice_sets[0].n_slices
+                    beta_value):
+        if len(self._local_jobs) > 0:
+            # the signals have been read and processed in the ranks owning
+            # the bunches, i.e. the processed segments are copied in the bin
+            # order of the signal
+            segments = signal.reshape(len(signal_slice_sets), -1)
+            for segment, slice_set in zip(segments, reversed(signal_slice_sets)):
+                np.copyto(segment, getattr(slice_set, 'segment_' + plane),
+                          casting='unsafe')
+            return
+
+        self._read_statistics(signal, signal_slice_sets, plane, betatron_phase,
+                              beta_value)
+
+    def _read_statistics(self, signal, signal_slice_sets, plane,
+                         betatron_phase, beta_value):
+        # The slice statistics are gathered into stacked (n_bunches, n_slices)
+        # buffers directly in the bin order of the signal (the bunches and
+        # the slices in the reversed order) and the betatron phase rotation is
+        # applied to the whole signal at once
+        n_slices_per_bunch = signal_slice_sets[0].n_slices
     
         total_length = len(signal_slice_sets) * n_slices_per_bunch
     
         if (signal is None) or (len(signal) != total_length):
             raise ValueError('Wrong signal length')
-    
-        for idx, slice_set in enumerate(signal_slice_sets):
-            idx_from = idx * n_slices_per_bunch
-            idx_to = (idx + 1) * n_slices_per_bunch
-    
-            
-            if plane == 'x':
-                if self._pickup_axis == 'displacement' or (betatron_phase is not None):
-                    x_values = np.copy(slice_set.mean_x)
-                if (self._pickup_axis == 'divergence') or (betatron_phase is not None):
-                    xp_values = np.copy(slice_set.mean_xp)
-            elif plane == 'y':
-                if self._pickup_axis == 'displacement' or (betatron_phase is not None):
-                    x_values = np.copy(slice_set.mean_y)
-                if (self._pickup_axis == 'divergence') or (betatron_phase is not None):
-                    xp_values = np.copy(slice_set.mean_yp)
+
+        if plane == 'x':
+            x_variable, xp_variable = 'mean_x', 'mean_xp'
+        elif plane == 'y':
+            x_variable, xp_variable = 'mean_y', 'mean_yp'
+        else:
+            raise ValueError('Unknown plane')
+
+        if self._pickup_axis not in ('divergence', 'displacement'):
+            raise ValueError('Unknown axis')
+
+        if betatron_phase is None:
+            if self._pickup_axis == 'divergence':
+                self._gather_statistics(signal_slice_sets, xp_variable, signal)
             else:
-                raise ValueError('Unknown plane')
-    
-            if self._pickup_axis == 'divergence': 
-                if betatron_phase is None:
-                    np.copyto(signal[idx_from:idx_to], xp_values)
-                else:
-                    np.copyto(signal[idx_from:idx_to], (-np.sin(betatron_phase)*x_values/beta_value +
-                                      np.cos(betatron_phase)*xp_values))
-            elif self._pickup_axis == 'displacement':
-                if betatron_phase is None:
-                    np.copyto(signal[idx_from:idx_to], x_values)
-                else:
-                    np.copyto(signal[idx_from:idx_to], (np.cos(betatron_phase)*x_values +
-                                      beta_value*np.sin(betatron_phase)*xp_values))
+                self._gather_statistics(signal_slice_sets, x_variable, signal)
+            return
+
+        shape = (len(signal_slice_sets), n_slices_per_bunch)
+        buffers = self._readout_buffers.get(plane, None)
+        if (buffers is None) or (buffers[0].shape != shape):
+            buffers = (np.zeros(shape), np.zeros(shape))
+            self._readout_buffers[plane] = buffers
+        x_values, xp_values = buffers
+
+        self._gather_statistics(signal_slice_sets, x_variable, x_values)
+        self._gather_statistics(signal_slice_sets, xp_variable, xp_values)
+
+        x_coefficient, xp_coefficient = self._readout_coefficients(
+                betatron_phase, beta_value)
+        x_values *= x_coefficient
+        xp_values *= xp_coefficient
+        np.add(x_values, xp_values, out=signal.reshape(shape))
+
+    def _readout_coefficients(self, betatron_phase, beta_value):
+        # The coefficients of the betatron phase rotation for the x and xp
+        # values of the pickup signal
+        key = (self._pickup_axis, betatron_phase, beta_value)
+        coefficients = self._phase_coefficients.get(key, None)
+        if coefficients is None:
+            if self._pickup_axis == 'divergence':
+                coefficients = (-np.sin(betatron_phase)/beta_value,
+                                np.cos(betatron_phase))
             else:
-                raise ValueError('Unknown axis')
-        
-        if signal is not None:
-            np.copyto(signal, signal[::-1])
+                coefficients = (np.cos(betatron_phase),
+                                beta_value*np.sin(betatron_phase))
+            self._phase_coefficients[key] = coefficients
+        return coefficients
+
+    def _gather_statistics(self, signal_slice_sets, variable, out):
+        # A single copy of the statistical variable of the slice sets in
+        # the reversed order
+        np.concatenate([getattr(slice_set, variable)[::-1] for slice_set
+                        in reversed(signal_slice_sets)], out=out.reshape(-1))
 
     
+    def _process_shared(self, signal_slice_sets):
+        # Reads the x and y signals into the rows of the 2D signal and
+        # processes them together
+        self._read_signal(self._signal_x, signal_slice_sets, 'x',
+                          self._phase_x, self._beta_x)
+        self._read_signal(self._signal_y, signal_slice_sets, 'y',
+                          self._phase_y, self._beta_y)
+
+        return process(self._parameters_xy, self._signal_xy,
+                       self._processors_x, slice_sets=signal_slice_sets)
+
+    def _apply_gain(self, signal, gain, plane, parameters):
+        # The kick signal is written into a preallocated buffer, which is
+        # modified in place in the method _kick_planes(...). The codes of
+        # a fixed-point signal are converted to values (see core.py).
+        if parameters['scale'] is not None:
+            gain = gain * parameters['scale']
+
+        kick_buffer = self._kick_buffers.get(plane, None)
+        if (kick_buffer is None) or (len(kick_buffer) != len(signal)):
+            kick_buffer = np.zeros(len(signal))
+            self._kick_buffers[plane] = kick_buffer
+
+        np.multiply(signal, gain, out=kick_buffer)
+
+        return kick_buffer
+
     def _kick_bunches(self, signal, plane, local_slice_sets, bunch_list, local_sets):
-    
-        if signal is not None:
-            np.copyto(signal, signal[::-1])
-        
+        self._kick_planes([(signal, plane, local_sets)], local_slice_sets,
+                          bunch_list)
+
+    def _kick_planes(self, kicks, local_slice_sets, bunch_list):
+        # The kicks are given as a list of tuples (signal, plane, local_sets)
+        kicks = [kick for kick in kicks if kick[0] is not None]
+        if len(kicks) == 0:
+            return
+
+        with self._span('kick_' + ''.join(kick[1] for kick in kicks)):
+            self._apply_kicks(kicks, local_slice_sets, bunch_list)
+
+    def _particle_bins(self, local_slice_sets, local_sets, signal_length):
+        # Returns a list of the slice indexes of the particles and the signal
+        # bin of the first slice for each local bunch. The slices are in the
+        # reversed order in the signal, i.e. the kick maps the slice indexes
+        # to the bins (offset - slice index) in the same pass over the
+        # particles and no particle-sized arrays are allocated. The slice
+        # indexes of PyHEADTAIL are already int32, i.e. they are not copied.
+        n_slices_per_bunch = local_slice_sets[0].n_slices
+        kick_map = []
+        for slice_set, bunch_idx in zip(local_slice_sets, local_sets):
+            s_idx = np.ascontiguousarray(slice_set.slice_index_of_particle,
+                                         dtype=np.int32)
+            offset = signal_length - 1 - bunch_idx * n_slices_per_bunch
+            kick_map.append((s_idx, offset))
+        return kick_map
+
+    def _uniform_bins(self, local_slice_sets, bunch_list):
+        # Returns a list of the tail cuts and the slice widths of the local
+        # bunches, if the bunches have been sliced by using a uniform bin
+        # slicer. In that case, the slice indexes of the particles are
+        # computed directly from the z coordinates in the kick and the index
+        # maps are not needed. Otherwise None is returned.
+        if self._uniform_cuts is None:
+            self._uniform_cuts = False
+            if not hasattr(self._slicer, 'get_long_cuts'):
+                return None
+
+            uniform_cuts = []
+            for slice_set, bunch in zip(local_slice_sets, bunch_list):
+                if (getattr(slice_set, 'mode', None) != 'uniform_bin') or \
+                        (not isinstance(bunch.z, np.ndarray)) or \
+                        (bunch.z.dtype != np.float64):
+                    return None
+
+                cuts = self._slice_set_cuts(slice_set, bunch)
+                if cuts is None:
+                    return None
+                uniform_cuts.append(cuts)
+            self._uniform_cuts = uniform_cuts
+
+        if self._uniform_cuts is False:
+            return None
+        return self._uniform_cuts
+
+    def _slice_set_cuts(self, slice_set, bunch):
+        # The cuts are computed in the same way as in the slicer, which gives
+        # exactly the same slice indexes. The cuts are compared to both ends
+        # of the bins in order to avoid outdated slice sets. The cuts change
+        # only with the longitudinal coordinates, i.e. they are stored to
+        # the slice set stored to the bunch (see the method _slice(...)),
+        # which is removed by PyHEADTAIL when the coordinates change.
+        stored_slice_sets = getattr(bunch, '_slice_sets', None)
+        stored_slice_set = None
+        if isinstance(stored_slice_sets, dict):
+            stored_slice_set = stored_slice_sets.get(self._slicer, None)
+            if (stored_slice_set is not None) and \
+                    (stored_slice_set.z_bins is not slice_set.z_bins):
+                stored_slice_set = None
+
+        cuts = getattr(stored_slice_set, '_feedback_uniform_cuts', None)
+        if cuts is not None:
+            return cuts
+
+        z_cut_tail, z_cut_head = self._slicer.get_long_cuts(bunch)
+        slice_width = (z_cut_head - z_cut_tail) / float(slice_set.n_slices)
+        if (slice_set.z_bins[0] != z_cut_tail) or \
+                (abs(slice_set.z_bins[-1] - z_cut_head) > 1e-7*slice_width):
+            return None
+
+        cuts = (z_cut_tail, slice_width)
+        if stored_slice_set is not None:
+            stored_slice_set._feedback_uniform_cuts = cuts
+        return cuts
+
+    def _apply_kicks(self, kicks, local_slice_sets, bunch_list):
+        if self._kicker_axis == 'divergence':
+            coordinates = {'x': 'xp', 'y': 'yp'}
+        elif self._kicker_axis == 'displacement':
+            coordinates = {'x': 'x', 'y': 'y'}
+        else:
+            raise ValueError('Unknown axis')
+
+        for signal, plane, local_sets in kicks:
+            if plane not in coordinates:
+                raise ValueError('Unknown plane')
+
+        # the planes, which share the signal bins, are kicked in one pass
+        if (len(kicks) == 2) and (kicks[0][2] == kicks[1][2]) and \
+                (len(kicks[0][0]) == len(kicks[1][0])):
+            passes = [kicks]
+        else:
+            passes = [[kick] for kick in kicks]
+
+        uniform_cuts = self._uniform_bins(local_slice_sets, bunch_list)
+
+        for kick_pass in passes:
+            signal, plane, local_sets = kick_pass[0]
+
+            if uniform_cuts is not None:
+                self._apply_uniform_kicks(kick_pass, uniform_cuts,
+                                          local_slice_sets, bunch_list,
+                                          coordinates)
+                continue
+
+            kick_map = self._particle_bins(local_slice_sets, local_sets,
+                                           len(signal))
             n_slices_per_bunch = local_slice_sets[0].n_slices
-        
-            for slice_set, bunch_idx, bunch in zip(local_slice_sets,
-                                                   local_sets, bunch_list):
-                idx_from = bunch_idx * n_slices_per_bunch
-                idx_to = (bunch_idx + 1) * n_slices_per_bunch
-        
-                p_idx = slice_set.particles_within_cuts
-                s_idx = slice_set.slice_index_of_particle.take(p_idx)
-        
-                if self._kicker_axis == 'divergence':
-                    if plane == 'x':
-                        correction_x = np.array(signal[idx_from:idx_to], copy=False)
-                        bunch.xp[p_idx] -= correction_x[s_idx]
-                    elif plane == 'y':
-                        correction_y = np.array(signal[idx_from:idx_to], copy=False)
-                        bunch.yp[p_idx] -= correction_y[s_idx]
-                    else:
-                        raise ValueError('Unknown plane')
-        
-                elif self._kicker_axis == 'displacement':
-                    if plane == 'x':
-                        correction_x = np.array(signal[idx_from:idx_to], copy=False)
-                        bunch.x[p_idx] -= correction_x[s_idx]
-                    elif plane == 'y':
-                        correction_y = np.array(signal[idx_from:idx_to], copy=False)
-                        bunch.y[p_idx] -= correction_y[s_idx]
-                    else:
-                        raise ValueError('Unknown plane')
+            for (s_idx, offset), bunch in zip(kick_map, bunch_list):
+                if len(kick_pass) == 2:
+                    signal_2, plane_2, _ = kick_pass[1]
+                    cython_kick(s_idx, n_slices_per_bunch, offset,
+                                signal, getattr(bunch, coordinates[plane]),
+                                signal_2, getattr(bunch, coordinates[plane_2]))
                 else:
-                    raise ValueError('Unknown axis')
-    
+                    cython_kick(s_idx, n_slices_per_bunch, offset,
+                                signal, getattr(bunch, coordinates[plane]))
+
+    def _apply_uniform_kicks(self, kick_pass, uniform_cuts, local_slice_sets,
+                             bunch_list, coordinates):
+        # The slice indexes are computed from the z coordinates in the same
+        # pass with the kick, i.e. no index arrays are allocated
+        signal, plane, local_sets = kick_pass[0]
+        n_slices_per_bunch = local_slice_sets[0].n_slices
+
+        for (z_cut_tail, slice_width), bunch_idx, bunch in zip(uniform_cuts,
+                                                               local_sets,
+                                                               bunch_list):
+            offset = len(signal) - 1 - bunch_idx * n_slices_per_bunch
+            if len(kick_pass) == 2:
+                signal_2, plane_2, _ = kick_pass[1]
+                cython_uniform_kick(bunch.z, z_cut_tail, slice_width,
+                                    n_slices_per_bunch, offset,
+                                    signal, getattr(bunch, coordinates[plane]),
+                                    signal_2,
+                                    getattr(bunch, coordinates[plane_2]))
+            else:
+                cython_uniform_kick(bunch.z, z_cut_tail, slice_width,
+                                    n_slices_per_bunch, offset,
+                                    signal, getattr(bunch, coordinates[plane]))
+
 class OneboxFeedback(GenericOneTurnMapObject):
     """ An transverse feedback object for the one turn map in PyHEADTAIL.
 
@@ -400,6 +1623,12 @@ class OneboxFeedback(GenericOneTurnMapObject):
     applied by using signal processors. The axises for the pickup signal and
     the correction are by default same, but they can be also specified to be
     different (e.g. displacement and divergence).
+
+    The slice indexes of the particles are shared with the slice set stored to
+    the bunch by an earlier object using the same slicer. The stored slice
+    sets must be removed by calling bunch.clean_slices() whenever the
+    longitudinal coordinates change (as done by the longitudinal trackers of
+    PyHEADTAIL), otherwise the particles are sliced by using outdated indexes.
     """
 
     def __init__(self, gain, slicer, processors_x, processors_y,
@@ -415,17 +1644,46 @@ class OneboxFeedback(GenericOneTurnMapObject):
             Separate values can be set to x and y planes by giving two values
             in a tuple.
         slicer : PyHEADTAIL slicer object
-        processors_x : list
+        processors_x : list or ProcessorChain
             A list of signal processors for the x-plane
-        processors_y : list
-            A list of signal processors for the y-plane
+        processors_y : list or ProcessorChain
+            A list of signal processors for the y-plane. If the same object
+            is given to both planes (processors_y is processors_x), the
+            signals are processed together as a 2D signal with a shape
+            (2, n_bins). Only the identity is checked, i.e. separate lists
+            are processed separately even if the processors are configured
+            identically. A shared list can not include registers, because
+            the registers use the tune of a single plane, i.e. a kicker
+            reading multiple pickups can share its processors but the pickups
+            can not.
         pickup_axis : str
             A axis, which values are used as a pickup signal
         kicker_axis : str
             A axis, to which the correction is applied. If None, the axis is
             same as the pickup axis
         mpi : bool
-            If True, data from multiple bunches are gathered by using MPI
+            If True, data from multiple bunches are gathered by using MPI.
+            Only the bunches within the time support of the signal processors
+            (see time_support in core.py) are exchanged between the ranks.
+            The signals of the local bunches are read and processed through
+            the leading processors supporting the segment extension (e.g.
+            ChargeWeighter and ADC, see core.py) in the ranks owning
+            the bunches, and only the processed segments are exchanged.
+        bunch_by_bunch : bool
+            If True, each bunch is a single slice and the bunches of the
+            superbunch are identified by the bucket ids of the particles,
+            i.e. the slicer must have a single slice. The circumference and
+            h_bunch are read from the slicer or the superbunch.
+        profile : bool
+            If True, the signal processors are profiled and the results can
+            be read by using the methods profile_summary() and profile_stats()
+        timeline : Timeline
+            If given, the slice set gathering, the MPI communication, the
+            signal processors and the kicks are recorded to the timeline
+        dtype : numpy dtype
+            The precision of the signal processing, i.e. np.float32 or
+            np.float64. If None, the precision of the signals is kept. The
+            kicks are always applied in double precision.
         phase_x : float
             Initial betatron phase rotation for the signal in x-plane in the
             units of radians
@@ -453,6 +1711,33 @@ class OneboxFeedback(GenericOneTurnMapObject):
         if (self._signal_x is None) and (self._signal_y is None):
             self._init_signals(bunch_list, signal_slice_sets_x, signal_slice_sets_y)
 
+        if self._shared_chain:
+            kick_parameters, kick_signal = self._process_shared(signal_slice_sets_x)
+            if kick_signal is not None:
+                kick_signals = (kick_signal[0], kick_signal[1])
+            else:
+                kick_signals = (None, None)
+
+            kicks = []
+            for kick_signal_i, plane, gain, beta, loc_signal_sets in zip(
+                    kick_signals, ('x', 'y'), (self._gain_x, self._gain_y),
+                    (self._beta_x, self._beta_y),
+                    (self._loc_signal_sets_x, self._loc_signal_sets_y)):
+                if kick_signal_i is not None:
+                    kick_signal_i = self._apply_gain(kick_signal_i, gain, plane,
+                                                     kick_parameters)
+
+                    if self._pickup_axis == 'displacement' and self._kicker_axis == 'divergence':
+                        kick_signal_i /= beta
+                    elif self._pickup_axis == 'divergence' and self._kicker_axis == 'displacement':
+                        kick_signal_i *= beta
+
+                kicks.append((kick_signal_i, plane, loc_signal_sets))
+
+            self._kick_planes(kicks, local_slice_sets, bunch_list)
+            return
+
+        kicks = []
 
         if self._processors_x is not None:
             self._read_signal(self._signal_x, signal_slice_sets_x, 'x',
@@ -464,15 +1749,15 @@ class OneboxFeedback(GenericOneTurnMapObject):
                                                        slice_sets=signal_slice_sets_x)
             
             if kick_signal_x is not None:
-                kick_signal_x = kick_signal_x * self._gain_x
+                kick_signal_x = self._apply_gain(kick_signal_x, self._gain_x, 'x',
+                                                 kick_parameters_x)
     
                 if self._pickup_axis == 'displacement' and self._kicker_axis == 'divergence':
-                    kick_signal_x = kick_signal_x / self._beta_x
+                    kick_signal_x /= self._beta_x
                 elif self._pickup_axis == 'divergence' and self._kicker_axis == 'displacement':
-                    kick_signal_x = kick_signal_x * self._beta_x
+                    kick_signal_x *= self._beta_x
                     
-            self._kick_bunches(kick_signal_x, 'x', local_slice_sets, bunch_list,
-                                self._loc_signal_sets_x)
+            kicks.append((kick_signal_x, 'x', self._loc_signal_sets_x))
         
         if self._processors_y is not None:
 
@@ -485,15 +1770,18 @@ class OneboxFeedback(GenericOneTurnMapObject):
                                                        slice_sets=signal_slice_sets_y)
             
             if kick_signal_y is not None:
-                kick_signal_y = kick_signal_y * self._gain_y
+                kick_signal_y = self._apply_gain(kick_signal_y, self._gain_y, 'y',
+                                                 kick_parameters_y)
     
                 if self._pickup_axis == 'displacement' and self._kicker_axis == 'divergence':
-                    kick_signal_y = kick_signal_y / self._beta_y
+                    kick_signal_y /= self._beta_y
                 elif self._pickup_axis == 'divergence' and self._kicker_axis == 'displacement':
-                    kick_signal_y = kick_signal_y * self._beta_y
+                    kick_signal_y *= self._beta_y
                     
-            self._kick_bunches(kick_signal_y, 'y', local_slice_sets, bunch_list,
-                                self._loc_signal_sets_y)
+            kicks.append((kick_signal_y, 'y', self._loc_signal_sets_y))
+
+        # both planes are kicked in one pass over the particles
+        self._kick_planes(kicks, local_slice_sets, bunch_list)
     
 
 class PickUp(GenericOneTurnMapObject):
@@ -504,6 +1792,12 @@ class PickUp(GenericOneTurnMapObject):
     processing (including, for example, bandwidth limitations and noise) can be
     implemented by using signal processors. The signal can be transferred to
     kicker(s) by putting registers to the signal processor chains.
+
+    The slice indexes of the particles are shared with the slice set stored to
+    the bunch by an earlier object using the same slicer. The stored slice
+    sets must be removed by calling bunch.clean_slices() whenever the
+    longitudinal coordinates change (as done by the longitudinal trackers of
+    PyHEADTAIL), otherwise the particles are sliced by using outdated indexes.
     """
 
     def __init__(self, slicer, processors_x, processors_y, location_x, beta_x,
@@ -513,10 +1807,18 @@ class PickUp(GenericOneTurnMapObject):
         Parameters
         ----------
         slicer : PyHEADTAIL slicer object
-        processors_x : list
+        processors_x : list or ProcessorChain
             A list of signal processors for the x-plane
-        processors_y : list
-            A list of signal processors for the y-plane
+        processors_y : list or ProcessorChain
+            A list of signal processors for the y-plane. If the same object
+            is given to both planes (processors_y is processors_x), the
+            signals are processed together as a 2D signal with a shape
+            (2, n_bins). Only the identity is checked, i.e. separate lists
+            are processed separately even if the processors are configured
+            identically. A shared list can not include registers, because
+            the registers use the tune of a single plane, i.e. a kicker
+            reading multiple pickups can share its processors but the pickups
+            can not.
             used as a signal source in the y-plane
         location_x : float
             A location of the pickup in x-plane in the units of betatron phase
@@ -529,7 +1831,28 @@ class PickUp(GenericOneTurnMapObject):
         beta_y : float
             A value of the y-plane beta function in the pickup location
         mpi : bool
-            If True, data from multiple bunches are gathered by using MPI
+            If True, data from multiple bunches are gathered by using MPI.
+            Only the bunches within the time support of the signal processors
+            (see time_support in core.py) are exchanged between the ranks.
+            The signals of the local bunches are read and processed through
+            the leading processors supporting the segment extension (e.g.
+            ChargeWeighter and ADC, see core.py) in the ranks owning
+            the bunches, and only the processed segments are exchanged.
+        bunch_by_bunch : bool
+            If True, each bunch is a single slice and the bunches of the
+            superbunch are identified by the bucket ids of the particles,
+            i.e. the slicer must have a single slice. The circumference and
+            h_bunch are read from the slicer or the superbunch.
+        profile : bool
+            If True, the signal processors are profiled and the results can
+            be read by using the methods profile_summary() and profile_stats()
+        timeline : Timeline
+            If given, the slice set gathering, the MPI communication, the
+            signal processors and the kicks are recorded to the timeline
+        dtype : numpy dtype
+            The precision of the signal processing, i.e. np.float32 or
+            np.float64. If None, the precision of the signals is kept. The
+            kicks are always applied in double precision.
         phase_x : float
             Initial betatron phase rotation of the signal in x-plane in the
             units of radians
@@ -545,31 +1868,31 @@ class PickUp(GenericOneTurnMapObject):
              beta_y=beta_y, **kwargs)
 
     def track(self, bunch):
-        
+
         bunch_list, local_slice_sets, signal_slice_sets_x, signal_slice_sets_y = self._get_slice_sets(bunch)
         if (self._signal_x is None) and (self._signal_y is None):
             self._init_signals(bunch_list, signal_slice_sets_x, signal_slice_sets_y)
-        
-        
-        if self._processors_x is not None:    
-    
-    
-        
+
+        if self._shared_chain:
+            self._process_shared(signal_slice_sets_x)
+            return
+
+        if self._processors_x is not None:
             self._read_signal(self._signal_x, signal_slice_sets_x, 'x',
-                               self._phase_x, self._beta_x)   
-            
+                               self._phase_x, self._beta_x)
+
             end_parameters_x, end_signal_x = process(self._parameters_x,
                                                        self._signal_x,
                                                        self._processors_x,
                                                        slice_sets=signal_slice_sets_x)
-        
+
         if self._processors_y is not None:
             if self._signal_y is None:
                 self._init_signals(bunch_list, signal_slice_sets_x, signal_slice_sets_y)
 
             self._read_signal(self._signal_y, signal_slice_sets_y, 'y',
-                               self._phase_y, self._beta_y)   
-            
+                               self._phase_y, self._beta_y)
+
             end_parameters_y, end_signal_y = process(self._parameters_y,
                                                        self._signal_y,
                                                        self._processors_y,
@@ -584,7 +1907,16 @@ class Kicker(GenericOneTurnMapObject):
     processing (including, for example, bandwidth limitations and noise) can be
     implemented by using signal processors. The input signals for the kicker
     are the lists of register objects given as a input paramter.
+
+    The slice indexes of the particles are shared with the slice set stored to
+    the bunch by an earlier object using the same slicer. The stored slice
+    sets must be removed by calling bunch.clean_slices() whenever the
+    longitudinal coordinates change (as done by the longitudinal trackers of
+    PyHEADTAIL), otherwise the particles are sliced by using outdated indexes.
     """
+    # the signals are read from the registers
+    _local_readout = False
+
     def __init__(self, gain, slicer, processors_x, processors_y,
                  registers_x, registers_y, location_x, beta_x,
                  location_y, beta_y, combiner='vector_sum', mpi=False,
@@ -599,10 +1931,18 @@ class Kicker(GenericOneTurnMapObject):
             Separate values can be set to x and y planes by giving two values
             in a tuple.
         slicer : PyHEADTAIL slicer object
-        processors_x : list
+        processors_x : list or ProcessorChain
             A list of signal processors for the x-plane
-        processors_y : list
-            A list of signal processors for the y-plane
+        processors_y : list or ProcessorChain
+            A list of signal processors for the y-plane. If the same object
+            is given to both planes (processors_y is processors_x), the
+            signals are processed together as a 2D signal with a shape
+            (2, n_bins). Only the identity is checked, i.e. separate lists
+            are processed separately even if the processors are configured
+            identically. A shared list can not include registers, because
+            the registers use the tune of a single plane, i.e. a kicker
+            reading multiple pickups can share its processors but the pickups
+            can not.
         registers_x : list
             A list of register object(s) (from pickup(s) processor chain(s)
             used as a signal source in the x-plane
@@ -623,7 +1963,27 @@ class Kicker(GenericOneTurnMapObject):
             A combiner, which is used for combining signals from
             the registers.
         mpi : bool
-            If True, data from multiple bunches are gathered by using MPI
+            If True, data from multiple bunches are gathered by using MPI.
+            Only the bunches within the time support of the signal processors
+            (see time_support in core.py) are exchanged between the ranks.
+            The kicker processes the bunches of the pickup signals, i.e.
+            the time supports of the kicker processors are included to the
+            signals gathered by the pickups through the registers.
+        bunch_by_bunch : bool
+            If True, each bunch is a single slice and the bunches of the
+            superbunch are identified by the bucket ids of the particles,
+            i.e. the slicer must have a single slice. The circumference and
+            h_bunch are read from the slicer or the superbunch.
+        profile : bool
+            If True, the signal processors are profiled and the results can
+            be read by using the methods profile_summary() and profile_stats()
+        timeline : Timeline
+            If given, the slice set gathering, the MPI communication, the
+            signal processors and the kicks are recorded to the timeline
+        dtype : numpy dtype
+            The precision of the signal processing, i.e. np.float32 or
+            np.float64. If None, the precision of the signals is kept. The
+            kicks are always applied in double precision.
         """
 
         if isinstance(combiner, (str,unicode)):
@@ -669,19 +2029,40 @@ class Kicker(GenericOneTurnMapObject):
             self._combiner_y = combiner[1]
         else:
             raise ValueError('Unclear combiner input type')
-        
+
+        self._registers_x = registers_x
+        self._registers_y = registers_y
+        # the parameters of the planes and the combined parameters of the
+        # shared processors (see _shared_parameters(...))
+        self._shared_parameters_cache = (None, None, None)
+
         super(self.__class__, self).__init__(gain, slicer, processors_x,
              processors_y=processors_y, pickup_axis='divergence',
              kicker_axis='divergence', mpi=mpi, location_x=location_x,
              location_y=location_y,beta_x=beta_x, beta_y=beta_y, **kwargs)
 
+        # The processors of the kicker are added to the time supports of
+        # the registers, i.e. the pickups gather the bunches required by
+        # the kicker (see Register.time_support)
+        for registers, processors in ((registers_x, self._processors_x),
+                                      (registers_y, self._processors_y)):
+            if (registers is not None) and (processors is not None):
+                for register in registers:
+                    if hasattr(register, 'add_reader'):
+                        register.add_reader(processors)
+
     def track(self, bunch):
         
         bunch_list, local_slice_sets, signal_slice_sets_x, signal_slice_sets_y = self._get_slice_sets(bunch)
         
         if (self._signal_x is None) and (self._signal_y is None):
             self._init_signals(bunch_list, signal_slice_sets_x, signal_slice_sets_y)
+
+        if self._shared_chain:
+            self._track_shared(local_slice_sets, bunch_list, signal_slice_sets_x)
+            return
             
+        kicks = []
         if self._processors_x is not None:
             parameters_x, signal_x = self._combiner_x.process()   
             parameters_x, signal_x = process(parameters_x,
@@ -690,9 +2071,8 @@ class Kicker(GenericOneTurnMapObject):
                                                        slice_sets=signal_slice_sets_x)
             if signal_x is not None:
     
-                signal_x = signal_x * self._gain_x
-                self._kick_bunches(signal_x, 'x', local_slice_sets,
-                                    bunch_list, self._loc_signal_sets_x)
+                signal_x = self._apply_gain(signal_x, self._gain_x, 'x', parameters_x)
+                kicks.append((signal_x, 'x', self._loc_signal_sets_x))
         
         if self._processors_y is not None:
 #            print('Kick y, gain: ' + str(self._gain_y))
@@ -702,6 +2082,133 @@ class Kicker(GenericOneTurnMapObject):
                                                        self._processors_y,
                                                        slice_sets=signal_slice_sets_y)
             if kick_signal_y is not None:
-                kick_signal_y = kick_signal_y * self._gain_y
-                self._kick_bunches(kick_signal_y, 'y', local_slice_sets,
-                                    bunch_list, self._loc_signal_sets_y)
+                kick_signal_y = self._apply_gain(kick_signal_y, self._gain_y, 'y',
+                                                 kick_parameters_y)
+                kicks.append((kick_signal_y, 'y', self._loc_signal_sets_y))
+
+        self._kick_planes(kicks, local_slice_sets, bunch_list)
+
+    def _register_window(self, registers):
+        # The window of the bunches in the signals of the registers in
+        # the units of z/(c*beta), which is determined from the original
+        # bin set of the pickup signals. None, if the registers are empty.
+        window = None
+        for register in registers:
+            parameters = getattr(register, 'parameters', None)
+            if parameters is None:
+                return None
+            previous_parameters = parameters.previous_parameters
+            if len(previous_parameters) > 0:
+                parameters = previous_parameters[0]
+
+            bin_edges = parameters['bin_edges']
+            if window is None:
+                window = (-np.max(bin_edges), -np.min(bin_edges))
+            else:
+                window = (min(window[0], -np.max(bin_edges)),
+                          max(window[1], -np.min(bin_edges)))
+        return window
+
+    def _plane_registers(self, processors):
+        registers = []
+        if (processors is self._processors_x) and (self._registers_x is not None):
+            registers.extend(self._registers_x)
+        if (processors is self._processors_y) and (self._registers_y is not None):
+            registers.extend(self._registers_y)
+        return registers
+
+    def _signal_window(self, processors, local_slice_sets, beta_beam):
+        # With MPI, the kicker processes the bunches of the pickup signals,
+        # which are gathered in the ranks of the pickups
+        if self._mpi:
+            window = self._register_window(self._plane_registers(processors))
+            if window is not None:
+                return window
+        return super(Kicker, self)._signal_window(processors, local_slice_sets,
+                                                  beta_beam)
+
+    def _bunch_set_key(self, bunch_list, local_slice_sets):
+        # The windows of the gathered bunches are determined from the bins of
+        # the pickup signals, which change with the bunches of the pickups
+        key = super(Kicker, self)._bunch_set_key(bunch_list, local_slice_sets)
+        registers = (self._plane_registers(self._processors_x) +
+                     self._plane_registers(self._processors_y))
+        return key + (self._register_window(registers),)
+
+    def _gather_windows(self, edges, local_slice_sets, beta_beam):
+        registers = (self._plane_registers(self._processors_x) +
+                     self._plane_registers(self._processors_y))
+        window = self._register_window(registers)
+        if (window is None) or (len(registers) == 0):
+            return super(Kicker, self)._gather_windows(edges, local_slice_sets,
+                                                       beta_beam)
+        return np.tile(window, (len(edges), 1))
+
+    def _prepare_jobs(self, signal_slice_sets_x, signal_slice_sets_y):
+        # The input parameters are known from the prepared registers, i.e.
+        # the pickups must be prepared before the kicker
+        parameters_x = self._combiner_x.prepare()
+        parameters_y = self._combiner_y.prepare()
+
+        if self._shared_chain:
+            if (parameters_x is None) or (parameters_y is None):
+                return []
+            parameters = self._shared_parameters(parameters_x, parameters_y)
+            return [(self._processors_x, parameters,
+                     {'n_channels': 2, 'slice_sets': signal_slice_sets_x})]
+
+        jobs = []
+        if (self._processors_x is not None) and (parameters_x is not None):
+            jobs.append((self._processors_x, parameters_x,
+                         {'slice_sets': signal_slice_sets_x}))
+        if (self._processors_y is not None) and (parameters_y is not None):
+            jobs.append((self._processors_y, parameters_y,
+                         {'slice_sets': signal_slice_sets_y}))
+        return jobs
+
+    def _shared_parameters(self, parameters_x, parameters_y):
+        # The parameters of the 2D signal differ only by the beta functions of
+        # the planes. The combiners return the same parameters on every turn,
+        # i.e. the parameters are built again only when the parameters of
+        # either plane are replaced.
+        cached_x, cached_y, parameters = self._shared_parameters_cache
+        if (parameters_x is cached_x) and (parameters_y is cached_y):
+            return parameters
+
+        if parameters_x['location'] != parameters_y['location']:
+            raise ValueError('The locations of the x and y planes must ' +
+                             'be equal, when the planes share processors.')
+        parameters = parameters_x.replace(
+                beta=np.array([[parameters_x['beta']],
+                               [parameters_y['beta']]]))
+        self._shared_parameters_cache = (parameters_x, parameters_y,
+                                         parameters)
+        return parameters
+
+    def _track_shared(self, local_slice_sets, bunch_list, signal_slice_sets):
+        parameters_x, signal_x = self._combiner_x.process()
+        parameters_y, signal_y = self._combiner_y.process()
+
+        if (signal_x is None) or (signal_y is None):
+            return
+
+        # the combined signals are stacked into a 2D signal, which is
+        # processed at once
+        if (self._signal_xy is None) or \
+                (self._signal_xy.shape != (2, len(signal_x))):
+            self._signal_xy = np.zeros((2, len(signal_x)))
+        np.copyto(self._signal_xy[0], signal_x)
+        np.copyto(self._signal_xy[1], signal_y)
+
+        parameters = self._shared_parameters(parameters_x, parameters_y)
+        kick_parameters, kick_signal = process(parameters, self._signal_xy,
+                                               self._processors_x,
+                                               slice_sets=signal_slice_sets)
+        if kick_signal is not None:
+            kick_signal_x = self._apply_gain(kick_signal[0], self._gain_x, 'x',
+                                             kick_parameters)
+            kick_signal_y = self._apply_gain(kick_signal[1], self._gain_y, 'y',
+                                             kick_parameters)
+            self._kick_planes([(kick_signal_x, 'x', self._loc_signal_sets_x),
+                               (kick_signal_y, 'y', self._loc_signal_sets_y)],
+                              local_slice_sets, bunch_list)
@@ -1,5 +1,4 @@
 import numpy as np
-import scipy.special as special
 
 """ This file contains dimensionless impulse responses function for different
 analog filters, which can be used in different signal processor implementations
@@ -36,6 +35,7 @@ def normalized_highpass(max_impulse_length):
 def normalized_phase_linearized_lowpass(max_impulse_length):
     """Phase linearized version of the normal lowpass (RC,
     singe poll roll-off) filter. Formula derived by Gerd Kotzian."""
+    import scipy.special as special
 
     def response_function(x):
         if x == 0.:
@@ -1,7 +1,7 @@
 from abc import ABCMeta, abstractmethod, abstractproperty
 import numpy as np
 from scipy.constants import c, pi
-from ..core import default_macros
+from ..core import default_macros, signal_dtype, to_values
 
 """ This file contains dimensionless impulse responses function for different
 analog filters, which can be used in different signal processor implementations
@@ -45,29 +45,61 @@ class Addition(object):
 
         self.signal_classes = (0,0)
 
-        self.extensions = []
+        self.extensions = ['output_buffer']
         self._macros = [] + default_macros(self, 'Addition', **kwargs)
 
         if self._seed not in ['bin_length','bin_midpoint','signal']:
             self.extensions.append('bunch')
             self.required_variables = [self._seed]
 
+        # the addend of a segment depends only on the segment
+        if (self._normalization is None) or self._normalization.startswith('segment'):
+            self.extensions.append('segment')
+
     @abstractmethod
     def addend_function(self, seed):
         pass
 
-    def process(self,parameters, signal, slice_sets = None, *args, **kwargs):
+    def time_support(self, bin_spacings):
+        # the total normalizations depend on the whole signal
+        if (self._normalization is not None) and self._normalization.startswith('total'):
+            return np.inf, np.inf, bin_spacings[-1]
+        return 0., 0., bin_spacings[-1]
+
+    def prepare(self, parameters, slice_sets = None, *args, **kwargs):
+        # the addend can be calculated in advance, if it does not depend on the signal
+        if (self._addend is None) and (not self._recalculate_addend) and (self._seed != 'signal') \
+                and (('bunch' not in self.extensions) or (slice_sets is not None)):
+            self.__calculate_addend(parameters, np.zeros(len(parameters.bin_edges)), slice_sets)
+
+        # the codes of a fixed-point signal are converted to values
+        if parameters['scale'] is not None:
+            parameters = parameters.replace(scale=None)
+        return parameters
+
+    def process(self,parameters, signal, slice_sets = None, out=None, *args, **kwargs):
+
+        # the codes of a fixed-point signal are converted to values (see core.py), because the addend is given in
+        # the units of the values
+        if parameters['scale'] is not None:
+            parameters, signal = to_values(parameters, signal)
 
         if (self._addend is None) or self._recalculate_addend:
             self.__calculate_addend(parameters, signal, slice_sets)
 
-        output_signal = signal + self._addend
+        # the addend is applied in the precision of the signal
+        output_signal = np.add(signal, self._addend, out=out, dtype=signal_dtype(signal))
 
         # process the signal
         return parameters, output_signal
 
     def __calculate_addend(self,parameters, signal, slice_sets):
-        self._addend = np.zeros(len(signal))
+        # the signal seed is calculated separately for each channel of a multi-channel signal, otherwise the same
+        # values are used for all the channels
+        if self._seed == 'signal':
+            self._addend = np.zeros(np.shape(signal))
+        else:
+            self._addend = np.zeros(np.shape(signal)[-1])
 
         if self._seed == 'ones':
             self._addend = self._addend + 1.
@@ -88,7 +120,7 @@ class Addition(object):
         elif self._seed == 'signal':
             np.copyto(self._addend,signal)
         else:
-            if len(signal) == len(slice_sets) * (len(slice_sets[0].z_bins) - 1):
+            if np.shape(signal)[-1] == len(slice_sets) * slice_sets[0].n_slices:
                 start_idx = 0
                 for slice_set in slice_sets:
                     seed = getattr(slice_set,self._seed)
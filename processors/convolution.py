@@ -2,10 +2,9 @@ import numpy as np
 from abc import ABCMeta, abstractmethod
 
 from ..core import bin_widths, bin_mids, bin_edges_to_z_bins
-from ..core import default_macros, Parameters
+from ..core import default_macros, Parameters, cached_init, signal_dtype
+from ..core import is_fixed_point, fixed_point_coefficients, fixed_point_output
 from scipy.constants import pi
-import scipy.integrate as integrate
-from scipy.interpolate import UnivariateSpline
 import abstract_filter_responses
 
 """Signal processors based on convolution operation.
@@ -17,7 +16,22 @@ import abstract_filter_responses
 class Convolution(object):
     __metaclass__ = ABCMeta
 
-    def __init__(self,**kwargs):
+    # True if the response value of a bin depends only on the edges of the bin, i.e. the response function can be
+    # calculated for any set of bins at once
+    _pointwise_response = False
+
+    def __init__(self, coefficient_bits=18, accumulator_bits=48, **kwargs):
+        """
+        Parameters
+        ----------
+        coefficient_bits : int
+            A number of bits in the coefficients of the impulse responses, which are used for fixed-point signals
+        accumulator_bits : int
+            A width of the accumulator for fixed-point signals
+        """
+
+        self._coefficient_bits = coefficient_bits
+        self._accumulator_bits = accumulator_bits
 
         self._dashed_impulse_responses = None
         self._impulses_from_segments = None
@@ -25,26 +39,50 @@ class Convolution(object):
 
         self._n_seg = None
         self._n_bins = None
+        self._products = None
+        self._dtype = None
 
-        self.extensions = []
+        # integer arithmetic for fixed-point signals
+        self._fraction_bits = None
+        self._accumulator = None
+        self._codes = None
+
+        self.extensions = ['output_buffer', 'linear']
         self._macros = [] + default_macros(self, 'Convolution', **kwargs)
 
-    def _init_convolution(self, parameters):
+    def time_support(self, bin_spacings):
+        # the impulse response is integrated over the bins, i.e. the lags are extended by a half bin
+        bin_spacing = bin_spacings[-1]
+        lag_from, lag_to = self._impulse_range(bin_spacing)
+        return max(lag_to + 0.5*bin_spacing, 0.), max(0.5*bin_spacing - lag_from, 0.), bin_spacing
 
+    def _impulse_range(self, bin_spacing):
+        # the range of the lags [s] where the impulse response is non-zero. A positive lag delays the signal.
+        return -1.*self.time_scale, self.time_scale
+
+    def _init_convolution(self, parameters):
 
         # the parameters of the input signal
         self._n_seg = parameters['n_segments']
         self._n_bins = parameters['n_bins_per_segment']
-        bin_edges = parameters['bin_edges']
 
-        original_segment_length = bin_edges[self._n_bins-1,1] - bin_edges[0,0]
+        # the impulse responses might be loaded from the initialization cache
+        self._products = cached_init(self, parameters, lambda: self._impulse_responses(parameters))
+        self._init_segments(np.dtype(np.float64))
 
-        # a number of impulse values added to the both side of the segments
-        extra_bins = int(np.ceil(self._n_bins/2.))
-#        extra_bins = 0
+    def _init_segments(self, dtype):
+        # the impulse responses and the buffers for the segments in the given precision. For integer arithmetic,
+        # the impulse responses are rounded to fixed-point coefficients
+        products = self._products
+        self._dtype = dtype
 
-        # Reference bin edges for one segment
-        impulse_ref_edges = None
+        if dtype.kind == 'i':
+            impulses, self._fraction_bits = fixed_point_coefficients(products['impulses'], self._coefficient_bits)
+        else:
+            impulses = products['impulses']
+
+        extra_bins = int(products['extra_bins'])
+        n_bins_per_segment = self._n_bins + 2*extra_bins
 
         # ipulse responses for individual segments
         self._dashed_impulse_responses = []
@@ -57,11 +95,51 @@ class Convolution(object):
         for i in xrange(self._n_seg):
             self._impulses_to_segments.append([])
 
-        ref_points = []
+        impulse_ends = np.cumsum(products['impulse_lengths'])
+        target_ends = np.cumsum(products['target_counts'])
 
         for i in xrange(self._n_seg):
-            i_from = i*self._n_bins
-            i_to = (i+1)*self._n_bins
+            cleaned_impulse = np.asarray(impulses[impulse_ends[i]-products['impulse_lengths'][i]:impulse_ends[i]],
+                                         dtype=dtype)
+            target_segments = products['targets'][target_ends[i]-products['target_counts'][i]:target_ends[i]]
+            idx_offset = int(products['idx_offsets'][i])
+
+            self._dashed_impulse_responses.append(cleaned_impulse)
+
+            self._impulses_from_segments.append(np.zeros(len(cleaned_impulse)+idx_offset, dtype=dtype))
+
+            for idx, target_idx in enumerate(target_segments):
+                i_from = idx * n_bins_per_segment + idx_offset + extra_bins
+                i_to = i_from + self._n_bins
+                self._impulses_to_segments[target_idx].append(np.array(self._impulses_from_segments[-1][i_from:i_to], copy=False))
+
+    def _impulse_responses(self, parameters):
+        # Calculates the impulse responses of the segments. The non-zero parts of the responses are returned as
+        # concatenated arrays together with the indexes of the target segments.
+
+        # the parameters of the input signal
+        n_seg = parameters['n_segments']
+        n_bins = parameters['n_bins_per_segment']
+        bin_edges = parameters['bin_edges']
+
+        original_segment_length = bin_edges[n_bins-1,1] - bin_edges[0,0]
+
+        # a number of impulse values added to the both side of the segments
+        extra_bins = int(np.ceil(n_bins/2.))
+#        extra_bins = 0
+
+        # Reference bin edges for one segment
+        impulse_ref_edges = []
+
+        impulses = []
+        idx_offsets = []
+        targets = []
+
+        ref_points = []
+
+        for i in xrange(n_seg):
+            i_from = i*n_bins
+            i_to = (i+1)*n_bins
 
             # original bins corresponing to the signal
             org_edges = bin_edges[i_from:i_to, :]
@@ -82,51 +160,38 @@ class Convolution(object):
             # the bin sets in this case.
             ref_points.append(np.mean(bin_edges_to_z_bins(org_edges)))
 
-            if impulse_ref_edges is None:
-                impulse_ref_edges = edges
-            else:
-                impulse_ref_edges = np.concatenate((impulse_ref_edges, edges), axis=0)
-
-        # calculats the impulse response values for each segment
-        for i, ref_point in enumerate(ref_points):
-            # sets the zero point of the bin set to be in the middle of the segment
-            impulse_edges = impulse_ref_edges-ref_point
+            impulse_ref_edges.append(edges)
 
-            # sets the midpoint of the closest bin to the zero to be zero
-            mids = bin_mids(impulse_edges)
-            min_max = np.min(mids[mids>=0])
-            max_min = np.min(-1.*mids[mids<0])
-            mean_width = np.mean(bin_widths(impulse_edges))
+        impulse_ref_edges = np.concatenate(impulse_ref_edges, axis=0)
 
-            mid_offset = 0.
-            idx_offset = 0
+        n_bins_per_segment = n_bins + 2*extra_bins
 
-            if min(min_max, max_min) < mean_width/10.:
-                pass
+        # for a uniform bin set, where the segments are located on a regular lattice, the impulse responses
+        # of the segments are shifted copies of each other and can be calculated at once
+        lattice = self._segment_lattice(parameters, n_bins_per_segment)
+        if lattice is not None:
+            lattice, spacing = lattice
+            lattice_responses, lattice_idx_offset = self._lattice_responses(lattice, spacing,
+                                                                            impulse_ref_edges[:n_bins_per_segment],
+                                                                            ref_points[0], original_segment_length)
 
-            elif min_max < max_min:
-                if min_max < mean_width:
-                    mid_offset = min_max
-                    idx_offset = 1
+        # calculats the impulse response values for each segment
+        for i, ref_point in enumerate(ref_points):
+            if lattice is not None:
+                dashed_impulse_response = np.concatenate([lattice_responses[d] for d in lattice - lattice[i]])
+                idx_offset = lattice_idx_offset
             else:
-                if max_min < mean_width:
-                    mid_offset = -1 * max_min
-
-            impulse_edges = impulse_edges - mid_offset
-
-            # calculates impulse response for the determined bin set
-            dashed_impulse_response = self.response_function(impulse_edges, self._n_seg,
-                                                                           original_segment_length)
+                dashed_impulse_response, idx_offset = self._segment_response(impulse_ref_edges - ref_point,
+                                                                             original_segment_length)
 
             cleaned_impulse = np.array([])
+
             # a list of segment indexes where impulse response is non zero
             target_segments = []
 
             # cleans the calculated impulse response, i.e. removes the segments where
             # response is zero.
-            n_bins_per_segment = self._n_bins + 2*extra_bins
-
-            for k in xrange(self._n_seg):
+            for k in xrange(n_seg):
 
                 i_from = k * n_bins_per_segment
                 i_to = (k+1) * n_bins_per_segment
@@ -138,14 +203,94 @@ class Convolution(object):
                     target_segments.append(k)
                     cleaned_impulse = np.append(cleaned_impulse, dashed_impulse_response[i_from:i_to])
 
-            self._dashed_impulse_responses.append(cleaned_impulse)
+            impulses.append(cleaned_impulse)
+            idx_offsets.append(idx_offset)
+            targets.append(target_segments)
 
-            self._impulses_from_segments.append(np.zeros(len(cleaned_impulse)+idx_offset))
+        return {'impulses': np.concatenate(impulses),
+                'impulse_lengths': np.array([len(impulse) for impulse in impulses], dtype=int),
+                'idx_offsets': np.array(idx_offsets, dtype=int),
+                'targets': np.array([idx for target_segments in targets for idx in target_segments], dtype=int),
+                'target_counts': np.array([len(target_segments) for target_segments in targets], dtype=int),
+                'extra_bins': np.array(extra_bins)}
 
-            for idx, target_idx in enumerate(target_segments):
-                i_from = idx * n_bins_per_segment + idx_offset + extra_bins
-                i_to = i_from + self._n_bins
-                self._impulses_to_segments[target_idx].append(np.array(self._impulses_from_segments[-1][i_from:i_to], copy=False))
+
+    def _mid_offset(self, impulse_edges):
+        # determines an offset, which sets the midpoint of the closest bin to the zero to be zero
+        mids = bin_mids(impulse_edges)
+        min_max = np.min(mids[mids>=0])
+        max_min = np.min(-1.*mids[mids<0])
+        mean_width = np.mean(bin_widths(impulse_edges))
+
+        mid_offset = 0.
+        idx_offset = 0
+
+        if min(min_max, max_min) < mean_width/10.:
+            pass
+
+        elif min_max < max_min:
+            if min_max < mean_width:
+                mid_offset = min_max
+                idx_offset = 1
+        else:
+            if max_min < mean_width:
+                mid_offset = -1 * max_min
+
+        return mid_offset, idx_offset
+
+    def _segment_response(self, impulse_edges, original_segment_length):
+        # calculates the impulse response for a segment, when the zero point of the bin set (impulse_edges) is
+        # in the middle of the segment
+        mid_offset, idx_offset = self._mid_offset(impulse_edges)
+        impulse_edges = impulse_edges - mid_offset
+
+        # calculates impulse response for the determined bin set
+        dashed_impulse_response = self.response_function(impulse_edges, self._n_seg,
+                                                         original_segment_length)
+
+        return dashed_impulse_response, idx_offset
+
+    def _segment_lattice(self, parameters, n_bins_per_segment):
+        # returns the positions of the segments in the units of the lattice spacing and the spacing, if the impulse
+        # responses can be calculated by using the lattice. Otherwise returns None
+        if (not self._pointwise_response) or (self._n_seg < 2):
+            return None
+
+        bin_set = getattr(parameters, 'bin_set', None)
+        if (bin_set is None) or (not bin_set.is_sorted):
+            return None
+
+        offsets = bin_set.segment_offsets
+        spacing = np.min(np.diff(offsets))
+
+        # the extended segments may not overlap
+        if spacing < n_bins_per_segment * bin_set.width:
+            return None
+
+        lattice = np.round(offsets/spacing).astype(int)
+        if np.any(np.abs(lattice*spacing - offsets) > 1e-6*bin_set.width):
+            return None
+
+        return lattice, spacing
+
+    def _lattice_responses(self, lattice, spacing, segment_edges, ref_point, original_segment_length):
+        # calculates the impulse responses of the first segment for all the distances between the segments in
+        # the lattice at once
+        distances = np.unique(np.subtract.outer(lattice, lattice))
+        n_bins = len(segment_edges)
+
+        base_edges = segment_edges - ref_point
+        mid_offset, idx_offset = self._mid_offset(base_edges)
+        base_edges = base_edges - mid_offset
+
+        impulse_edges = base_edges[np.newaxis, :, :] + (distances*spacing)[:, np.newaxis, np.newaxis]
+        responses = self.response_function(impulse_edges.reshape(-1, 2), self._n_seg, original_segment_length)
+
+        lattice_responses = {}
+        for i, distance in enumerate(distances):
+            lattice_responses[distance] = responses[i*n_bins:(i+1)*n_bins]
+
+        return lattice_responses, idx_offset
 
     @abstractmethod
     def response_function(self, impulse_ref_edges, n_seg, original_segment_length):
@@ -153,10 +298,18 @@ class Convolution(object):
         # the given bin set
         pass
 
-    def _apply_convolution(self, parameters, signal):
+    def _apply_convolution(self, parameters, signal, out=None):
 
-        if self._dashed_impulse_responses is None:
+        # the impulse responses are calculated again, if the segments of the signal have been changed
+        if (self._dashed_impulse_responses is None) or (parameters['n_segments'] != self._n_seg) or \
+                (parameters['n_bins_per_segment'] != self._n_bins):
             self._init_convolution(parameters)
+        if is_fixed_point(signal):
+            dtype = np.dtype(np.int64)
+        else:
+            dtype = signal_dtype(signal)
+        if dtype != self._dtype:
+            self._init_segments(dtype)
 
         # calculates the impulses caused by the segments
         for i in xrange(self._n_seg):
@@ -166,23 +319,58 @@ class Convolution(object):
                       np.convolve(self._dashed_impulse_responses[i],
                                   signal[i_from:i_to], mode='same'))
 
-        # gathers the output signal
-        output_signal = np.zeros(len(signal))
+        # gathers the output signal, the products of the integer codes are gathered into the accumulator
+        if dtype.kind == 'i':
+            codes = out
+            if (self._accumulator is None) or (len(self._accumulator) != len(signal)):
+                self._accumulator = np.zeros(len(signal), dtype=np.int64)
+            out = self._accumulator
+        elif out is None:
+            out = np.zeros(len(signal), dtype=self._dtype)
+
         for i in xrange(self._n_seg):
 
             i_from = i*self._n_bins
             i_to = (i+1)*self._n_bins
-#            print np.sum(self._impulses_to_segments[i], axis=0)
-#            print len(np.sum(self._impulses_to_segments[i], axis=0))
-#            print output_signal[i_from:i_to]
-#            print len(output_signal[i_from:i_to])
-            np.copyto(output_signal[i_from:i_to], np.sum(self._impulses_to_segments[i], axis=0))
+            output_segment = out[i_from:i_to]
+            impulses = self._impulses_to_segments[i]
 
-        return output_signal
+            if len(impulses) == 0:
+                output_segment.fill(0.)
+            else:
+                np.copyto(output_segment, impulses[0])
+                for impulse in impulses[1:]:
+                    output_segment += impulse
 
-    def process(self, parameters, signal, *args, **kwargs):
+        if dtype.kind == 'i':
+            return fixed_point_output(out, self._fraction_bits, self._accumulator_bits, codes)
 
-        output_signal = self._apply_convolution(parameters, signal)
+        return out
+
+    def prepare(self, parameters, *args, **kwargs):
+        if self._dashed_impulse_responses is None:
+            self._init_convolution(parameters)
+
+        return parameters
+
+    def process(self, parameters, signal, out=None, *args, **kwargs):
+
+        if is_fixed_point(signal) and ((out is None) or (out.dtype != signal.dtype)):
+            # the codes are written into an own buffer
+            if (self._codes is None) or (self._codes.shape != np.shape(signal)) or \
+                    (self._codes.dtype != signal.dtype):
+                self._codes = np.empty(np.shape(signal), dtype=signal.dtype)
+            out = self._codes
+
+        if np.ndim(signal) == 1:
+            output_signal = self._apply_convolution(parameters, signal, out)
+        else:
+            # the impulse responses are shared by the channels
+            if out is None:
+                out = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
+            for input_channel, output_channel in zip(signal, out):
+                self._apply_convolution(parameters, input_channel, output_channel)
+            output_signal = out
 
         return parameters, output_signal
 
@@ -190,6 +378,8 @@ class Delay(Convolution):
     """ Delays signal in the units of time
     """
 
+    _pointwise_response = True
+
     def __init__(self,delay, **kwargs):
 
         self._delay = delay
@@ -197,6 +387,9 @@ class Delay(Convolution):
         super(self.__class__, self).__init__(**kwargs)
         self.label = 'Delay'
 
+    def _impulse_range(self, bin_spacing):
+        return self._delay, self._delay
+
     def response_function(self, impulse_ref_edges, n_segments, original_segment_length):
         impulse_values = np.zeros(len(impulse_ref_edges))
         bin_spacing =  np.mean(impulse_ref_edges[:,1]-impulse_ref_edges[:,0])
@@ -224,6 +417,8 @@ class MovingAverage(Convolution):
     """ Calculates a moving average
     """
 
+    _pointwise_response = True
+
     def __init__(self,window_length, **kwargs):
         """
             Parameters
@@ -239,6 +434,9 @@ class MovingAverage(Convolution):
         super(self.__class__, self).__init__(**kwargs)
         self.label = 'Average'
 
+    def _impulse_range(self, bin_spacing):
+        return self._window
+
     def response_function(self, impulse_ref_edges, n_segments, original_segment_length):
         impulse_values = np.zeros(len(impulse_ref_edges))
 
@@ -261,6 +459,8 @@ class WaveletGenerator(Convolution):
     """ Makes copies from the signal.
     """
 
+    _pointwise_response = True
+
     def __init__(self,spacing,n_copies, **kwargs):
         """
             Parameters
@@ -287,6 +487,8 @@ class WaveletGenerator(Convolution):
         super(self.__class__, self).__init__(**kwargs)
         self.label = 'Wavelet generator'
 
+    def _impulse_range(self, bin_spacing):
+        return self._window
 
     def response_function(self, impulse_ref_edges, n_segments, original_segment_length):
 #    def calculate_response(self, impulse_bin_mids, impulse_bin_edges):
@@ -361,9 +563,16 @@ class ConvolutionFilter(Convolution):
         self._zero_bin_value = zero_bin_value
         super(ConvolutionFilter, self).__init__(**kwargs)
         self.label='ConvolutionFilter'
+
+        # the range of the normalized time (t*scaling) where the impulse response is non-zero
+        self._impulse_length = None
+
+        # the sum normalization and the second cut off filter depend on the all bins of the impulse response
+        self._pointwise_response = (normalization != 'sum') and (f_cutoff_2nd is None)
         # NOTE: is the tip cut needed? How to work with the sharp tips of the ideal filters?
 
     def response_function(self, impulse_ref_edges, n_segments, original_segment_length):
+        import scipy.integrate as integrate
         impulse = np.zeros(len(impulse_ref_edges))
 
         for i, edges in enumerate(impulse_ref_edges):
@@ -396,6 +605,21 @@ class ConvolutionFilter(Convolution):
 
         return impulse
 
+    def _impulse_range(self, bin_spacing):
+        if self._impulse_length is None:
+            lag_from, lag_to = super(ConvolutionFilter, self)._impulse_range(bin_spacing)
+        else:
+            lag_from = self._impulse_length[0]/self._scaling
+            lag_to = self._impulse_length[1]/self._scaling
+
+        if self._f_cutoff_2nd is not None:
+            # the response is smoothed by the default Gaussian filter (see _filter_2nd_cutoff)
+            gaussian_length = 10./(2. * pi * self._f_cutoff_2nd)
+            lag_from -= gaussian_length
+            lag_to += gaussian_length
+
+        return lag_from, lag_to
+
     def _filter_2nd_cutoff(self, impulse,impulse_ref_edges, n_segments, original_segment_length):
             ref_points = []
             mids = bin_mids(impulse_ref_edges)
@@ -419,6 +643,7 @@ class ConvolutionFilter(Convolution):
             pass
         elif isinstance(self._normalization, tuple):
             if self._normalization[0] == 'integral':
+                import scipy.integrate as integrate
                 norm_coeff, _ = integrate.quad(self._impulse_response, self._normalization[1][0], self._normalization[1][1])
             elif self._normalization[0] == 'bunch_by_bunch':
                 f_h = self._normalization[1]
@@ -526,6 +751,7 @@ class Lowpass(ConvolutionFilter):
         super(self.__class__, self).__init__(scaling, normalization=normalization,**kwargs)
         self.label = 'Lowpass filter'
         self.time_scale = max_impulse_length/scaling
+        self._impulse_length = (0., max_impulse_length)
 
 
 class Highpass(ConvolutionFilter):
@@ -544,6 +770,7 @@ class Highpass(ConvolutionFilter):
         super(self.__class__, self).__init__( scaling, zero_bin_value= 1., normalization=normalization, **kwargs)
         self.label = 'Highpass filter'
         self.time_scale = max_impulse_length/scaling
+        self._impulse_length = (0., max_impulse_length)
 
 class PhaseLinearizedLowpass(ConvolutionFilter):
     """ A phase linearized 1st order lowpass filter. Note that the narrow and
@@ -564,6 +791,7 @@ class PhaseLinearizedLowpass(ConvolutionFilter):
         super(self.__class__, self).__init__( scaling, normalization=normalization, **kwargs)
         self.label = 'Phaselinearized lowpass filter'
         self.time_scale = max_impulse_length/scaling
+        self._impulse_length = (-max_impulse_length, max_impulse_length)
 
 
 class Gaussian(ConvolutionFilter):
@@ -580,6 +808,7 @@ class Gaussian(ConvolutionFilter):
         super(self.__class__, self).__init__( scaling, normalization=normalization, **kwargs)
         self.label = 'Gaussian lowpass filter'
         self.time_scale = 1*max_impulse_length/scaling
+        self._impulse_length = (-max_impulse_length, max_impulse_length)
 
 
 class Sinc(ConvolutionFilter):
@@ -608,17 +837,22 @@ class Sinc(ConvolutionFilter):
         if normalization is None:
             normalization=('integral',(-window_width,window_width))
 
+        self._window_type = window_type
+        self._window_width = window_width
         self._impulse_response = abstract_filter_responses.normalized_sinc(window_type, window_width)
 
         super(self.__class__, self).__init__(scaling,normalization=normalization, **kwargs)
         self.label = 'Sinc filter'
         self.time_scale = window_width/scaling
+        self._impulse_length = (-pi*window_width, pi*window_width)
 
 
 class FIRFilter(Convolution):
     """ Calculates a convolution over the signal by using the given coefficients as a kernel.
     """
 
+    _pointwise_response = True
+
     def __init__(self, coefficients, zero_tap = 0, **kwargs):
         """
             Parameters
@@ -636,6 +870,8 @@ class FIRFilter(Convolution):
         super(FIRFilter, self).__init__(**kwargs)
         self.label = 'FIR filter'
 
+    def _impulse_range(self, bin_spacing):
+        return -1.*self._zero_tap*bin_spacing, (len(self._input_coefficients) - 1 - self._zero_tap)*bin_spacing
 
     def response_function(self, impulse_ref_edges, n_segments, original_segment_length):
         impulse = np.zeros(len(impulse_ref_edges))
@@ -3,24 +3,265 @@
 import numpy as np
 cimport numpy as np
 cimport cython
+from libc.math cimport floor
+from libc.stdlib cimport malloc, free
 
 """ The functions in this file have been written, because the dot product function of NumPy slowed down PyHEADTAIL
     simulation in the CERN batch system by a factor of two or more. The only working solution which was found was to
     write a new function for matrix product in Cython.
+
+    If an output array is given, the result is written into it, i.e. no new arrays are allocated.
+
+    The functions are compiled for single (float32) and double (float64) precision arrays, i.e. all the floating
+    point arrays given to a function must have the same precision.
+
+    The bounds of the arrays are not checked inside the loops. Instead, the lengths of the input and output arrays
+    are checked against the dimensions of the matrix before the loops and a ValueError is raised, if they do not
+    match.
 """
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
 
-def cython_matrix_product(double[:, ::1] matrix not None, double[::1] vector not None):
+def cython_matrix_product(cython.floating[:, ::1] matrix not None, cython.floating[::1] vector not None,
+                          cython.floating[::1] out=None):
 
     cdef np.intp_t i, j, dim_0, dim_1
+    cdef cython.floating temp_value
     dim_0 = matrix.shape[0]
     dim_1 = matrix.shape[1]
-    cdef double[::1] D = np.zeros(dim_0)
-    
+    if vector.shape[0] != dim_1:
+        raise ValueError('The length of the vector (' + str(vector.shape[0]) + ') does not match to the number of ' +
+                         'columns in the matrix (' + str(dim_1) + ')')
+    cdef cython.floating[::1] D
+    if out is None:
+        if cython.floating is float:
+            D = np.zeros(dim_0, dtype=np.float32)
+        else:
+            D = np.zeros(dim_0)
+    else:
+        if out.shape[0] != dim_0:
+            raise ValueError('The length of the output array (' + str(out.shape[0]) + ') does not match to ' +
+                             'the number of rows in the matrix (' + str(dim_0) + ')')
+        D = out
+
     for i in range(dim_0):
+        temp_value = 0.
         for j in range(dim_1):
-            D[i] += matrix[i,j]* vector[j]
-            
-    return D
\ No newline at end of file
+            temp_value += matrix[i,j]* vector[j]
+        D[i] = temp_value
+
+    return D
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def cython_segment_matrix_product(cython.floating[:, ::1] matrix not None, cython.floating[::1] vector not None,
+                                  cython.floating[::1] out=None):
+    """ Multiplies each segment of the vector by the matrix, i.e. the vector is divided into segments with the length of
+        matrix.shape[1] and the result of each segment is written into the corresponding segment of the output.
+    """
+
+    cdef np.intp_t i, j, k, dim_0, dim_1, n_segments
+    cdef np.intp_t in_offset, out_offset
+    cdef cython.floating temp_value
+    dim_0 = matrix.shape[0]
+    dim_1 = matrix.shape[1]
+    if (dim_1 == 0) or (vector.shape[0] % dim_1 != 0):
+        raise ValueError('The length of the vector (' + str(vector.shape[0]) + ') is not a multiple of ' +
+                         'the number of columns in the matrix (' + str(dim_1) + ')')
+    n_segments = vector.shape[0] // dim_1
+    cdef cython.floating[::1] D
+    if out is None:
+        if cython.floating is float:
+            D = np.zeros(n_segments * dim_0, dtype=np.float32)
+        else:
+            D = np.zeros(n_segments * dim_0)
+    else:
+        if out.shape[0] != n_segments * dim_0:
+            raise ValueError('The length of the output array (' + str(out.shape[0]) + ') does not match to ' +
+                             str(n_segments) + ' segments of ' + str(dim_0) + ' rows')
+        D = out
+
+    for k in range(n_segments):
+        in_offset = k * dim_1
+        out_offset = k * dim_0
+        for i in range(dim_0):
+            temp_value = 0.
+            for j in range(dim_1):
+                temp_value += matrix[i,j]* vector[in_offset + j]
+            D[out_offset + i] = temp_value
+
+    return D
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def cython_csr_product(int[::1] indptr not None, int[::1] indices not None, cython.floating[::1] data not None,
+                       np.intp_t n_columns, cython.floating[::1] vector not None,
+                       cython.floating[::1] out not None):
+    """ A product of a sparse matrix in the CSR format (scipy.sparse.csr_matrix) with n_columns columns and a vector,
+        which is written into the given output array.
+    """
+
+    cdef np.intp_t i, j, dim_0
+    cdef cython.floating temp_value
+    dim_0 = indptr.shape[0] - 1
+    if vector.shape[0] != n_columns:
+        raise ValueError('The length of the vector (' + str(vector.shape[0]) + ') does not match to the number of ' +
+                         'columns in the matrix (' + str(n_columns) + ')')
+    if out.shape[0] != dim_0:
+        raise ValueError('The length of the output array (' + str(out.shape[0]) + ') does not match to the number ' +
+                         'of rows in the matrix (' + str(dim_0) + ')')
+
+    for i in range(dim_0):
+        temp_value = 0.
+        for j in range(indptr[i], indptr[i+1]):
+            temp_value += data[j] * vector[indices[j]]
+        out[i] = temp_value
+
+    return out
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def cython_kick(int[::1] slice_index_of_particle not None, np.intp_t n_slices, np.intp_t offset,
+                double[::1] signal not None, double[::1] coordinates not None,
+                double[::1] signal_2=None, double[::1] coordinates_2=None):
+    """ Subtracts the values of the signal bins from the coordinates of the particles in place by using the slice
+        indexes of the particles, i.e. coordinates[i] -= signal[offset - slice_index_of_particle[i]] for the particles
+        within the slices (0 <= slice index < n_slices). The slices are in the reversed order in the signal. If a second
+        signal and coordinate array are given (e.g. the other plane), they are kicked in the same pass.
+    """
+
+    cdef np.intp_t i, s, b, n_particles
+    cdef bint two_planes = signal_2 is not None
+    n_particles = slice_index_of_particle.shape[0]
+    if coordinates.shape[0] != n_particles:
+        raise ValueError('The lengths of the slice index and coordinate arrays do not match')
+    if (n_slices > 0) and ((offset >= signal.shape[0]) or (offset - n_slices + 1 < 0)):
+        raise ValueError('The slices of the bunch are outside the signal')
+    if two_planes and ((coordinates_2 is None) or (coordinates_2.shape[0] != n_particles) or
+                       (signal_2.shape[0] != signal.shape[0])):
+        raise ValueError('The second signal and coordinate array do not match to the first ones')
+
+    for i in range(n_particles):
+        s = slice_index_of_particle[i]
+        if (s >= 0) and (s < n_slices):
+            b = offset - s
+            coordinates[i] -= signal[b]
+            if two_planes:
+                coordinates_2[i] -= signal_2[b]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def cython_indexed_kick(int[::1] index not None, double[::1] signal not None, double[::1] coordinates not None,
+                        double[::1] signal_2=None, double[::1] coordinates_2=None):
+    """ Subtracts the signal values from the coordinates of the particles in place, i.e.
+        coordinates[i] -= signal[index[i]], where the particles with a negative index (e.g. outside the slices) are
+        skipped. A second signal and coordinate array are kicked in the same pass.
+    """
+
+    cdef np.intp_t i, b, n_particles
+    cdef bint two_planes = signal_2 is not None
+    n_particles = index.shape[0]
+    if coordinates.shape[0] != n_particles:
+        raise ValueError('The lengths of the index and coordinate arrays do not match')
+    if two_planes and ((coordinates_2 is None) or (coordinates_2.shape[0] != n_particles) or
+                       (signal_2.shape[0] != signal.shape[0])):
+        raise ValueError('The second signal and coordinate array do not match to the first ones')
+
+    for i in range(n_particles):
+        b = index[i]
+        if b >= 0:
+            coordinates[i] -= signal[b]
+            if two_planes:
+                coordinates_2[i] -= signal_2[b]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def cython_uniform_kick(double[::1] z not None, double z_cut_tail, double slice_width, np.intp_t n_slices,
+                        np.intp_t offset, double[::1] signal not None, double[::1] coordinates not None,
+                        double[::1] signal_2=None, double[::1] coordinates_2=None):
+    """ A kick for uniformly binned slice sets, where the slice index of a particle is computed from its longitudinal
+        coordinate, i.e. floor((z - z_cut_tail)/slice_width), in the same way as in the UniformBinSlicer of PyHEADTAIL.
+        The particles within the cuts are kicked by coordinates[i] -= signal[offset - slice_index], i.e. the slices are
+        in the reversed order in the signal. A second signal and coordinate array are kicked in the same pass.
+    """
+
+    cdef np.intp_t i, b, n_particles
+    cdef double slice_index
+    cdef bint two_planes = signal_2 is not None
+    n_particles = z.shape[0]
+    if coordinates.shape[0] != n_particles:
+        raise ValueError('The lengths of the z and coordinate arrays do not match')
+    if (n_slices > 0) and ((offset >= signal.shape[0]) or (offset - n_slices + 1 < 0)):
+        raise ValueError('The slices of the bunch are outside the signal')
+    if two_planes and ((coordinates_2 is None) or (coordinates_2.shape[0] != n_particles) or
+                       (signal_2.shape[0] != signal.shape[0])):
+        raise ValueError('The second signal and coordinate array do not match to the first ones')
+
+    for i in range(n_particles):
+        slice_index = floor((z[i] - z_cut_tail) / slice_width)
+        if (slice_index >= 0.) and (slice_index < n_slices):
+            b = offset - <np.intp_t>slice_index
+            coordinates[i] -= signal[b]
+            if two_planes:
+                coordinates_2[i] -= signal_2[b]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def cython_slice_moments(int[::1] slice_index_of_particle not None, list coordinates not None,
+                         int[::1] n_macroparticles not None, double[:, ::1] means not None):
+    """ Calculates the number of macroparticles and the mean values of the given coordinate arrays (a list of float64
+        arrays) in each slice in a single pass over the particles. The results are written into the given arrays, where
+        means has a shape (len(coordinates), n_slices). The sums are accumulated in the same order as in PyHEADTAIL,
+        i.e. the results are equal to the statistics calculated by the slicers of PyHEADTAIL.
+    """
+
+    cdef np.intp_t i, k, s_idx, n_particles, n_slices, n_coordinates
+    cdef double[::1] coordinate
+    cdef double** pointers
+
+    n_particles = slice_index_of_particle.shape[0]
+    n_slices = n_macroparticles.shape[0]
+    n_coordinates = len(coordinates)
+
+    if means.shape[0] != n_coordinates or means.shape[1] != n_slices:
+        raise ValueError('The shape of the output array does not match to the coordinates and slices')
+
+    n_macroparticles[:] = 0
+    means[:, :] = 0.
+
+    pointers = <double**>malloc(max(n_coordinates, 1) * sizeof(double*))
+    if pointers == NULL:
+        raise MemoryError()
+
+    try:
+        for k in range(n_coordinates):
+            coordinate = coordinates[k]
+            if coordinate.shape[0] != n_particles:
+                raise ValueError('The lengths of the coordinate arrays do not match to the number of particles')
+            if n_particles > 0:
+                pointers[k] = &coordinate[0]
+
+        for i in range(n_particles):
+            s_idx = slice_index_of_particle[i]
+            if (s_idx >= 0) and (s_idx < n_slices):
+                n_macroparticles[s_idx] += 1
+                for k in range(n_coordinates):
+                    means[k, s_idx] += pointers[k][i]
+    finally:
+        free(pointers)
+
+    for s_idx in range(n_slices):
+        if n_macroparticles[s_idx]:
+            for k in range(n_coordinates):
+                means[k, s_idx] /= n_macroparticles[s_idx]
+
+    return n_macroparticles, means
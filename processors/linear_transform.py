@@ -2,10 +2,8 @@ from collections import deque
 from abc import ABCMeta, abstractmethod
 import numpy as np
 from scipy.constants import c, pi
-import scipy.integrate as integrate
-from scipy import linalg
-from cython_hacks import cython_matrix_product
-from ..core import default_macros
+from cython_hacks import cython_matrix_product, cython_segment_matrix_product
+from ..core import default_macros, cached_init, signal_dtype
 import abstract_filter_responses
 
 """Signal processors based on linear transformation.
@@ -20,8 +18,14 @@ class LinearTransform(object):
         calculating a dot product of a transfer matrix and a signal. The transfer matrix is produced with an abstract
         method, namely response_function(*args), which returns an elements of the matrix (an effect of
         the ref_bin to the bin)
+
+        If the response function depends only on the relative positions of the bins (_translation_invariant = True),
+        the transfer matrix for a uniform bin set is a Toeplitz matrix, which is calculated from its first row and
+        column.
     """
 
+    _translation_invariant = False
+
     def __init__(self, mode = 'bunch_by_bunch', normalization=None, bin_middle = 'bin', **kwargs):
         """
 
@@ -48,6 +52,8 @@ class LinearTransform(object):
 
         self._z_bin_set = None
         self._matrix = None
+        # a copy of the matrix in the precision of a single precision signal
+        self._typed_matrix = None
 
         self._recalculate_matrix = True
 
@@ -57,7 +63,7 @@ class LinearTransform(object):
         self._n_bins_per_segment = None
         self._mid_bunch = None
 
-        self.extensions = []
+        self.extensions = ['output_buffer', 'linear']
         self._macros = [] + default_macros(self, 'LinearTransform', **kwargs)
 
         if bin_middle == 'particles':
@@ -70,43 +76,96 @@ class LinearTransform(object):
         # Impulse response function of the processor
         pass
 
-    def process(self,parameters, signal, slice_sets = None, *args, **kwargs):
+    def time_support(self, bin_spacings):
+        bin_spacing = bin_spacings[-1]
+        # the matrix is applied to each segment separately
+        if self._mode == 'bunch_by_bunch':
+            return 0., 0., bin_spacing
 
-        if self._matrix is None:
+        # the response function is integrated over the bins, i.e. the lags are extended by a half bin
+        lag_from, lag_to = self._impulse_range()
+        return max(lag_to + 0.5*bin_spacing, 0.), max(0.5*bin_spacing - lag_from, 0.), bin_spacing
 
-            if self._bin_middle == 'particles':
-                bin_midpoints = np.array([])
-                for slice_set in slice_sets:
-                    bin_midpoints = np.append(bin_midpoints, slice_set.mean_z)
-            elif self._bin_middle == 'bin':
-                bin_midpoints = (parameters['bin_edges'][:, 1] + parameters['bin_edges'][:, 0]) / 2.
-            else:
-                raise ValueError('Unknown value for LinearTransform._bin_middle ')
+    def _impulse_range(self):
+        # the range of the lags [s] where the response function is non-zero. A positive lag delays the signal.
+        # By default, the bins may depend on the whole signal.
+        return -np.inf, np.inf
+
+    def prepare(self, parameters, slice_sets = None, *args, **kwargs):
+        # the bin midpoints of the particles are known only from the slice sets
+        if (self._matrix is None) and ((self._bin_middle != 'particles') or (slice_sets is not None)):
+            self._init_matrix(parameters, slice_sets)
 
-            self._n_segments = parameters['n_segments']
-            self._n_bins_per_segment = parameters['n_bins_per_segment']
+        return parameters
 
-            self.__generate_matrix(parameters, parameters['bin_edges'],bin_midpoints)
+    def process(self,parameters, signal, slice_sets = None, out=None, *args, **kwargs):
+
+        # the matrix is calculated again, if the segments of the signal have been changed
+        if (self._matrix is None) or (parameters['n_segments'] != self._n_segments) or \
+                (parameters['n_bins_per_segment'] != self._n_bins_per_segment):
+            self._init_matrix(parameters, slice_sets)
+
+        dtype = signal_dtype(signal)
+        matrix = self._matrix
+        if matrix.dtype != dtype:
+            if (self._typed_matrix is None) or (self._typed_matrix.dtype != dtype):
+                self._typed_matrix = np.ascontiguousarray(self._matrix, dtype=dtype)
+            matrix = self._typed_matrix
+
+        if out is None:
+            out = np.zeros(np.shape(signal), dtype=dtype)
 
         if self._mode == 'total':
-            output_signal = np.array(cython_matrix_product(self._matrix, signal))
+            matrix_product = cython_matrix_product
         elif self._mode == 'bunch_by_bunch':
-            output_signal = np.zeros(len(signal))
-
-            for i in xrange(self._n_segments):
-                idx_from = i * self._n_bins_per_segment
-                idx_to = (i+1) * self._n_bins_per_segment
-                np.copyto(output_signal[idx_from:idx_to],cython_matrix_product(self._matrix, signal[idx_from:idx_to]))
+            matrix_product = cython_segment_matrix_product
         else:
             raise ValueError('Unknown value for LinearTransform._mode ')
 
-        return parameters, output_signal
+        if out.ndim == 1:
+            matrix_product(matrix, signal, out)
+        else:
+            for input_channel, output_channel in zip(signal, out):
+                matrix_product(matrix, input_channel, output_channel)
+
+        return parameters, out
 
         # np.dot can't be used, because it slows down the calculations in LSF by a factor of two or more
         # return np.dot(self._matrix,signal)
 
+    def _init_matrix(self, parameters, slice_sets):
+        if self._bin_middle == 'particles':
+            bin_midpoints = np.array([])
+            for slice_set in slice_sets:
+                bin_midpoints = np.append(bin_midpoints, slice_set.mean_z)
+        elif self._bin_middle == 'bin':
+            bin_midpoints = (parameters['bin_edges'][:, 1] + parameters['bin_edges'][:, 0]) / 2.
+        else:
+            raise ValueError('Unknown value for LinearTransform._bin_middle ')
+
+        self._n_segments = parameters['n_segments']
+        self._n_bins_per_segment = parameters['n_bins_per_segment']
+
+        def generate_matrix():
+            self.__generate_matrix(parameters, parameters['bin_edges'],bin_midpoints,
+                                   self._uniform_bins(parameters))
+            return {'matrix': self._matrix}
+
+        # the matrix might be loaded from the initialization cache
+        self._matrix = cached_init(self, parameters, generate_matrix, extra=bin_midpoints)['matrix']
+        self._typed_matrix = None
+
+    def linear_operator(self):
+        from scipy import sparse
+        if self._mode == 'total':
+            return sparse.csr_matrix(self._matrix)
+        else:
+            # the same matrix is applied to each segment
+            return sparse.kron(sparse.identity(self._n_segments), self._matrix, format='csr')
+
     def clear(self):
         self._matrix = np.array([])
+        self._typed_matrix = None
         self._recalculate_matrix = True
 
     def print_matrix(self):
@@ -116,7 +175,20 @@ class LinearTransform(object):
                 print "{:6.3f}".format(element),
             print "]"
 
-    def __generate_matrix(self,parameters, bin_edges, bin_midpoints):
+    def _uniform_bins(self, parameters):
+        # checks if the bins used for the matrix are on a uniform grid
+        if (not self._translation_invariant) or (self._bin_middle != 'bin'):
+            return False
+
+        bin_set = getattr(parameters, 'bin_set', None)
+        if bin_set is None:
+            return False
+        elif self._mode == 'bunch_by_bunch':
+            return True
+        else:
+            return bin_set.is_contiguous
+
+    def __generate_matrix(self,parameters, bin_edges, bin_midpoints, uniform_bins=False):
 
         self._mid_bunch = int(self._n_segments/2)
 
@@ -127,7 +199,13 @@ class LinearTransform(object):
         norm_bin_edges = bin_edges[:self._n_bins_per_segment]
         norm_bin_edges = norm_bin_edges - bunch_mid
 
-        if self._mode == 'bunch_by_bunch':
+        if uniform_bins:
+            if self._mode == 'bunch_by_bunch':
+                self._matrix = self.__toeplitz_matrix(parameters, norm_bin_edges, norm_bunch_midpoints)
+            else:
+                self._matrix = self.__toeplitz_matrix(parameters, bin_edges, bin_midpoints)
+
+        elif self._mode == 'bunch_by_bunch':
 
             self._matrix = np.identity(len(norm_bunch_midpoints))
 
@@ -168,11 +246,31 @@ class LinearTransform(object):
         else:
             raise ValueError('Unrecognized value in LinearTransform._normalization')
 
+    def __toeplitz_matrix(self, parameters, bin_edges, bin_midpoints):
+        # the elements of the matrix depend only on the index difference of the bins, i.e. only the first column
+        # and the first row are calculated
+        first_column = np.zeros(len(bin_midpoints))
+        first_row = np.zeros(len(bin_midpoints))
+
+        for j, midpoint_j in enumerate(bin_midpoints):
+            first_column[j] = self.response_function(parameters,
+                                                     bin_midpoints[0], bin_edges[0, 0], bin_edges[0, 1],
+                                                     midpoint_j, bin_edges[j, 0], bin_edges[j, 1])
+        for i, midpoint_i in enumerate(bin_midpoints):
+            first_row[i] = self.response_function(parameters,
+                                                  midpoint_i, bin_edges[i, 0], bin_edges[i, 1],
+                                                  bin_midpoints[0], bin_edges[0, 0], bin_edges[0, 1])
+
+        from scipy import linalg
+        return np.ascontiguousarray(linalg.toeplitz(first_column, first_row), dtype=float)
+
 class Averager(LinearTransform):
     """ Returns a signal, which consists an average value of the input signal. A sums of the rows in the matrix
         are normalized to be one (i.e. a sum of the input signal doesn't change).
     """
 
+    _translation_invariant = True
+
     def __init__(self, mode = 'bunch_by_bunch', normalization = 'column_sum', **kwargs):
         super(self.__class__, self).__init__(mode, normalization, **kwargs)
         self.label = 'Averager'
@@ -183,11 +281,16 @@ class Averager(LinearTransform):
 class Delay(LinearTransform):
     """ Delays signal in the units of [second].
     """
+
+    _translation_invariant = True
     def __init__(self,delay, **kwargs):
         self._delay = delay
         super(self.__class__, self).__init__( **kwargs)
         self.label = 'Delay'
 
+    def _impulse_range(self):
+        return self._delay, self._delay
+
     def response_function(self, parameters, ref_bin_mid, ref_bin_from, ref_bin_to, bin_mid, bin_from, bin_to):
 
         return self.__CDF(bin_to, ref_bin_from, ref_bin_to) - self.__CDF(bin_from, ref_bin_from, ref_bin_to)
@@ -203,6 +306,8 @@ class Delay(LinearTransform):
 class LinearTransformFromFile(LinearTransform):
     """ Interpolates matrix columns by using inpulse response data from a file. """
 
+    _translation_invariant = True
+
     def __init__(self,filename, x_axis = 'time', **kwargs):
         self._filename = filename
         self._x_axis = x_axis
@@ -213,6 +318,12 @@ class LinearTransformFromFile(LinearTransform):
         super(self.__class__, self).__init__( **kwargs)
         self.label = 'LT from file'
 
+    def _impulse_range(self):
+        # the data are extrapolated by the end values
+        lag_from = self._data[0, 0] if self._data[0, 1] == 0. else -np.inf
+        lag_to = self._data[-1, 0] if self._data[-1, 1] == 0. else np.inf
+        return lag_from, lag_to
+
     def response_function(self, parameters, ref_bin_mid, ref_bin_from, ref_bin_to, bin_mid, bin_from, bin_to):
             return np.interp(bin_mid - ref_bin_mid, self._data[:, 0], self._data[:, 1])
 
@@ -226,6 +337,8 @@ class LinearTransformFilter(LinearTransform):
 
     """
 
+    _translation_invariant = True
+
     def __init__(self, scaling, zero_bin_value=None, normalization=None, **kwargs):
 
         self._scaling = scaling
@@ -243,9 +356,18 @@ class LinearTransformFilter(LinearTransform):
 
         self._norm_coeff = None
 
+        # the range of the normalized time (t*scaling) where the impulse response is non-zero
+        self._impulse_length = None
+
+    def _impulse_range(self):
+        if self._impulse_length is None:
+            return super(LinearTransformFilter, self)._impulse_range()
+        return self._impulse_length[0]/self._scaling, self._impulse_length[1]/self._scaling
+
     def response_function(self, parameters, ref_bin_mid, ref_bin_from, ref_bin_to, bin_mid, bin_from, bin_to):
         # Frequency scaling must be done by scaling integral limits, because integration by substitution doesn't work
         # with np.quad (see quad_problem.ipynbl). An ugly way, which could be fixed.
+        import scipy.integrate as integrate
 
         temp, _ = integrate.quad(self._impulse_response, self._scaling * (bin_from - (ref_bin_mid)),
                                  self._scaling * (bin_to - (ref_bin_mid)))
@@ -268,6 +390,7 @@ class LinearTransformFilter(LinearTransform):
             norm_coeff = 1.
         elif isinstance(self._filter_normalization, tuple):
             if self._filter_normalization[0] == 'integral':
+                import scipy.integrate as integrate
                 norm_coeff, _ = integrate.quad(self._impulse_response, self._filter_normalization[1][0], self._filter_normalization[1][1])
             elif self._filter_normalization[0] == 'bunch_by_bunch':
                 f_h = self._filter_normalization[1]
@@ -306,6 +429,7 @@ class Lowpass(LinearTransformFilter):
 
         super(self.__class__, self).__init__(scaling, normalization=normalization,**kwargs)
         self.label = 'Lowpass filter'
+        self._impulse_length = (0., max_impulse_length)
 
 
 class Highpass(LinearTransformFilter):
@@ -323,6 +447,7 @@ class Highpass(LinearTransformFilter):
 
         super(self.__class__, self).__init__( scaling, zero_bin_value= 1., normalization=normalization, **kwargs)
         self.label = 'Highpass filter'
+        self._impulse_length = (0., max_impulse_length)
 
 class PhaseLinearizedLowpass(LinearTransformFilter):
     """ A phase linearized 1st order lowpass filter. Note that the narrow and
@@ -342,6 +467,7 @@ class PhaseLinearizedLowpass(LinearTransformFilter):
 
         super(self.__class__, self).__init__( scaling, normalization=normalization, **kwargs)
         self.label = 'Phaselinearized lowpass filter'
+        self._impulse_length = (-max_impulse_length, max_impulse_length)
 
 
 class Gaussian(LinearTransformFilter):
@@ -357,6 +483,7 @@ class Gaussian(LinearTransformFilter):
 
         super(self.__class__, self).__init__( scaling, normalization=normalization, **kwargs)
         self.label = 'Gaussian lowpass filter'
+        self._impulse_length = (-max_impulse_length, max_impulse_length)
 
 
 class Sinc(LinearTransformFilter):
@@ -385,7 +512,10 @@ class Sinc(LinearTransformFilter):
         if normalization is None:
             normalization=('integral',(-window_width,window_width))
 
+        self._window_type = window_type
+        self._window_width = window_width
         self._impulse_response = abstract_filter_responses.normalized_sinc(window_type, window_width)
 
         super(self.__class__, self).__init__(scaling,normalization=normalization, **kwargs)
-        self.label = 'Sinc filter'
\ No newline at end of file
+        self.label = 'Sinc filter'
+        self._impulse_length = (-pi*window_width, pi*window_width)
@@ -1,5 +1,5 @@
 import numpy as np
-from ..core import default_macros
+from ..core import default_macros, signal_dtype
 
 class Bypass(object):
     """ A fast bypass processor, whichi does not modify the signal. A black sheep, which does not fit for
@@ -9,9 +9,12 @@ class Bypass(object):
     def __init__(self, **kwargs):
         self.signal_classes = (0, 0)
 
-        self.extensions = []
+        self.extensions = ['linear', 'segment']
         self._macros = [] + default_macros(self, 'Bypass', **kwargs)
 
+    def prepare(self, parameters, *args, **kwargs):
+        return parameters
+
     def process(self, parameters, signal, *args, **kwargs):
 
         return parameters, signal
@@ -26,26 +29,36 @@ class Average(object):
 
         self.signal_classes = (0, 0)
 
-        self.extensions = []
+        self.extensions = ['linear']
+        if self._avg_type == 'bunch':
+            self.extensions.append('segment')
         self._macros = [] + default_macros(self, 'Average', **kwargs)
 
+    def time_support(self, bin_spacings):
+        if self._avg_type == 'total':
+            return np.inf, np.inf, bin_spacings[-1]
+        return 0., 0., bin_spacings[-1]
+
+    def prepare(self, parameters, *args, **kwargs):
+        return parameters
 
     def process(self, parameters, signal, *args, **kwargs):
 
         if self._avg_type == 'bunch':
             n_segments = parameters.n_segments
-            n_slices_per_segment = parameters.n_slices_per_segment
+            n_slices_per_segment = parameters.n_bins_per_segment
 
-            output_signal = np.zeros(len(signal))
-            ones = np.ones(n_slices_per_segment)
+            output_signal = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
 
             for i in xrange(n_segments):
                 idx_from = i * n_slices_per_segment
                 idx_to = (i + 1) * n_slices_per_segment
-                np.copyto(output_signal[idx_from:idx_to], ones * np.mean(signal[idx_from:idx_to]))
+                output_signal[..., idx_from:idx_to] = np.mean(signal[..., idx_from:idx_to],
+                                                              axis=-1, keepdims=True)
 
         elif self._avg_type == 'total':
-            output_signal = np.ones(len(signal))*np.mean(signal)
+            output_signal = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
+            output_signal[...] = np.mean(signal, axis=-1, keepdims=True)
 
         else:
             raise ValueError('Unknown value in Average._avg_type')
@@ -1,7 +1,7 @@
 from abc import ABCMeta, abstractmethod
 import numpy as np
 from scipy.constants import c, pi
-from ..core import default_macros
+from ..core import default_macros, signal_dtype, to_values
 
 """Signal processors based on multiplication operation.
 
@@ -41,30 +41,72 @@ class Multiplication(object):
 
         self.signal_classes = (0,0)
 
-        self.extensions = []
+        self.extensions = ['output_buffer']
         self._macros = [] + default_macros(self, 'Multiplication', **kwargs)
 
+        # the signal is multiplied by a fixed array
+        if (self._seed != 'signal') and (not self._recalculate_multiplier):
+            self.extensions.append('linear')
+
         if self._seed not in ['bin_length','bin_midpoint','signal','ones']:
             self.extensions.append('bunch')
             self.required_variables = [self._seed]
 
+        # the multiplier of a segment depends only on the segment
+        if (self._normalization is None) or self._normalization.startswith('segment'):
+            self.extensions.append('segment')
+
 
     @abstractmethod
     def multiplication_function(self, seed):
         pass
 
-    def process(self,parameters, signal, slice_sets = None, *args, **kwargs):
-
-        if (self._multiplier is None) or self._recalculate_multiplier:
+    def time_support(self, bin_spacings):
+        # the total normalizations depend on the whole signal
+        if (self._normalization is not None) and self._normalization.startswith('total'):
+            return np.inf, np.inf, bin_spacings[-1]
+        return 0., 0., bin_spacings[-1]
+
+    def prepare(self, parameters, slice_sets = None, *args, **kwargs):
+        # the multiplier can be calculated in advance, if it does not depend on the signal
+        if (self._multiplier is None) and (not self._recalculate_multiplier) and (self._seed != 'signal') \
+                and (('bunch' not in self.extensions) or (slice_sets is not None)):
+            self.__calculate_multiplier(parameters, np.zeros(len(parameters['bin_edges'])), slice_sets)
+
+        # the codes of a fixed-point signal are converted to values
+        if parameters['scale'] is not None:
+            parameters = parameters.replace(scale=None)
+        return parameters
+
+    def process(self,parameters, signal, slice_sets = None, out=None, *args, **kwargs):
+
+        # the codes of a fixed-point signal are converted to values (see core.py), because the multiplier (e.g.
+        # a noise gate) might depend on the values of the signal
+        if parameters['scale'] is not None:
+            parameters, signal = to_values(parameters, signal)
+
+        # the multiplier is calculated again, if the length of the signal has been changed
+        if (self._multiplier is None) or self._recalculate_multiplier or \
+                (np.shape(self._multiplier)[-1] != np.shape(signal)[-1]):
             self.__calculate_multiplier(parameters, signal, slice_sets)
 
-        output_signal =  self._multiplier*signal
+        # the multiplier is applied in the precision of the signal
+        output_signal = np.multiply(self._multiplier, signal, out=out, dtype=signal_dtype(signal))
 
         # process the signal
         return parameters, output_signal
 
+    def linear_operator(self):
+        from scipy import sparse
+        return sparse.diags(self._multiplier, format='csr')
+
     def __calculate_multiplier(self,parameters, signal, slice_sets):
-        self._multiplier = np.zeros(len(signal))
+        # the signal seed is calculated separately for each channel of a multi-channel signal, otherwise the same
+        # values are used for all the channels
+        if self._seed == 'signal':
+            self._multiplier = np.zeros(np.shape(signal))
+        else:
+            self._multiplier = np.zeros(np.shape(signal)[-1])
 
         if self._seed == 'ones':
             self._multiplier = self._multiplier + 1.
@@ -85,7 +127,7 @@ class Multiplication(object):
         elif self._seed == 'signal':
             np.copyto(self._multiplier,signal)
         else:
-            if len(signal) == len(slice_sets) * (len(slice_sets[0].z_bins) - 1):
+            if np.shape(signal)[-1] == len(slice_sets) * slice_sets[0].n_slices:
                 start_idx = 0
                 for slice_set in slice_sets:
                     seed = getattr(slice_set,self._seed)
@@ -212,7 +254,7 @@ class NoiseGate(Multiplication):
         self.label = 'Noise gate'
 
     def multiplication_function(self, seed):
-        multiplier = np.zeros(len(seed))
+        multiplier = np.zeros(np.shape(seed))
 
         if self._threshold_ref == 'amplitude':
             comparable = np.abs(seed)
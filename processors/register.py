@@ -1,10 +1,11 @@
-import math, copy
+import math
 from collections import deque
 from abc import ABCMeta, abstractmethod
 import numpy as np
 from scipy.constants import pi
 
-from ..core import Parameters, default_macros
+from ..core import Parameters, default_macros, signal_dtype, time_support
+from ..core import is_fixed_point, fixed_point_coefficients, fixed_point_output, round_to_codes
 
 """Signal processors based on registers and combiners.
 
@@ -39,6 +40,13 @@ class Register(object):
         self._signal_register = deque(maxlen=(n_values + delay))
         self._parameter_register = deque(maxlen=(n_values + delay))
 
+        # the expected parameters of the signals given in prepare(...)
+        self._prepared_parameters = None
+
+        # the signal processors processing the signals read from the register
+        # (e.g. the processors of a kicker)
+        self._readers = []
+
         self.extensions = ['register']
         self._macros = [] + default_macros(self, 'Register', **kwargs)
 
@@ -47,7 +55,7 @@ class Register(object):
         if len(self._parameter_register) > 0:
             return self._parameter_register[0]
         else:
-            return None
+            return self._prepared_parameters
 
     @property
     def phase_advance_per_turn(self):
@@ -61,6 +69,24 @@ class Register(object):
     def maxlen(self):
         return self._n_values
 
+    def add_reader(self, processors):
+        """
+        Adds signal processors, which process the signals read from
+        the register. The time support of the register includes the supports
+        of the readers, i.e. the signal stored to the register covers the
+        input signal required by the readers.
+        """
+        self._readers.append(processors)
+
+    def time_support(self, bin_spacings):
+        causal = 0.
+        anticausal = 0.
+        for processors in self._readers:
+            reader_causal, reader_anticausal, _ = time_support(processors, bin_spacings)
+            causal = max(causal, reader_causal)
+            anticausal = max(anticausal, reader_anticausal)
+        return causal, anticausal, bin_spacings[-1]
+
     def __len__(self):
         """
         Returns a number of signals in the register after the delay.
@@ -87,9 +113,28 @@ class Register(object):
             return (self._parameter_register[self._n_iter_left],
                     self._signal_register[self._n_iter_left], delay)
 
+    def prepare(self, parameters, *args, **kwargs):
+        # the parameters are known by the combiners before the first signal
+        self._prepared_parameters = parameters
+        return parameters
+
     def process(self, parameters, signal, *args, **kwargs):
+        # The signal is copied, because the input signal might be a buffer,
+        # which is overwritten on the next turn. The memory of the oldest
+        # signal is reused when the register is full.
+        if signal is not None:
+            if ((len(self._signal_register) == self._signal_register.maxlen)
+                    and (self._signal_register[0] is not None)
+                    and (np.shape(self._signal_register[0]) == np.shape(signal))):
+                stored_signal = self._signal_register[0]
+                np.copyto(stored_signal, signal)
+            else:
+                stored_signal = np.array(signal, copy=True)
+        else:
+            stored_signal = None
+
         self._parameter_register.append(parameters)
-        self._signal_register.append(signal)
+        self._signal_register.append(stored_signal)
 
         return parameters, signal
 
@@ -110,6 +155,9 @@ class UncorrectedDelay(object):
     def delay(self):
         return self._delay
 
+    def prepare(self, parameters, *args, **kwargs):
+        return self._register.prepare(parameters, *args, **kwargs)
+
     def process(self, parameters, signal, *args, **kwargs):
         self._register.process(parameters, signal, *args, **kwargs)
         output_parameters = None
@@ -121,7 +169,7 @@ class UncorrectedDelay(object):
 
         if output_parameters is None:
             output_parameters = parameters
-            output_signal = np.zeros(len(signal))
+            output_signal = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
 
         return output_parameters, output_signal
 
@@ -168,6 +216,16 @@ class Combiner(object):
     def combine(self, registers, target_location, target_beta, additional_phase_advance, beta_conversion):
         pass
 
+    def prepare(self, parameters=None, *args, **kwargs):
+        # the parameters of the combined signal are known, when the registers
+        # have been prepared or they contain signals
+        register_parameters = self._registers[0].parameters
+        if register_parameters is None:
+            return None
+
+        return register_parameters.replace(location=self._target_location,
+                                           beta=self._target_beta)
+
     def process(self, parameters=None, signal=None, *args, **kwargs):
 
         output_signal = self.combine(self._registers,
@@ -177,10 +235,11 @@ class Combiner(object):
                               self._beta_conversion)
 
         if self._combined_parameters is None:
-            self._combined_parameters = copy.copy(self._registers[0].parameters)
-            if self._combined_parameters is not None:
-                self._combined_parameters['location'] = self._target_location
-                self._combined_parameters['beta'] = self._target_beta
+            register_parameters = self._registers[0].parameters
+            if register_parameters is not None:
+                self._combined_parameters = register_parameters.replace(
+                        location=self._target_location,
+                        beta=self._target_beta)
 
         return self._combined_parameters, output_signal
 
@@ -217,7 +276,7 @@ class CosineSumCombiner(Combiner):
         for register in registers:
             for (parameters, signal, delay) in register:
                 if combined_signal is None:
-                    combined_signal = np.zeros(len(signal))
+                    combined_signal = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
                 delta_position = parameters['location'] \
                                 - target_location
 
@@ -309,6 +368,22 @@ class HilbertCombiner(Combiner):
     def n_taps(self, value):
         self._n_taps = value
 
+    def prepare(self, parameters=None, *args, **kwargs):
+        # the coefficients are generated, if the parameters of the registers
+        # are known
+        if self._coefficients is None:
+            if self._n_taps is None:
+                self._n_taps = self._registers[0].maxlen
+            self._coefficients = [None]*len(self._registers)
+
+        for i, register in enumerate(self._registers):
+            if (self._coefficients[i] is None) and (register.parameters is not None):
+                self._coefficients[i] = self.__generate_coefficients(
+                        register, self._target_location, self._target_beta,
+                        self._additional_phase_advance)
+
+        return super(HilbertCombiner, self).prepare(parameters, *args, **kwargs)
+
 
     def combine(self, registers, target_location, target_beta, additional_phase_advance, beta_conversion):
         if self._coefficients is None:
@@ -334,7 +409,7 @@ class HilbertCombiner(Combiner):
                         beta_correction = 1.
 
                     if combined_signal is None:
-                        combined_signal = np.zeros(len(signal))
+                        combined_signal = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
 
                     combined_signal += beta_correction * self._coefficients[i][j] * signal
 
@@ -413,8 +488,8 @@ class VectorSumCombiner(Combiner):
 
                 for i, (parameters, signal, delay) in enumerate(registers[0]):
                     if i == 0:
-                        combined_signal = np.zeros(len(signal))
-                        prev_signal = np.zeros(len(signal))
+                        combined_signal = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
+                        prev_signal = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
                     else:
                         phase_advance_per_turn = (
                                 registers[0].phase_advance_per_turn)
@@ -425,7 +500,7 @@ class VectorSumCombiner(Combiner):
                         beta_2 = prev_parameters['beta']
                         delay_2 = delay
 
-                        combined_signal = combined_signal + \
+                        combined_signal += \
                                         self.__combine_signals(prev_signal, delay_1,
                                                                location_1, beta_1,
                                                                signal, delay_2,
@@ -447,7 +522,7 @@ class VectorSumCombiner(Combiner):
             for register in registers[1:]:
                 for (parameters_1, signal_1, delay_1), (parameters_2, signal_2, delay_2) in zip(prev_register,register):
                         if combined_signal is None:
-                            combined_signal = np.zeros(len(signal_1))
+                            combined_signal = np.zeros(np.shape(signal_1), dtype=signal_dtype(signal_1))
 
                         phase_advance_per_turn = (
                                 prev_register.phase_advance_per_turn)
@@ -456,7 +531,7 @@ class VectorSumCombiner(Combiner):
                         location_2 = parameters_2['location']
                         beta_2 = parameters_2['beta']
 
-                        combined_signal = combined_signal + \
+                        combined_signal += \
                                         self.__combine_signals(signal_1, delay_1,
                                                                location_1, beta_1,
                                                                signal_2, delay_2,
@@ -561,8 +636,16 @@ class FIRCombiner(Combiner):
         ----------
         coefficients: list
             A list of FIR coefficients
+        coefficient_bits : int
+            A number of bits in the coefficients for fixed-point signals
+        accumulator_bits : int
+            A width of the accumulator for fixed-point signals
         """
         self._coefficients = coefficients
+        self._coefficient_bits = kwargs.pop('coefficient_bits', 18)
+        self._accumulator_bits = kwargs.pop('accumulator_bits', 48)
+        self._integer_coefficients, self._fraction_bits = fixed_point_coefficients(coefficients,
+                                                                                   self._coefficient_bits)
         super(FIRCombiner, self).__init__(*args, **kwargs)
         self.label = 'FIR combiner'
 
@@ -570,13 +653,23 @@ class FIRCombiner(Combiner):
                 additional_phase_advance, beta_conversion):
         
         combined_signal = None
+        fixed_point = False
         for register in registers:
             if len(register) >= len(self._coefficients):
                 for i, (parameters, signal, delay) in enumerate(register):
                     if combined_signal is None:
-                        combined_signal = np.zeros(len(signal))
+                        # the products of the integer codes are accumulated as integers
+                        fixed_point = is_fixed_point(signal)
+                        if fixed_point:
+                            code_dtype = signal.dtype
+                            combined_signal = np.zeros(np.shape(signal), dtype=np.int64)
+                        else:
+                            combined_signal = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
                     if i < len(self._coefficients):
-                        combined_signal += self._coefficients[i] * signal
+                        if fixed_point:
+                            combined_signal += np.multiply(self._integer_coefficients[i], signal, dtype=np.int64)
+                        else:
+                            combined_signal += self._coefficients[i] * signal
 
         if combined_signal is not None:
                         
@@ -587,7 +680,15 @@ class FIRCombiner(Combiner):
                     beta_correction = np.sqrt(target_beta/parameters['beta'])
             else:
                 beta_correction = 1.
-            combined_signal = combined_signal*beta_correction
+
+            if fixed_point:
+                codes = np.empty(np.shape(combined_signal), dtype=code_dtype)
+                fixed_point_output(combined_signal, self._fraction_bits, self._accumulator_bits, codes)
+                if np.any(beta_correction != 1.):
+                    round_to_codes(codes*beta_correction, codes)
+                combined_signal = codes
+            else:
+                combined_signal = combined_signal*beta_correction
 
         return combined_signal
 
@@ -635,7 +736,8 @@ class TurnFIRFilter(object):
     """A signal processor, which can be used as a FIR filer in turn domain.
     """
 
-    def __init__(self, coefficients, tune, delay = 0, additional_phase_advance = 0., **kwargs):
+    def __init__(self, coefficients, tune, delay = 0, additional_phase_advance = 0., coefficient_bits=18,
+                 accumulator_bits=48, **kwargs):
         """
         Parameters
         ----------
@@ -648,8 +750,14 @@ class TurnFIRFilter(object):
         addtional_phase_advance: float
             An additional betatron phase advance in radians to be taken into
             account to the betatron phase correction.
+        coefficient_bits : int
+            A number of bits in the coefficients for fixed-point signals
+        accumulator_bits : int
+            A width of the accumulator for fixed-point signals
         """
         self._coefficients = coefficients
+        self._coefficient_bits = coefficient_bits
+        self._accumulator_bits = accumulator_bits
         self._tune = tune
         self._additional_phase_advance = additional_phase_advance
         self._register = Register(len(self._coefficients), self._tune, delay)
@@ -658,6 +766,14 @@ class TurnFIRFilter(object):
         self.extensions = []
         self._macros = [] + default_macros(self, 'TurnFIRFilter', **kwargs)
 
+    def prepare(self, parameters, *args, **kwargs):
+        self._register.prepare(parameters, *args, **kwargs)
+        if self._combiner is None:
+            self.__init_combiner(parameters)
+        self._combiner.prepare()
+
+        return parameters
+
     def process(self, parameters, signal, *args, **kwargs):
         self._register.process(parameters, signal, *args, **kwargs)
         if self._combiner is None:
@@ -670,7 +786,16 @@ class TurnFIRFilter(object):
 
         if output_signal is None:
             output_parameters = parameters
-            output_signal = np.zeros(len(signal))
+            if is_fixed_point(signal):
+                output_signal = np.zeros(np.shape(signal), dtype=signal.dtype)
+            else:
+                output_signal = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
+        elif is_fixed_point(signal):
+            if output_signal.dtype != signal.dtype:
+                output_signal = round_to_codes(output_signal, np.empty(np.shape(output_signal), dtype=signal.dtype))
+        elif output_signal.dtype != signal_dtype(signal):
+            # e.g. beta corrections given as float64 arrays for multi-bunch signals
+            output_signal = output_signal.astype(signal_dtype(signal))
 
         return output_parameters, output_signal
 
@@ -680,7 +805,9 @@ class TurnFIRFilter(object):
         target_beta = parameters['beta']
         extra_phase = self._additional_phase_advance
         self._combiner = FIRCombiner(self._coefficients,registers, target_location,
-                                                   target_beta, extra_phase)
+                                                   target_beta, extra_phase,
+                                                   coefficient_bits=self._coefficient_bits,
+                                                   accumulator_bits=self._accumulator_bits)
 
 class TurnDelay(object):
     """ Delays the signal a number of turns given as an input parameter.
@@ -718,6 +845,14 @@ class TurnDelay(object):
         self.extensions = []
         self._macros = [] + default_macros(self, 'TurnDelay', **kwargs)
 
+    def prepare(self, parameters, *args, **kwargs):
+        self._register.prepare(parameters, *args, **kwargs)
+        if self._combiner is None:
+            self.__init_combiner(parameters)
+        self._combiner.prepare()
+
+        return parameters
+
     def process(self, parameters, signal, *args, **kwargs):
         self._register.process(parameters, signal, *args, **kwargs)
 
@@ -731,7 +866,16 @@ class TurnDelay(object):
 #        print output_signal
         if output_signal is None:
             output_parameters = parameters
-            output_signal = np.zeros(len(signal))
+            if is_fixed_point(signal):
+                output_signal = np.zeros(np.shape(signal), dtype=signal.dtype)
+            else:
+                output_signal = np.zeros(np.shape(signal), dtype=signal_dtype(signal))
+        elif is_fixed_point(signal):
+            if output_signal.dtype != signal.dtype:
+                output_signal = round_to_codes(output_signal, np.empty(np.shape(output_signal), dtype=signal.dtype))
+        elif output_signal.dtype != signal_dtype(signal):
+            # e.g. beta corrections given as float64 arrays for multi-bunch signals
+            output_signal = output_signal.astype(signal_dtype(signal))
 
         return output_parameters, output_signal
 
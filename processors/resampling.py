@@ -1,10 +1,9 @@
 import numpy as np
-import copy
-from scipy import interpolate
-from scipy.sparse import csr_matrix
 
 from ..core import Parameters, bin_edges_to_z_bins, z_bins_to_bin_edges
-from ..core import append_bin_edges, bin_mids, default_macros
+from ..core import bin_mids, default_macros, cached_init, signal_dtype
+from ..core import is_fixed_point, round_to_codes, to_values
+from cython_hacks import cython_csr_product
 
 """Signal processors for resampling a signal.
 
@@ -12,6 +11,93 @@ from ..core import append_bin_edges, bin_mids, default_macros
 @date: 11/10/2017
 """
 
+def _sparse_conversion(rows, cols, values, shape):
+    """ Returns a conversion function, which multiplies the input signal by a sparse matrix given in the coordinate
+        format. Zero values are removed and the matrix is stored in the CSR format. The output is written into
+        the array given by the parameter out, if it is given. The channels of a multi-channel signal are converted
+        separately.
+    """
+    from scipy.sparse import csr_matrix
+    nonzero = (values != 0.)
+    sparse_matrix = csr_matrix((values[nonzero], (rows[nonzero], cols[nonzero])), shape=shape)
+
+    return _csr_conversion(sparse_matrix.indptr, sparse_matrix.indices, sparse_matrix.data, shape)
+
+
+def _csr_conversion(indptr, indices, data, shape):
+    """ Returns a conversion function for a sparse matrix given in the CSR format (see _sparse_conversion).
+        The values of the matrix are converted to the precision of the input signal.
+    """
+    from scipy.sparse import csr_matrix
+    sparse_matrix = csr_matrix((data, indices, indptr), shape=shape)
+    indptr = np.asarray(indptr, dtype=np.intc)
+    indices = np.asarray(indices, dtype=np.intc)
+    typed_data = {np.dtype(np.float64): np.asarray(data, dtype=np.float64)}
+    n_rows, n_columns = shape
+
+    def convert_signal(input_signal, out=None):
+        dtype = signal_dtype(input_signal)
+        data = typed_data.get(dtype, None)
+        if data is None:
+            data = typed_data[np.dtype(np.float64)].astype(dtype)
+            typed_data[dtype] = data
+
+        if out is None:
+            out = np.zeros(np.shape(input_signal)[:-1] + (n_rows,), dtype=dtype)
+
+        if out.ndim == 1:
+            cython_csr_product(indptr, indices, data, n_columns, np.ascontiguousarray(input_signal, dtype=dtype),
+                               out)
+        else:
+            for input_channel, output_channel in zip(input_signal, out):
+                cython_csr_product(indptr, indices, data, n_columns,
+                                   np.ascontiguousarray(input_channel, dtype=dtype), output_channel)
+        return out
+
+    convert_signal.matrix = sparse_matrix
+    return convert_signal
+
+
+def _bin_pairs(left, right, parameters):
+    """ Returns row and column indexes for all pairs of the intervals (left, right) and the bins of the given
+        parameters, which might overlap. The index ranges are calculated in closed form for uniform bin sets and by
+        using binary search for sorted bin sets. Otherwise all the pairs are returned.
+    """
+    bin_edges = parameters['bin_edges']
+    n_bins = len(bin_edges)
+    bin_set = getattr(parameters, 'bin_set', None)
+
+    if (bin_set is not None) and bin_set.is_sorted:
+        idx_from, idx_to = bin_set.overlapping_bins(left, right)
+    elif np.all(np.diff(bin_edges[:, 0]) >= 0.) and np.all(np.diff(bin_edges[:, 1]) >= 0.):
+        idx_from = np.searchsorted(bin_edges[:, 1], left, side='right')
+        idx_to = np.maximum(np.searchsorted(bin_edges[:, 0], right, side='right'), idx_from)
+    else:
+        idx_from = np.zeros(len(left), dtype=int)
+        idx_to = np.zeros(len(left), dtype=int) + n_bins
+
+    counts = idx_to - idx_from
+    rows = np.repeat(np.arange(len(left)), counts)
+    row_starts = np.cumsum(counts) - counts
+    cols = idx_from[rows] + np.arange(len(rows)) - row_starts[rows]
+
+    return rows, cols
+
+
+def _shifted_segments(segment_bin_edges, offsets):
+    # bin edges of the segments, which are copies of the given segment shifted by the offsets
+    offsets = np.array(offsets, dtype=float)
+    bin_edges = segment_bin_edges[np.newaxis, :, :] + offsets[:, np.newaxis, np.newaxis]
+    return bin_edges.reshape(-1, 2)
+
+
+def _CDF(x, ref_from, ref_to):
+    # a vectorized version of the cumulative distribution function of a bin
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(x <= ref_from, 0.,
+                        np.where(x < ref_to, (x - ref_from) / (ref_to - ref_from), 1.))
+
+
 class Resampler(object):
 
     def __init__(self, method, n_samples=None, offset=0., data_conversion='sum',
@@ -85,11 +171,46 @@ class Resampler(object):
         self._output_signal = None
 
         self._convert_signal = None
+        self._codes = None
 
-        self.extensions = []
+        self.extensions = ['output_buffer', 'linear']
         self._macros = [] + default_macros(self, 'Resampler', **kwargs)
         self.signal_classes = None
 
+        # the segments are resampled one by one, when the new bins are
+        # determined segment by segment and the data are not interpolated
+        # over the whole signal
+        if isinstance(self._method, tuple) and \
+                (self._method[0] in ('sequenced', 'upsampling', 'downsampling')) and \
+                (self._data_conversion != 'interpolation'):
+            self.extensions.append('segment')
+
+    def time_support(self, bin_spacings):
+        bin_spacing = bin_spacings[-1]
+
+        if self._method[0] == 'harmonic':
+            n_samples = self._n_samples if self._n_samples is not None else 1
+            output_spacing = 1./(self._method[1]*n_samples)
+        elif self._method[0] == 'sequenced':
+            output_spacing = 1./self._method[1]
+        elif self._method[0] == 'upsampling':
+            output_spacing = bin_spacing/float(self._method[1])
+        elif self._method[0] == 'downsampling':
+            output_spacing = bin_spacing*self._method[1]
+        elif self._method[0] == 'previous':
+            output_spacing = bin_spacings[self._method[1]]
+        else:
+            raise ValueError('Unknown sampling method')
+
+        if self._data_conversion == 'interpolation':
+            # the spline is treated as a local interpolation between the neighbouring input bins
+            support = 2.*bin_spacing
+        else:
+            # the output bins depend on the overlapping input bins
+            support = 0.5*(bin_spacing + output_spacing)
+
+        return support, support, output_spacing
+
     def _init_harmonic_bins(self, parameters, signal):
         self.signal_classes = (1,2)
         base_frequency = self._method[1]
@@ -121,44 +242,23 @@ class Resampler(object):
         segment_z_bins = segment_z_bins + (self._offset - np.floor(n_bins_per_segment/2.)-0.5)*bin_width
         segment_bin_edges = z_bins_to_bin_edges(segment_z_bins)
 
-        bin_edges = None
-
-        for i in xrange(self._n_extras):
-            offset = start_mid - (self._n_extras-i)*segment_length
-            if bin_edges is None:
-                bin_edges = np.copy(segment_bin_edges+offset)
-            else:
-                bin_edges = append_bin_edges(bin_edges, segment_bin_edges+offset)
-
-        for i in xrange(n_sampled_sequencies):
-            offset = i*segment_length + start_mid
-            if bin_edges is None:
-                bin_edges = np.copy(segment_bin_edges+offset)
-            else:
-                bin_edges = append_bin_edges(bin_edges, segment_bin_edges+offset)
-
-        for i in xrange(self._n_extras):
-            offset = start_mid + (i+n_sampled_sequencies)*segment_length
-            if bin_edges is None:
-                bin_edges = np.copy(segment_bin_edges+offset)
-            else:
-                bin_edges = append_bin_edges(bin_edges, segment_bin_edges+offset)
+        extra_idx = np.arange(self._n_extras)
+        offsets = np.concatenate((start_mid - (self._n_extras-extra_idx)*segment_length,
+                                  np.arange(n_sampled_sequencies)*segment_length + start_mid,
+                                  start_mid + (extra_idx+n_sampled_sequencies)*segment_length))
+        bin_edges = _shifted_segments(segment_bin_edges, offsets)
 
         signal_class = 2
         n_segments = 1
         n_bins_per_segment = total_n_samples
         segment_ref_points = [np.mean(bin_edges_to_z_bins(bin_edges))]
-        previous_parameters = []
+        previous_parameters = parameters
         location = parameters['location']
         beta = parameters['beta']
 
         self._output_parameters = Parameters(signal_class, bin_edges, n_segments,
                                              n_bins_per_segment, segment_ref_points,
                                              previous_parameters, location, beta)
-        temp_parameters = copy.deepcopy(parameters)
-        temp_parameters['previous_parameters'] = []
-        self._output_parameters['previous_parameters'] = copy.deepcopy(parameters['previous_parameters'])
-        self._output_parameters['previous_parameters'].append(temp_parameters)
         self._output_signal = np.zeros(total_n_samples)
 
 
@@ -177,32 +277,21 @@ class Resampler(object):
         segment_z_bins = segment_z_bins - np.mean(segment_z_bins) + self._offset*bin_width
         segment_bin_edges = z_bins_to_bin_edges(segment_z_bins)
 
-        bin_edges = None
-        for offset in parameters['segment_ref_points']:
-            if bin_edges is None:
-                temp = (segment_bin_edges+offset)
-                bin_edges = temp
-            else:
-                bin_edges = append_bin_edges(bin_edges, segment_bin_edges+offset)
+        bin_edges = _shifted_segments(segment_bin_edges, parameters['segment_ref_points'])
         signal_class = 1
         n_segments = parameters['n_segments']
         segment_ref_points = parameters['segment_ref_points']
-        previous_parameters =  []
+        previous_parameters = parameters
         location = parameters['location']
         beta = parameters['beta']
         self._output_parameters = Parameters(signal_class, bin_edges, n_segments,
                                              n_bins_per_segment, segment_ref_points,
                                              previous_parameters, location, beta)
-        temp_parameters = copy.deepcopy(parameters)
-        temp_parameters['previous_parameters'] = []
-        self._output_parameters['previous_parameters'] = copy.deepcopy(parameters['previous_parameters'])
-        self._output_parameters['previous_parameters'].append(temp_parameters)
         self._output_signal = np.zeros(self._output_parameters['n_segments'] * self._output_parameters['n_bins_per_segment'])
 
     def _init_previous_bins(self, parameters, signal):
         self.signal_classes = (0,0)
-        self._output_parameters = copy.deepcopy(parameters['previous_parameters'][self._method[1]])
-        self._output_parameters['previous_parameters'] = copy.deepcopy(parameters['previous_parameters'][0:self._method[1]])
+        self._output_parameters = parameters['previous_parameters'][self._method[1]]
 
         self._output_signal = np.zeros(self._output_parameters['n_segments'] * self._output_parameters['n_bins_per_segment'])
 
@@ -211,38 +300,26 @@ class Resampler(object):
         multiplier = self._method[1]
 
         original_edges = parameters['bin_edges']
-        new_edges = None
-
-        for edges in original_edges:
-            new_bin_width = (edges[1]-edges[0])/float(multiplier)
 
-            temp_edges = np.zeros((multiplier, 2))
-
-            for i in xrange(multiplier):
-                temp_edges[i,0] = edges[0] + i * new_bin_width
-                temp_edges[i,1] = edges[0] + (i + 1) * new_bin_width
-
-            if new_edges is None:
-                new_edges = temp_edges
-            else:
-                new_edges = append_bin_edges(new_edges,temp_edges)
+        new_bin_widths = (original_edges[:, 1]-original_edges[:, 0])/float(multiplier)
+        sub_idx = np.arange(multiplier)
+        new_edges = np.zeros((len(original_edges), multiplier, 2))
+        new_edges[:, :, 0] = original_edges[:, :1] + sub_idx * new_bin_widths[:, np.newaxis]
+        new_edges[:, :, 1] = original_edges[:, :1] + (sub_idx + 1) * new_bin_widths[:, np.newaxis]
+        new_edges = new_edges.reshape(-1, 2)
 
 
         signal_class = parameters['class']
         n_segments = parameters['n_segments']
         n_bins_per_segment = parameters['n_bins_per_segment']*multiplier
         segment_ref_points = parameters['segment_ref_points']
-        previous_parameters =  []
+        previous_parameters = parameters
         location = parameters['location']
         beta = parameters['beta']
         self._output_parameters = Parameters(signal_class, new_edges, n_segments,
                                              n_bins_per_segment, segment_ref_points,
                                              previous_parameters, location, beta)
-        temp_parameters = copy.deepcopy(parameters)
-        temp_parameters['previous_parameters'] = []
-        self._output_parameters['previous_parameters'] = copy.deepcopy(parameters['previous_parameters'])
-        self._output_parameters['previous_parameters'].append(temp_parameters)
-        self._output_signal = np.zeros(len(signal)*multiplier)
+        self._output_signal = np.zeros(len(parameters['bin_edges'])*multiplier)
 
     def _init_downsampling(self, parameters, signal):
         self.signal_classes = (0,0)
@@ -252,40 +329,31 @@ class Resampler(object):
         original_n_bins_per_segment = parameters['n_bins_per_segment']
 
         n_bins_per_segment = int(np.floor(original_n_bins_per_segment/multiplier))
-        new_edges = None
 
-        for j in xrange(parameters['n_segments']):
-            for i in xrange(n_bins_per_segment):
-                first_edge = j * original_n_bins_per_segment + i * multiplier
-                last_edge = j * original_n_bins_per_segment + (i + 1) * multiplier -1
+        segment_idx = np.arange(parameters['n_segments'])[:, np.newaxis]
+        bin_idx = np.arange(n_bins_per_segment)[np.newaxis, :]
+        first_edges = (segment_idx * original_n_bins_per_segment + bin_idx * multiplier).reshape(-1)
+        last_edges = (segment_idx * original_n_bins_per_segment + (bin_idx + 1) * multiplier - 1).reshape(-1)
 
-                temp_edges = np.zeros((1, 2))
-                temp_edges[0,0] = original_edges[first_edge,0]
-                temp_edges[0,1] = original_edges[last_edge,1]
-
-                if new_edges is None:
-                    new_edges = temp_edges
-                else:
-                    new_edges = append_bin_edges(new_edges,temp_edges)
+        new_edges = np.zeros((len(first_edges), 2))
+        new_edges[:, 0] = original_edges[first_edges, 0]
+        new_edges[:, 1] = original_edges[last_edges, 1]
 
 
         signal_class = parameters['class']
         n_segments = parameters['n_segments']
         segment_ref_points = parameters['segment_ref_points']
-        previous_parameters =  []
+        previous_parameters = parameters
         location = parameters['location']
         beta = parameters['beta']
         self._output_parameters = Parameters(signal_class, new_edges, n_segments,
                                              n_bins_per_segment, segment_ref_points,
                                              previous_parameters, location, beta)
-        temp_parameters = copy.deepcopy(parameters)
-        temp_parameters['previous_parameters'] = []
-        self._output_parameters['previous_parameters'] = copy.deepcopy(parameters['previous_parameters'])
-        self._output_parameters['previous_parameters'].append(temp_parameters)
         self._output_signal = np.zeros(n_bins_per_segment*n_segments)
 
 
     def _init_interp_conversion(self, parameters, signal):
+        from scipy import interpolate
         conversion_map = np.zeros(len(self._output_signal), dtype=bool)
 
         input_bin_mids = bin_mids(parameters['bin_edges'])
@@ -302,144 +370,84 @@ class Resampler(object):
 
             conversion_map = conversion_map + map_below_max*map_above_min
 
-        def convert_signal(input_signal):
-            output_signal = np.zeros(len(output_bin_mids))
-            tck = interpolate.splrep(input_bin_mids, input_signal, s=0)
-            output_signal[conversion_map] = interpolate.splev(output_bin_mids[conversion_map], tck, der=0)
-            return output_signal
-
-        return convert_signal
-
-    def _init_sum_conversion(self, parameters, signal):
-        def CDF(x, ref_edges):
-            if x <= ref_edges[0]:
-                return 0.
-            elif x < ref_edges[1]:
-                return (x-ref_edges[0])/float(ref_edges[1]-ref_edges[0])
+        def convert_signal(input_signal, out=None):
+            if out is None:
+                out = np.zeros(np.shape(input_signal)[:-1] + (len(output_bin_mids),),
+                               dtype=signal_dtype(input_signal))
             else:
-                return 1.
-
-        big_matrix = np.zeros((len(self._output_signal), len(signal)))
-        for i, output_edges in enumerate(self._output_parameters['bin_edges']):
-            for j, input_edges in enumerate(parameters['bin_edges']):
-                big_matrix[i, j] = CDF(output_edges[1], input_edges) - CDF(output_edges[0], input_edges)
-        sparse_matrix = csr_matrix(big_matrix)
+                out.fill(0.)
 
-        def convert_signal(input_signal):
-            return sparse_matrix.dot(input_signal)
+            if out.ndim == 1:
+                tck = interpolate.splrep(input_bin_mids, input_signal, s=0)
+                out[conversion_map] = interpolate.splev(output_bin_mids[conversion_map], tck, der=0)
+            else:
+                for input_channel, output_channel in zip(input_signal, out):
+                    tck = interpolate.splrep(input_bin_mids, input_channel, s=0)
+                    output_channel[conversion_map] = interpolate.splev(output_bin_mids[conversion_map], tck, der=0)
+            return out
 
         return convert_signal
 
-    def _init_upsampler_kernel_conversion(self, parameters, signal):
-        kernel = self._data_conversion[1]
-        big_matrix = np.zeros((len(self._output_signal), len(signal)))
-        for j, input_edges in enumerate(parameters['bin_edges']):
-            for k in range(len(kernel)):
-                i = j*len(kernel) + k
-                big_matrix[i, j] = kernel[k]
-        sparse_matrix = csr_matrix(big_matrix)
+    def _overlap_values(self, parameters, signal):
+        # fractions of the input bins overlapping with the output bins
+        input_edges = parameters['bin_edges']
+        output_edges = self._output_parameters['bin_edges']
 
-        def convert_signal(input_signal):
-            return sparse_matrix.dot(input_signal)
+        rows, cols = _bin_pairs(output_edges[:, 0], output_edges[:, 1], parameters)
+        input_from = input_edges[cols, 0]
+        input_to = input_edges[cols, 1]
+        values = _CDF(output_edges[rows, 1], input_from, input_to) - _CDF(output_edges[rows, 0], input_from, input_to)
 
-        return convert_signal
+        return rows, cols, values
 
-    def _init_integral_conversion(self, parameters, signal):
-        def CDF(x, ref_edges):
-            if x <= ref_edges[0]:
-                return 0.
-            elif x < ref_edges[1]:
-                return (x-ref_edges[0])/float(ref_edges[1]-ref_edges[0])
-            else:
-                return 1.
+    def _init_sum_conversion(self, parameters, signal):
+        rows, cols, values = self._overlap_values(parameters, signal)
 
-        big_matrix = np.zeros((len(self._output_signal), len(signal)))
+        return _sparse_conversion(rows, cols, values, (len(self._output_signal), len(parameters['bin_edges'])))
 
-        for i, output_edges in enumerate(self._output_parameters['bin_edges']):
-            for j, input_edges in enumerate(parameters['bin_edges']):
-                bin_width = input_edges[1] - input_edges[0]
-                big_matrix[i, j] = (CDF(output_edges[1], input_edges) - CDF(output_edges[0], input_edges))*bin_width
+    def _init_upsampler_kernel_conversion(self, parameters, signal):
+        kernel = np.array(self._data_conversion[1], dtype=float)
+        cols = np.repeat(np.arange(len(parameters['bin_edges'])), len(kernel))
+        rows = cols*len(kernel) + np.tile(np.arange(len(kernel)), len(parameters['bin_edges']))
+        values = np.tile(kernel, len(parameters['bin_edges']))
 
-        sparse_matrix = csr_matrix(big_matrix)
+        return _sparse_conversion(rows, cols, values, (len(self._output_signal), len(parameters['bin_edges'])))
 
-        def convert_signal(input_signal):
-            return sparse_matrix.dot(input_signal)
+    def _init_integral_conversion(self, parameters, signal):
+        rows, cols, values = self._overlap_values(parameters, signal)
+        input_edges = parameters['bin_edges']
+        values = values*(input_edges[cols, 1] - input_edges[cols, 0])
 
-        return convert_signal
+        return _sparse_conversion(rows, cols, values, (len(self._output_signal), len(parameters['bin_edges'])))
 
     def _init_avg_conversion(self, parameters, signal):
-        def CDF(x, ref_edges):
-            if x <= ref_edges[0]:
-                return 0.
-            elif x < ref_edges[1]:
-                return (x-ref_edges[0])/float(ref_edges[1]-ref_edges[0])
-            else:
-                return 1.
-
-        big_matrix = np.zeros((len(self._output_signal), len(signal)))
-
+        rows, cols, values = self._overlap_values(parameters, signal)
+        input_edges = parameters['bin_edges']
+        output_edges = self._output_parameters['bin_edges']
+        width_coeff = (input_edges[cols, 1]-input_edges[cols, 0])/(output_edges[rows, 1]-output_edges[rows, 0])
+        values = values*width_coeff
 
-        for i, output_edges in enumerate(self._output_parameters['bin_edges']):
-            for j, input_edges in enumerate(parameters['bin_edges']):
-                width_coeff =(input_edges[1]-input_edges[0])/(output_edges[1]-output_edges[0])
-                big_matrix[i, j] = (CDF(output_edges[1], input_edges) - CDF(output_edges[0], input_edges))*width_coeff
-
-        sparse_matrix = csr_matrix(big_matrix)
-
-        def convert_signal(input_signal):
-            return sparse_matrix.dot(input_signal)
-
-        return convert_signal
+        return _sparse_conversion(rows, cols, values, (len(self._output_signal), len(parameters['bin_edges'])))
 
     def _init_avg_bin_conversion(self, parameters, signal):
-        def CDF(x, ref_edges):
-            if x <= ref_edges[0]:
-                return 0.
-            elif x < ref_edges[1]:
-                return (x-ref_edges[0])/float(ref_edges[1]-ref_edges[0])
-            else:
-                return 1.
-
-        big_matrix = np.zeros((len(self._output_signal), len(signal)))
-
+        rows, cols, values = self._overlap_values(parameters, signal)
 
-        for i, output_edges in enumerate(self._output_parameters['bin_edges']):
-            for j, input_edges in enumerate(parameters['bin_edges']):
-                big_matrix[i, j] = (CDF(output_edges[1], input_edges) - CDF(output_edges[0], input_edges))
-            if np.sum(big_matrix[i, :]) != 0.:
-                big_matrix[i, :] = big_matrix[i, :]/np.sum(big_matrix[i, :])
-
-        sparse_matrix = csr_matrix(big_matrix)
-
-        def convert_signal(input_signal):
-            return sparse_matrix.dot(input_signal)
-
-        return convert_signal
+        row_sums = np.bincount(rows, weights=values, minlength=len(self._output_signal))
+        row_sums[row_sums == 0.] = 1.
+        values = values/row_sums[rows]
 
+        return _sparse_conversion(rows, cols, values, (len(self._output_signal), len(parameters['bin_edges'])))
 
     def _init_value_conversion(self, parameters, signal):
-        def CDF(x, ref_edges):
-            if x <= ref_edges[0]:
-                return 0.
-            elif x < ref_edges[1]:
-                return (x-ref_edges[0])/float(ref_edges[1]-ref_edges[0])
-            else:
-                return 1.
-
-        big_matrix = np.zeros((len(self._output_signal), len(signal)))
+        input_edges = parameters['bin_edges']
         output_bin_mids = bin_mids(self._output_parameters['bin_edges'])
 
-        for i, mid in enumerate(output_bin_mids):
-            for j, edges in enumerate(parameters['bin_edges']):
-                if (mid >= edges[0]) and (mid < edges[1]) :
-                    big_matrix[i, j] = 1
+        rows, cols = _bin_pairs(output_bin_mids, output_bin_mids, parameters)
+        values = ((output_bin_mids[rows] >= input_edges[cols, 0]) &
+                  (output_bin_mids[rows] < input_edges[cols, 1])).astype(float)
 
-        sparse_matrix = csr_matrix(big_matrix)
+        return _sparse_conversion(rows, cols, values, (len(self._output_signal), len(parameters['bin_edges'])))
 
-        def convert_signal(input_signal):
-            return sparse_matrix.dot(input_signal)
-
-        return convert_signal
     def _init_extremum_conversion(self, parameters, signal):
         # use np.split etc
         pass
@@ -460,37 +468,79 @@ class Resampler(object):
                 raise ValueError('Unknown sampling method')
         else:
             raise ValueError('Unknown sampling method')
+
+        # the codes of a fixed-point signal are resampled as they are
+        if self._output_parameters['scale'] != parameters['scale']:
+            self._output_parameters = self._output_parameters.replace(scale=parameters['scale'])
         
         if self._data_conversion == 'interpolation':
             self._convert_signal = self._init_interp_conversion(parameters, signal)
+            return
         elif self._data_conversion == 'sum':
-            self._convert_signal = self._init_sum_conversion(parameters, signal)
+            init_conversion = self._init_sum_conversion
         elif self._data_conversion == 'integral':
-            self._convert_signal = self._init_integral_conversion(parameters, signal)
+            init_conversion = self._init_integral_conversion
         elif self._data_conversion == 'average':
-            self._convert_signal = self._init_avg_conversion(parameters, signal)
+            init_conversion = self._init_avg_conversion
         elif self._data_conversion == 'average_bin_value':
-            self._convert_signal = self._init_avg_bin_conversion(parameters, signal)
+            init_conversion = self._init_avg_bin_conversion
         elif self._data_conversion == 'value':
-            self._convert_signal = self._init_value_conversion(parameters, signal)
+            init_conversion = self._init_value_conversion
         elif isinstance(self._method, tuple):
             if self._data_conversion[0] == 'upsampler_kernel':
-                self._convert_signal = self._init_upsampler_kernel_conversion(parameters, signal)
+                init_conversion = self._init_upsampler_kernel_conversion
             else:
                 raise ValueError('Unknown data conversion method')
         else:
             raise ValueError('Unknown data conversion method')
 
-    def process(self, parameters, signal, *args, **kwargs):
+        def conversion_matrix():
+            matrix = init_conversion(parameters, signal).matrix
+            return {'indptr': matrix.indptr, 'indices': matrix.indices, 'data': matrix.data,
+                    'shape': np.array(matrix.shape)}
+
+        # the conversion matrix might be loaded from the initialization cache
+        products = cached_init(self, parameters, conversion_matrix)
+        self._convert_signal = _csr_conversion(products['indptr'], products['indices'], products['data'],
+                                               tuple(products['shape']))
+
+    def prepare(self, parameters, *args, **kwargs):
+        # the initialization depends only on the parameters of the signal
+        if self._convert_signal is None:
+            self._init_variables(parameters, None)
+
+        return self._output_parameters
+
+    def process(self, parameters, signal, out=None, *args, **kwargs):
         if self._convert_signal is None:
             self._init_variables(parameters,signal)
 
-        output_signal = self._convert_signal(signal)
+        if is_fixed_point(signal):
+            return self._output_parameters, self._convert_codes(signal, out)
+
+        output_signal = self._convert_signal(signal, out)
 
         return self._output_parameters, output_signal
 
+    def _convert_codes(self, signal, out=None):
+        # The codes are resampled as floating point numbers (e.g. to the given
+        # output buffer) and rounded to the codes of the input signal
+        if (out is not None) and (out.dtype != np.float64):
+            out = None
+        output_values = self._convert_signal(signal, out)
+
+        if (self._codes is None) or (self._codes.shape != output_values.shape) or \
+                (self._codes.dtype != signal.dtype):
+            self._codes = np.empty(output_values.shape, dtype=signal.dtype)
+
+        return round_to_codes(output_values, self._codes)
+
+    def linear_operator(self):
+        # the sparse conversions provide the matrix, otherwise it is probed
+        return getattr(self._convert_signal, 'matrix', None)
+
 class Quantizer(object):
-    def __init__(self, n_bits, input_range, **kwargs):
+    def __init__(self, n_bits, input_range, code_dtype=None, **kwargs):
         """
         Quantizates the input signal into discrete levels
 
@@ -502,6 +552,10 @@ class Quantizer(object):
         input_range : tuple
             A range which is divided into the n bits. The signal values exceed
             the range are limited into the range values
+        code_dtype : NumPy dtype
+            If given (e.g. np.int16 or np.int32), the output signal consists
+            of the integer codes of the levels, i.e. it is a fixed-point signal
+            (see core.py). The codes are limited to the levels within the range.
         """
 
         self._n_bits = n_bits
@@ -509,23 +563,82 @@ class Quantizer(object):
         self._input_range = input_range
         self._step_size = (self._input_range[1]-self._input_range[0])/float(self._n_steps)
 
+        self._code_dtype = None
+        if code_dtype is not None:
+            self._code_dtype = np.dtype(code_dtype)
+            if self._code_dtype.kind != 'i':
+                raise ValueError('The codes must be signed integers.')
+            self._code_range = (int(np.ceil(self._input_range[0]/self._step_size - 1e-6)),
+                                int(np.floor(self._input_range[1]/self._step_size + 1e-6)))
+            limits = np.iinfo(self._code_dtype)
+            if (self._code_range[0] < limits.min) or (self._code_range[1] > limits.max):
+                raise ValueError('The codes of the range do not fit into ' + str(self._code_dtype) + '.')
+        self._codes = None
+        self._input_parameters = None
+        self._output_parameters = None
+
         self.signal_classes = (0, 0)
 
-        self.extensions = []
+        if self._code_dtype is None:
+            self.extensions = ['output_buffer', 'segment']
+        else:
+            # the codes are written into an own buffer. The codes are not
+            # processed in parts (see the segment extension), because
+            # a processor chain converts its input signal to floating point.
+            self.extensions = []
         self._macros = [] + default_macros(self, 'Quantizer', **kwargs)
 
-    def process(self, parameters, signal, *args, **kwargs):
-        output_signal = self._step_size*np.floor(signal/self._step_size+0.5)
+    def _parameters(self, parameters):
+        # the parameters of the output signal for the given input parameters
+        if parameters is not self._input_parameters:
+            self._input_parameters = parameters
+            if self._code_dtype is not None:
+                self._output_parameters = parameters.replace(scale=self._step_size)
+            elif parameters['scale'] is not None:
+                self._output_parameters = parameters.replace(scale=None)
+            else:
+                self._output_parameters = parameters
+        return self._output_parameters
+
+    def prepare(self, parameters, *args, **kwargs):
+        return self._parameters(parameters)
+
+    def process(self, parameters, signal, out=None, *args, **kwargs):
+        if parameters['scale'] is not None:
+            # the codes of a fixed-point signal are quantized as values
+            signal = to_values(parameters, signal)[1]
+
+        if self._code_dtype is not None:
+            return self._parameters(parameters), self._quantize_codes(signal)
+
+        if (out is None) or (out.dtype.kind != 'f'):
+            out = np.empty(np.shape(signal), dtype=signal_dtype(signal))
+
+        # the operations are done in place, i.e. out can be the input signal
+        np.divide(signal, self._step_size, out=out)
+        out += 0.5
+        np.floor(out, out=out)
+        out *= self._step_size
+        np.clip(out, self._input_range[0], self._input_range[1], out=out)
+
+        return self._parameters(parameters), out
+
+    def _quantize_codes(self, signal):
+        if (self._codes is None) or (self._codes.shape != np.shape(signal)):
+            self._codes = np.empty(np.shape(signal), dtype=self._code_dtype)
 
-        output_signal[output_signal < self._input_range[0]] = self._input_range[0]
-        output_signal[output_signal > self._input_range[1]] = self._input_range[1]
+        codes = np.divide(signal, self._step_size)
+        codes += 0.5
+        np.floor(codes, out=codes)
+        np.clip(codes, self._code_range[0], self._code_range[1], out=codes)
+        np.copyto(self._codes, codes, casting='unsafe')
 
-        return parameters, output_signal
+        return self._codes
 
 
 class ADC(object):
     def __init__(self, sampling_rate,  n_bits=None, input_range=None, n_samples=None,
-                 data_conversion='sum', **kwargs):
+                 data_conversion='sum', code_dtype=None, **kwargs):
         """
         A model for an analog to digital converter. The input signal is
         resamapled segment by segment by using a given sampling rate.
@@ -544,6 +657,9 @@ class ADC(object):
         n_samples : int
             A number of bins per segment is set. If None, the number
             of samples corresponds to the ceil(segment_length*f_sampling)
+        code_dtype : NumPy dtype
+            If given (e.g. np.int16), the output signal is given as integer
+            codes of the quantizer (see Quantizer)
         """
 
         self.signal_classes = (0, 1)
@@ -552,25 +668,45 @@ class ADC(object):
 
         self._digitizer = None
         if (n_bits is not None) and (input_range is not None):
-            self._digitizer = Quantizer(n_bits,input_range, **kwargs)
+            self._digitizer = Quantizer(n_bits,input_range, code_dtype=code_dtype, **kwargs)
         elif (n_bits is not None) or (input_range is not None):
             raise ValueError('Both n_bits and input_range are required for the Quantizer.')
+        elif code_dtype is not None:
+            raise ValueError('The integer codes require n_bits and input_range.')
 
-        self.extensions = []
+        self.extensions = ['output_buffer']
         self._macros = [] + default_macros(self, 'ADC', **kwargs)
+        # the signal is not quantized
+        if self._digitizer is None:
+            self.extensions.append('linear')
+        if ('segment' in self._resampler.extensions) and \
+                ((self._digitizer is None) or ('segment' in self._digitizer.extensions)):
+            self.extensions.append('segment')
+
+    def prepare(self, parameters, *args, **kwargs):
+        output_parameters = self._resampler.prepare(parameters, *args, **kwargs)
+        if self._digitizer is not None:
+            output_parameters = self._digitizer.prepare(output_parameters, *args, **kwargs)
+        return output_parameters
 
-    def process(self, parameters, signal, *args, **kwargs):
-        output_parameters, output_signal = self._resampler.process(parameters, signal, *args, **kwargs)
+    def process(self, parameters, signal, out=None, *args, **kwargs):
+        output_parameters, output_signal = self._resampler.process(parameters, signal, *args, out=out, **kwargs)
 
         if self._digitizer is not None:
-            output_parameters, output_signal = self._digitizer.process(output_parameters, output_signal
-                                                                              , *args, **kwargs)
+            output_parameters, output_signal = self._digitizer.process(output_parameters, output_signal, *args,
+                                                                       out=output_signal, **kwargs)
 
         return output_parameters, output_signal
 
+    def linear_operator(self):
+        return self._resampler.linear_operator()
+
+    def time_support(self, bin_spacings):
+        return self._resampler.time_support(bin_spacings)
+
 class HarmonicADC(object):
     def __init__(self, base_frequency, n_bits=None, input_range=None,
-                 multiplier = 1, data_conversion='average_bin_value', **kwargs):
+                 multiplier = 1, data_conversion='average_bin_value', code_dtype=None, **kwargs):
         """
         A model for an analog to digital converter, which is simular to the
         regular ADC object expect that the input signal is continously resampled
@@ -589,6 +725,9 @@ class HarmonicADC(object):
         multiplier : int
             A multiplier for the base frequnecy, which together define
             the sampling rate, i.e. f_sampling = f_base * multiplier
+        code_dtype : NumPy dtype
+            If given (e.g. np.int16), the output signal is given as integer
+            codes of the quantizer (see Quantizer)
         """
         self.signal_classes = (0, 2)
         self._resampler = Resampler(('harmonic', (base_frequency)) , multiplier,
@@ -596,22 +735,39 @@ class HarmonicADC(object):
 
         self._digitizer = None
         if (n_bits is not None) and (input_range is not None):
-            self._digitizer = Quantizer(n_bits,input_range, **kwargs)
+            self._digitizer = Quantizer(n_bits,input_range, code_dtype=code_dtype, **kwargs)
         elif (n_bits is not None) or (input_range is not None):
             raise ValueError('Both n_bits and input_range are required for the Quantizer.')
+        elif code_dtype is not None:
+            raise ValueError('The integer codes require n_bits and input_range.')
 
-        self.extensions = []
+        self.extensions = ['output_buffer']
         self._macros = [] + default_macros(self, 'HarmonicADC', **kwargs)
+        # the signal is not quantized
+        if self._digitizer is None:
+            self.extensions.append('linear')
 
-    def process(self, parameters, signal, *args, **kwargs):
-        output_parameters, output_signal = self._resampler.process(parameters, signal, *args, **kwargs)
+    def prepare(self, parameters, *args, **kwargs):
+        output_parameters = self._resampler.prepare(parameters, *args, **kwargs)
+        if self._digitizer is not None:
+            output_parameters = self._digitizer.prepare(output_parameters, *args, **kwargs)
+        return output_parameters
+
+    def process(self, parameters, signal, out=None, *args, **kwargs):
+        output_parameters, output_signal = self._resampler.process(parameters, signal, *args, out=out, **kwargs)
 
         if self._digitizer is not None:
-            output_parameters, output_signal = self._digitizer.process(output_parameters, output_signal
-                                                                              , *args, **kwargs)
+            output_parameters, output_signal = self._digitizer.process(output_parameters, output_signal, *args,
+                                                                       out=output_signal, **kwargs)
 
         return output_parameters, output_signal
 
+    def linear_operator(self):
+        return self._resampler.linear_operator()
+
+    def time_support(self, bin_spacings):
+        return self._resampler.time_support(bin_spacings)
+
 
 class DAC(object):
     def __init__(self,  n_bits = None, output_range = None, method = ('upsampling', 4),
@@ -622,6 +778,7 @@ class DAC(object):
         because the sampling rate is often minimized in the real life applications,
         but after the DAC the signal is reprocessed by using analog electronics. An
         analog signal is continous, which modelling requres higher smapling rate.
+        A fixed-point input signal is converted to values (see core.py).
 
         Parameters
         ----------
@@ -649,19 +806,55 @@ class DAC(object):
         elif (n_bits is not None) or (output_range is not None):
             raise ValueError('Both n_bits and input_range are required for the Quantizer.')
 
-        self.extensions = []
+        self._input_parameters = None
+        self._value_parameters = None
+        self._values = None
+
+        self.extensions = ['output_buffer']
         self._macros = [] + default_macros(self, 'DAC', **kwargs)
+        # the signal is not quantized
+        if self._digitizer is None:
+            self.extensions.append('linear')
+
+    def _to_values(self, parameters, signal, dtype):
+        # the codes are converted to values (in the precision of the output buffer) before the conversion
+        if parameters is not self._input_parameters:
+            self._input_parameters = parameters
+            self._value_parameters = parameters.replace(scale=None)
+        if (self._values is None) or (self._values.shape != np.shape(signal)) or (self._values.dtype != dtype):
+            self._values = np.empty(np.shape(signal), dtype=dtype)
+        np.multiply(signal, parameters['scale'], out=self._values)
+
+        return self._value_parameters, self._values
+
+    def prepare(self, parameters, *args, **kwargs):
+        if parameters['scale'] is not None:
+            parameters = parameters.replace(scale=None)
+        output_parameters = self._resampler.prepare(parameters, *args, **kwargs)
+        if self._digitizer is not None:
+            output_parameters = self._digitizer.prepare(output_parameters, *args, **kwargs)
+        return output_parameters
 
-    def process(self, parameters, signal, *args, **kwargs):
-        output_parameters, output_signal = self._resampler.process(parameters, signal, *args, **kwargs)
+    def process(self, parameters, signal, out=None, *args, **kwargs):
+        if parameters['scale'] is not None:
+            dtype = out.dtype if out is not None else np.dtype(np.float64)
+            parameters, signal = self._to_values(parameters, signal, dtype)
+
+        output_parameters, output_signal = self._resampler.process(parameters, signal, *args, out=out, **kwargs)
 
         if self._digitizer is not None:
-            output_parameters, output_signal = self._digitizer.process(output_parameters, output_signal,
-                                                                              *args, **kwargs)
+            output_parameters, output_signal = self._digitizer.process(output_parameters, output_signal, *args,
+                                                                       out=output_signal, **kwargs)
 
 
         return output_parameters, output_signal
 
+    def linear_operator(self):
+        return self._resampler.linear_operator()
+
+    def time_support(self, bin_spacings):
+        return self._resampler.time_support(bin_spacings)
+
 class Upsampler(Resampler):
     def __init__(self, multiplier, kernel=None, **kwargs):
         """
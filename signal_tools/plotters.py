@@ -1,11 +1,15 @@
 import numpy as np
-import matplotlib.pyplot as plt
 from scipy.constants import c, pi
-import seaborn as sns
-from mpl_toolkits.mplot3d import Axes3D
-from matplotlib.collections import PolyCollection
+
+""" Matplotlib and seaborn are imported inside the plotting functions, i.e. they are required only when the
+    functions are used.
+"""
 
 def plot_3D_traces(traces, var='x'):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    # registers the '3d' projection
+    from mpl_toolkits.mplot3d import Axes3D
 
     data =  getattr(traces,var)
 
@@ -38,6 +42,8 @@ def plot_3D_traces(traces, var='x'):
 
 
 def plot_traces(traces,var = 'x', mark = '.'):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     n_turns = traces.z.shape[0]
     fig = plt.figure(figsize=(8, 10))
@@ -64,6 +70,8 @@ def plot_traces(traces,var = 'x', mark = '.'):
 
 
 def plot_beam(beam,var = 'x', mark = '.', fig = None, ax1 = None, ax11 = None, label = ' '):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     if fig is None:
         fig = plt.figure(figsize=(8, 10))
@@ -96,6 +104,8 @@ def plot_beam(beam,var = 'x', mark = '.', fig = None, ax1 = None, ax11 = None, l
 
 
 def plot_beams(beams, labels, var = 'x', mark = '.', fig = None, ax1 = None, ax11 = None):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     if fig is None:
         fig = plt.figure(figsize=(8, 10))
@@ -156,6 +166,7 @@ def plot_beams(beams, labels, var = 'x', mark = '.', fig = None, ax1 = None, ax1
 
 
 def plot_frequency_responses(data, labels, f_c, amp_range=(1e-2,4), phase_range=(-45.,45.)):
+    import matplotlib.pyplot as plt
     fig = plt.figure(figsize=(10, 6))
 
     ax1 = fig.add_subplot(211)
@@ -200,7 +211,8 @@ def plot_frequency_responses(data, labels, f_c, amp_range=(1e-2,4), phase_range=
     return fig, ax1, ax2
 
 
-def plot_debug_data(processors, source = 'input'):
+def plot_debug_data(processors, source = 'input', record = -1, channel = 0):
+    import matplotlib.pyplot as plt
 
 
     def pick_signals(processor, source = 'input'):
@@ -212,14 +224,20 @@ def plot_debug_data(processors, source = 'input'):
             as x values for plotting), 'bins' are data for visualizing sampling and 'signal' is the actual signal.
         """
 
+        captured = processor.trace[record]
         if source == 'input':
-            bin_edges = processor.input_parameters['bin_edges']
-            raw_signal = processor.input_signal
+            raw_signal = captured.input_signal
         elif source == 'output':
-            bin_edges = processor.output_parameters['bin_edges']
-            raw_signal = processor.output_signal
+            raw_signal = captured.output_signal
         else:
             raise ValueError('Unknown value for the data source')
+        bin_edges = captured.bin_edges(source)
+
+        if raw_signal is None:
+            return None
+        if raw_signal.ndim > 1:
+            raw_signal = raw_signal[channel]
+
         z = np.zeros(len(raw_signal)*4)
         bins = np.zeros(len(raw_signal)*4)
         signal = np.zeros(len(raw_signal)*4)
@@ -254,30 +272,22 @@ def plot_debug_data(processors, source = 'input'):
 
 
     for i, processor in enumerate(processors):
-        if source == 'input':
-            if hasattr(processor, 'input_signal'):
-                if processor.debug:
-                    t, z, bins, signal = pick_signals(processor,'input')
-                    label=processor.label
-                    ax1.plot(t*1e9,bins*coeff, label=label)
-                    ax11.plot(z, np.zeros(len(z)))
-                    ax11.cla()
-                    coeff *= 0.9
-                    ax2.plot(t*1e9,signal*1e3)
-                    ax22.plot(z, np.zeros(len(z)))
-                    ax22.cla()
-        elif source == 'output':
-            if hasattr(processor, 'output_signal'):
-                if processor.debug:
-                    t, z, bins, signal = pick_signals(processor,'output')
-                    label=processor.label
-                    ax1.plot(t*1e9,bins*coeff, label=label)
-                    ax11.plot(z, np.zeros(len(z)))
-                    ax11.cla()
-                    coeff *= 0.9
-                    ax2.plot(t*1e9,signal*1e3)
-                    ax22.plot(z, np.zeros(len(z)))
-                    ax22.cla()
+        if source not in ('input', 'output'):
+            raise ValueError('Unknown value for the data source')
+
+        trace = getattr(processor, 'trace', None)
+        if (trace is not None) and (len(trace) > 0):
+            data = pick_signals(processor, source)
+            if data is not None:
+                t, z, bins, signal = data
+                label=processor.label
+                ax1.plot(t*1e9,bins*coeff, label=label)
+                ax11.plot(z, np.zeros(len(z)))
+                ax11.cla()
+                coeff *= 0.9
+                ax2.plot(t*1e9,signal*1e3)
+                ax22.plot(z, np.zeros(len(z)))
+                ax22.cla()
 
     ax1.set_ylim(-1.1,1.1)
     ax1.set_xticklabels(())
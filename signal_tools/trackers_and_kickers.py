@@ -1,9 +1,8 @@
 import numpy as np
-from ..core import process
+from ..core import process, ProcessorChain
 from collections import deque
 from scipy.constants import c
 from cython_hacks import cython_circular_convolution
-from scipy import signal
 from abc import ABCMeta, abstractmethod
 
 
@@ -379,7 +378,7 @@ class Damper(object):
         ----------
         gain : float
             Pass band gain of the damper, i.e. 2/damping_time
-        processors : list
+        processors : list or ProcessorChain
             A list of signal processors
         pickup_variable : str
             A beam property, which is readed as a pickup signal
@@ -387,7 +386,7 @@ class Damper(object):
             A beam property, which is kicked
         """
         self.gain = gain
-        self.processors = processors
+        self.processors = ProcessorChain(processors)
         self.pickup_variable = pickup_variable
         self.kick_variable = kick_variable
         
@@ -549,6 +548,7 @@ class CircularWake(object):
             return raw_kick
 
     def _convolve_fftconcolve(self, source, impulse_response):
+            from scipy import signal
             raw_kick = signal.fftconvolve(source,impulse_response, mode='full')
             i_from = len(impulse_response)
             i_to = len(impulse_response)+len(source)/2
@@ -0,0 +1,342 @@
+""" Tests for the fast paths of the feedback objects. Each check tracks a PyHEADTAIL bunch through a feedback object
+    using one of the fast paths and compares the coordinates of the particles to the reference path, i.e. the same
+    feedback model calculated without the fast path. The script fails if any of the checks fails.
+
+    Usage: python feedback_fast_path_test.py
+"""
+
+import os
+import sys
+import numpy as np
+from scipy.constants import e, m_p
+
+BIN = os.path.expanduser("../../../")
+sys.path.append(BIN)
+
+from PyHEADTAIL.particles.generators import generate_Gaussian6DTwiss
+from PyHEADTAIL.particles.particles import Particles
+from PyHEADTAIL.particles.slicing import UniformBinSlicer, UniformChargeSlicer, SliceSet
+
+from PyHEADTAIL_feedback.feedback import OneboxFeedback, PickUp, Kicker, IdealBunchFeedback, IdealSliceFeedback
+from PyHEADTAIL_feedback.processors.multiplication import IdealAmplifier, NoiseGate
+from PyHEADTAIL_feedback.processors.convolution import FIRFilter, Lowpass
+from PyHEADTAIL_feedback.processors.register import Register
+from PyHEADTAIL_feedback.processors.resampling import Quantizer
+from PyHEADTAIL_feedback.processors.misc import Bypass
+
+circumference = 26658.883
+h_bunch = 3564
+
+# The slice sets of the PyHEADTAIL versions without multi-bunch support do not include the bucket of the bunch
+if not hasattr(SliceSet, 'bucket_id'):
+    SliceSet.circumference = circumference
+    SliceSet.h_bunch = h_bunch
+    SliceSet.bucket_id = 0
+
+
+def generate_bunch(seed=1, n_macroparticles=20000):
+    np.random.seed(seed)
+    bunch = generate_Gaussian6DTwiss(macroparticlenumber=n_macroparticles, intensity=1e11, charge=e, mass=m_p,
+                                     circumference=circumference, gamma=4263.16, alpha_x=0., alpha_y=0.,
+                                     beta_x=92.7, beta_y=93.2, beta_z=1., epsn_x=2e-6, epsn_y=2e-6, epsn_z=2.5)
+    bunch.x += 1e-4
+    bunch.y -= 2e-4
+    return bunch
+
+
+def compare(label, bunch, reference, limit=1e-12):
+    deviation = 0.
+    scale = 0.
+    for coordinate in ('x', 'xp', 'y', 'yp'):
+        values = getattr(bunch, coordinate)
+        reference_values = getattr(reference, coordinate)
+        deviation = max(deviation, np.max(np.abs(values - reference_values)))
+        scale = max(scale, np.max(np.abs(reference_values)))
+    if deviation > limit*scale:
+        print 'FAILED: ' + label + ' (maximum deviation {:.3e})'.format(deviation)
+        return False
+    return True
+
+
+def track_onebox(processors_x, processors_y, n_turns=3, prepare=False, **kwargs):
+    bunch = generate_bunch()
+    feedback = OneboxFeedback(0.1, UniformBinSlicer(20, n_sigma_z=3), processors_x, processors_y,
+                              pickup_axis='displacement', kicker_axis='divergence', beta_x=92.7, beta_y=93.2,
+                              **kwargs)
+    if prepare:
+        feedback.prepare(bunch)
+    for i in xrange(n_turns):
+        feedback.track(bunch)
+    return bunch
+
+
+def check_fixed_point_kicks():
+    # The integer codes of a quantizer (code_dtype) must give the same kicks as the quantized values, also when
+    # the chain does not include a DAC and the codes pass through non-linear processors
+    def chains(code_dtype):
+        return [[Quantizer(16, (-1e-3, 1e-3), code_dtype=code_dtype)],
+                [Quantizer(16, (-1e-3, 1e-3), code_dtype=code_dtype), IdealAmplifier(2.)],
+                [Quantizer(16, (-1e-3, 1e-3), code_dtype=code_dtype), NoiseGate(1e-5), FIRFilter([0.5, 0.5])]]
+
+    passed = True
+    for i, (processors, reference_processors) in enumerate(zip(chains(np.int32), chains(None))):
+        reference = track_onebox(reference_processors, chains(None)[i])
+        bunch = track_onebox(processors, chains(np.int32)[i])
+        passed &= compare('fixed-point kicks without a DAC (chain {:d})'.format(i), bunch, reference)
+    return passed
+
+
+def track_pickups_and_kicker(shared_kicker, n_turns=6, kick_parameters=None):
+    bunch = generate_bunch()
+    slicer = UniformBinSlicer(20, n_sigma_z=3)
+    pickups = []
+    registers_x = []
+    registers_y = []
+    for location in (0.1, 0.35):
+        registers_x.append(Register(3, 0.27))
+        registers_y.append(Register(3, 0.31))
+        pickups.append(PickUp(slicer, [Lowpass(100e6), registers_x[-1]], [Lowpass(100e6), registers_y[-1]],
+                              location, 92.7, location, 93.2))
+
+    processors_x = [Lowpass(50e6)]
+    if shared_kicker:
+        processors_y = processors_x
+    else:
+        processors_y = [Lowpass(50e6)]
+    kicker = Kicker(0.1, slicer, processors_x, processors_y, registers_x, registers_y, 0.7, 93., 0.7, 94.)
+    for i in xrange(n_turns):
+        for pickup in pickups:
+            pickup.track(bunch)
+        kicker.track(bunch)
+        if kick_parameters is not None:
+            kick_parameters.append(kicker._shared_parameters_cache[2])
+    return bunch
+
+
+def check_shared_chains():
+    # A kicker reading multiple pickups must give the same kicks with the processors shared by the planes as with
+    # separate processors. The parameters of the shared processors are built only once. The pickups can not share
+    # processors including registers.
+    reference = track_pickups_and_kicker(False)
+    kick_parameters = []
+    passed = compare('kicker sharing processors with multiple pickups',
+                     track_pickups_and_kicker(True, kick_parameters=kick_parameters), reference)
+    kick_parameters = [parameters for parameters in kick_parameters if parameters is not None]
+    if (len(kick_parameters) == 0) or any(parameters is not kick_parameters[0] for parameters in kick_parameters):
+        print 'FAILED: the parameters of the shared kicker processors were built on every turn'
+        passed = False
+
+    processors = [Lowpass(100e6), Register(3, 0.27)]
+    try:
+        PickUp(UniformBinSlicer(20, n_sigma_z=3), processors, processors, 0.1, 92.7, 0.1, 93.2)
+    except ValueError:
+        pass
+    else:
+        print 'FAILED: a pickup shared processors including a register'
+        passed = False
+    return passed
+
+
+class CountingSlicer(UniformBinSlicer):
+    # Counts the calculations of the longitudinal cuts
+    n_cut_calls = 0
+
+    def get_long_cuts(self, beam):
+        CountingSlicer.n_cut_calls += 1
+        return super(CountingSlicer, self).get_long_cuts(beam)
+
+
+def check_uniform_cuts():
+    # The cuts of the uniform bins are calculated only when the slice set of the bunch is created, i.e. once in
+    # the slicer and once in the kick until the longitudinal coordinates change
+    bunch = generate_bunch()
+    slicer = CountingSlicer(20, n_sigma_z=3)
+    feedback = OneboxFeedback(0.1, slicer, [FIRFilter([0.5, 0.5])], [FIRFilter([0.5, 0.5])])
+    passed = True
+    for z_scale in (1., 1.01):
+        bunch.z *= z_scale
+        bunch.clean_slices()
+        CountingSlicer.n_cut_calls = 0
+        for i in xrange(4):
+            feedback.track(bunch)
+
+        if CountingSlicer.n_cut_calls != 2:
+            print 'FAILED: the cuts were calculated {:d} times in 4 turns'.format(CountingSlicer.n_cut_calls)
+            passed = False
+        if feedback._uniform_cuts[0][0] != UniformBinSlicer(20, n_sigma_z=3).get_long_cuts(bunch)[0]:
+            print 'FAILED: outdated cuts after the longitudinal coordinates changed'
+            passed = False
+    return passed
+
+
+def check_stored_slice_sets():
+    # The slice set of each turn must be stored to the bunch also when the slice indexes are shared, i.e. the later
+    # objects using the same slicer get the mean values of the current turn
+    bunch = generate_bunch()
+    slicer = UniformBinSlicer(20, n_sigma_z=3)
+    feedback = OneboxFeedback(0.1, slicer, [Bypass()], [Bypass()])
+    passed = True
+    for i in xrange(3):
+        bunch.xp += 1e-6
+        feedback.track(bunch)
+        slice_set = bunch._slice_sets[slicer]
+        if (i > 0) and (slice_set.slice_index_of_particle is not indexes):
+            print 'FAILED: slice indexes not shared on the turn {:d}'.format(i)
+            passed = False
+        # the kick is applied after the slicing
+        within_cuts = slice_set.particles_within_cuts
+        mean_xp = np.bincount(slice_set.slice_index_of_particle[within_cuts], bunch.xp[within_cuts],
+                              slice_set.n_slices) / slice_set.n_macroparticles_per_slice
+        deviation = np.max(np.abs(slice_set.mean_xp*(1. - 0.1) - mean_xp))
+        if deviation > 1e-12*np.max(np.abs(mean_xp)):
+            print 'FAILED: outdated slice set stored on the turn {:d}'.format(i)
+            passed = False
+        indexes = slice_set.slice_index_of_particle
+    return passed
+
+
+def generate_superbunch(bunches, bunch_spacing=4):
+    # A superbunch consisting of copies of the given bunches in the buckets i*bunch_spacing
+    bucket_length = circumference/float(h_bunch)
+    coordinates = {}
+    for coordinate in ('x', 'xp', 'y', 'yp', 'z', 'dp'):
+        coordinates[coordinate] = np.concatenate([getattr(bunch, coordinate) for bunch in bunches])
+    bucket_id = np.concatenate([np.zeros(bunch.macroparticlenumber, dtype=int) + i*bunch_spacing
+                                for i, bunch in enumerate(bunches)])
+    coordinates['z'] -= bucket_id*bucket_length
+    superbunch = Particles(len(bucket_id), bunches[0].particlenumber_per_mp, bunches[0].charge, bunches[0].mass,
+                           circumference, bunches[0].gamma, coords_n_momenta_dict=coordinates)
+    superbunch.bucket_id = bucket_id
+    return superbunch
+
+
+def check_multi_bunch_ideal_feedbacks():
+    # The multi-bunch modes of the ideal feedbacks kick all the bunches of a superbunch at once, which must give
+    # the same kicks as the feedbacks applied to the bunches one by one
+    def bunches():
+        bunch_list = [generate_bunch(seed=i + 1, n_macroparticles=5000) for i in xrange(6)]
+        for i, bunch in enumerate(bunch_list):
+            bunch.xp += 1e-5*np.sin(i)
+            bunch.yp += 1e-5*np.cos(0.3*i)
+        return bunch_list
+
+    def slicer(**kwargs):
+        slicer = UniformBinSlicer(10, **kwargs)
+        slicer.circumference = circumference
+        slicer.h_bunch = h_bunch
+        return slicer
+
+    feedbacks = [('IdealBunchFeedback', lambda: IdealBunchFeedback((0.1, 0.2), multi_bunch=True),
+                  lambda: IdealBunchFeedback((0.1, 0.2)))]
+    for label, kwargs in [('z_cuts', dict(z_cuts=(-0.3, 0.3))), ('n_sigma_z', dict(n_sigma_z=2)), ('extent', {})]:
+        feedbacks.append(('IdealSliceFeedback ({:s})'.format(label),
+                          lambda kwargs=kwargs: IdealSliceFeedback((0.1, 0.2), slicer(**kwargs), multi_bunch=True),
+                          lambda kwargs=kwargs: IdealSliceFeedback((0.1, 0.2), slicer(**kwargs))))
+
+    passed = True
+    for label, multi_bunch_feedback, feedback in feedbacks:
+        reference = bunches()
+        superbunch = generate_superbunch(reference)
+        multi_bunch_feedback().track(superbunch)
+        for bunch in reference:
+            feedback().track(bunch)
+        passed &= compare('multi-bunch ' + label, superbunch, generate_superbunch(reference))
+    return passed
+
+
+def check_prepare():
+    # The processors prepared before the first turn (by default in threads) must give the same kicks as
+    # the processors initialized on the first turn
+    def processors():
+        return [Lowpass(100e6), FIRFilter([0.5, 0.3, 0.2]), Quantizer(16, (-1e-3, 1e-3))]
+
+    reference = track_onebox(processors(), processors())
+    return compare('prepared processors', track_onebox(processors(), processors(), prepare=True), reference)
+
+
+def slicers():
+    # The uniform charge slicer distributes the remaining particles randomly to the slices, i.e. all the particles
+    # must be within the cuts for deterministic slices
+    return [('UniformBinSlicer', UniformBinSlicer(20, n_sigma_z=3)),
+            ('UniformBinSlicer with empty slices', UniformBinSlicer(20, z_cuts=(-0.05, 0.05))),
+            ('UniformChargeSlicer', UniformChargeSlicer(20))]
+
+
+def check_slice_statistics():
+    # The slice sets with the mean values calculated in a single pass over the particles must be equal to the slice
+    # sets of PyHEADTAIL
+    passed = True
+    for label, slicer in slicers():
+        bunch = generate_bunch()
+        feedback = OneboxFeedback(0.1, slicer, [Bypass()], [Bypass()], pickup_axis='displacement',
+                                  phase_x=0., phase_y=0.)
+        variables = [var for var in feedback._required_variables if var != 'n_macroparticles_per_slice']
+
+        slice_set = feedback._slice(bunch)
+        bunch.clean_slices()
+        reference = bunch.get_slices(slicer, statistics=variables)
+
+        if (not np.array_equal(slice_set.slice_index_of_particle, reference.slice_index_of_particle)) or \
+                (not np.array_equal(slice_set.n_macroparticles_per_slice, reference.n_macroparticles_per_slice)):
+            print 'FAILED: slice indexes of the particles ({:s})'.format(label)
+            passed = False
+        for var in variables:
+            values = getattr(slice_set, var)
+            reference_values = getattr(reference, var)
+            deviation = np.max(np.abs(values - reference_values))
+            if not (deviation <= 1e-12*np.max(np.abs(reference_values))):
+                print 'FAILED: {:s} of the slices ({:s}, maximum deviation {:.3e})'.format(var, label, deviation)
+                passed = False
+    return passed
+
+
+def check_slice_fallback():
+    # The slice sets of the coordinates, which are not contiguous arrays in double precision, must be created by
+    # bunch.get_slices(...)
+    passed = True
+    for label, coordinate in [('single precision', lambda u: u.astype(np.float32)),
+                              ('strided', lambda u: np.repeat(u, 2)[::2])]:
+        bunch = generate_bunch()
+        bunch.xp = coordinate(bunch.xp)
+        feedback = OneboxFeedback(0.1, UniformBinSlicer(20, n_sigma_z=3), [Bypass()], [Bypass()])
+
+        calls = []
+        reference = object()
+        bunch.get_slices = lambda slicer, statistics=None: calls.append(statistics) or reference
+        if (feedback._slice(bunch) is not reference) or (calls != [feedback._required_variables]):
+            print 'FAILED: slice set of the {:s} coordinates'.format(label)
+            passed = False
+    return passed
+
+
+def check_slice_kicks():
+    # The kicks of the bypassed slice signals must be equal to the kicks of the ideal slice feedback, which uses
+    # the slice sets of PyHEADTAIL
+    passed = True
+    for label, slicer in slicers():
+        bunch = generate_bunch()
+        reference = generate_bunch()
+        feedback = OneboxFeedback(0.1, slicer, [Bypass()], [Bypass()])
+        reference_feedback = IdealSliceFeedback(0.1, slicer)
+        for i in xrange(2):
+            feedback.track(bunch)
+            reference_feedback.track(reference)
+        passed &= compare('kicks of the slices ({:s})'.format(label), bunch, reference)
+    return passed
+
+
+checks = [check_slice_statistics, check_slice_fallback, check_slice_kicks, check_fixed_point_kicks, check_shared_chains, check_uniform_cuts, check_stored_slice_sets, check_multi_bunch_ideal_feedbacks,
+          check_prepare]
+
+
+def main():
+    passed = True
+    for check in checks:
+        passed &= check()
+    if passed:
+        print 'PASSED'
+    return passed
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
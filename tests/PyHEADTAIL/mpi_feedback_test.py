@@ -0,0 +1,227 @@
+""" Tests for the MPI parallelization of the feedback objects. The script runs each check by using mpirun in a single
+    rank and in two ranks, and compares the results:
+    - the slice statistics gathered by the windowed gatherer, which must send only the bunches within the influence
+      windows of the bunches in the other ranks
+    - the kicks of a pickup and a kicker tracking a train of bunches. The bunch set changes during the tracking
+      (injected bunches), i.e. the windows of the gathered bunches must be determined again.
+    The script is not run by mpirun itself.
+
+    Usage: python mpi_feedback_test.py
+"""
+
+import os
+import sys
+import cPickle
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+from scipy.constants import e, m_p
+
+BIN = os.path.expanduser("../../../")
+sys.path.append(BIN)
+
+circumference = 26658.883
+h_bunch = 3564
+bunch_spacing = 10
+n_bunches = 8
+
+# The bunches tracked on each turn. The bunches 0-3 are in the first rank and the bunches 4-7 in the second rank. On
+# the turn 2, a bunch is injected only to the first rank and, on the turn 4, bunches are injected to both ranks.
+schedule = [[0, 1, 2, 4, 5]] * 2 + [[0, 1, 2, 3, 4, 5]] * 2 + [range(n_bunches)] * 2
+
+
+def generate_bunch(i):
+    from PyHEADTAIL.particles.generators import generate_Gaussian6DTwiss
+    np.random.seed(i + 1)
+    bunch = generate_Gaussian6DTwiss(macroparticlenumber=2000, intensity=1e11, charge=e, mass=m_p,
+                                     circumference=circumference, gamma=4263.16, alpha_x=0., alpha_y=0.,
+                                     beta_x=92.7, beta_y=93.2, beta_z=1., epsn_x=2e-6, epsn_y=2e-6, epsn_z=2.5)
+    bunch.x += 1e-4*np.sin(i)
+    bunch.y -= 2e-4*np.cos(0.3*i)
+    bunch.bucket_id = np.zeros(bunch.macroparticlenumber, dtype=int) + i*bunch_spacing
+    return bunch
+
+
+class Superbunch(object):
+    # The bunches of a rank
+    def __init__(self, bunches):
+        self._bunches = bunches
+        self.beta = bunches[0].beta
+        self.circumference = circumference
+        self.h_bunch = h_bunch
+
+    def split_to_views(self):
+        return self._bunches
+
+
+# The bunches of the gather check. The extents of the bunches are separated by 10 units and the windows extend 12
+# units from the extents, i.e. the kicks of a bunch depend on the neighbouring bunches only.
+n_gathered_bunches = 12
+gathered_variables = ['mean_x', 'mean_xp']
+
+
+def bunch_statistics(i):
+    return {'mean_x': i + 0.1*np.arange(5), 'mean_xp': -i - 0.01*np.arange(5)}
+
+
+def needed_bunches(local, n_bunches):
+    # The local bunches and the bunches within their windows, in the order of the descending bucket ids
+    return [j for j in reversed(xrange(n_bunches)) if any(abs(j - i) <= 1 for i in local)]
+
+
+class LocalSlices(object):
+    def __init__(self, i):
+        for var, values in bunch_statistics(i).iteritems():
+            setattr(self, var, values)
+
+
+def gather(filename):
+    # Gathers the statistics of the local bunches and writes the gathered statistics and the numbers of the sent
+    # bunches of all the ranks to the file in the first rank
+    from mpi4py import MPI
+    from PyHEADTAIL_feedback.feedback import _WindowedGatherer
+
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    local = [i for i in xrange(n_gathered_bunches) if (i*comm.Get_size())//n_gathered_bunches == rank]
+    edges = np.array([[10.*i - 1., 10.*i + 1.] for i in local])
+
+    gatherer = _WindowedGatherer(gathered_variables)
+    gatherer.setup(np.array(local)*bunch_spacing, edges, edges + np.array([-12., 12.]),
+                   [np.linspace(-0.3, 0.3, 6) for i in local], circumference, h_bunch)
+    slice_sets = gatherer.gather([LocalSlices(i) for i in local])
+
+    gathered = [(slice_set.bucket_id//bunch_spacing, dict((var, np.array(getattr(slice_set, var)))
+                                                          for var in gathered_variables))
+                for slice_set in slice_sets]
+    n_sent = sum(len(idx) for _, idx, _ in gatherer._send)
+    results = comm.gather((local, gathered, n_sent), root=0)
+    if rank == 0:
+        with open(filename, 'wb') as f:
+            cPickle.dump(results, f)
+
+
+def check_gather():
+    # Each rank must gather its own bunches and the bunches within their windows, and the statistics must be equal to
+    # those gathered in a single rank. Only the bunches within the windows of the other ranks must be sent.
+    directory = tempfile.mkdtemp()
+    try:
+        results = []
+        for n_ranks in (1, 2):
+            filename = os.path.join(directory, 'gather_{:d}.pkl'.format(n_ranks))
+            if not run(n_ranks, 'gather', filename):
+                return False
+            with open(filename, 'rb') as f:
+                results.append(cPickle.load(f))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    serial_statistics = dict(results[0][0][1])
+    passed = True
+    for rank_results in results:
+        for rank, (local, gathered, n_sent) in enumerate(rank_results):
+            label = 'rank {:d} of {:d}'.format(rank, len(rank_results))
+            if [i for i, statistics in gathered] != needed_bunches(local, n_gathered_bunches):
+                print 'FAILED: gathered bunches {} in the {:s}'.format([i for i, statistics in gathered], label)
+                passed = False
+            for i, statistics in gathered:
+                if any(not np.array_equal(statistics[var], serial_statistics[i][var]) for var in gathered_variables):
+                    print 'FAILED: statistics of the bunch {:d} in the {:s}'.format(i, label)
+                    passed = False
+
+            expected_sent = sum(len(set(local) & set(needed_bunches(other[0], n_gathered_bunches)))
+                                for other_rank, other in enumerate(rank_results) if other_rank != rank)
+            if n_sent != expected_sent:
+                print 'FAILED: {:d} bunches sent from the {:s} ({:d} needed)'.format(n_sent, label, expected_sent)
+                passed = False
+    return passed
+
+
+def track(filename):
+    # Tracks the bunches of the rank and writes the coordinates of all the bunches to the file in the first rank
+    from mpi4py import MPI
+    from PyHEADTAIL.particles.slicing import UniformBinSlicer, SliceSet
+    from PyHEADTAIL_feedback.feedback import PickUp, Kicker
+    from PyHEADTAIL_feedback.processors.convolution import Lowpass
+    from PyHEADTAIL_feedback.processors.register import Register
+
+    # The slice sets of the PyHEADTAIL versions without multi-bunch support do not include the bucket of the bunch
+    if not hasattr(SliceSet, 'bucket_id'):
+        SliceSet.circumference = circumference
+        SliceSet.h_bunch = h_bunch
+        SliceSet.bucket_id = 0
+
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    local = [i for i in xrange(n_bunches) if (i*comm.Get_size())//n_bunches == rank]
+    bunches = dict((i, generate_bunch(i)) for i in local)
+
+    register_x = Register(1, 0.31)
+    register_y = Register(1, 0.32)
+    pickup = PickUp(UniformBinSlicer(10, n_sigma_z=3), [Lowpass(50e6), register_x], [Lowpass(50e6), register_y],
+                    0., 92.7, 0., 93.2, mpi=True)
+    kicker = Kicker(0.1, UniformBinSlicer(10, n_sigma_z=3), [Lowpass(20e6)], [Lowpass(20e6)], [register_x],
+                    [register_y], 0., 92.7, 0., 93.2, combiner='dummy', mpi=True)
+
+    for tracked in schedule:
+        superbunch = Superbunch([bunches[i] for i in local if i in tracked])
+        pickup.track(superbunch)
+        kicker.track(superbunch)
+
+    coordinates = comm.gather(dict((i, np.concatenate([bunch.xp, bunch.yp])) for i, bunch in bunches.iteritems()),
+                              root=0)
+    if rank == 0:
+        for rank_coordinates in coordinates[1:]:
+            coordinates[0].update(rank_coordinates)
+        np.save(filename, np.array([coordinates[0][i] for i in xrange(n_bunches)]))
+
+
+def run(n_ranks, mode, filename):
+    command = ['mpirun', '-n', str(n_ranks), sys.executable, os.path.abspath(__file__), mode, filename]
+    if subprocess.call(command) != 0:
+        print 'FAILED: mpirun -n {:d} ({:s})'.format(n_ranks, mode)
+        return False
+    return True
+
+
+def check_kicks():
+    # The kicks in two ranks must be equal to the kicks in a single rank
+    directory = tempfile.mkdtemp()
+    try:
+        results = []
+        for n_ranks in (1, 2):
+            filename = os.path.join(directory, 'track_{:d}.npy'.format(n_ranks))
+            if not run(n_ranks, 'track', filename):
+                return False
+            results.append(np.load(filename))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    reference, coordinates = results
+
+    deviation = np.max(np.abs(coordinates - reference))
+    if deviation > 1e-12*np.max(np.abs(reference)):
+        print 'FAILED: kicks in two ranks (maximum deviation {:.3e})'.format(deviation)
+        return False
+    return True
+
+
+checks = [check_gather, check_kicks]
+
+
+def main():
+    passed = True
+    for check in checks:
+        passed &= check()
+    if passed:
+        print 'PASSED'
+    return passed
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) > 2) and (sys.argv[1] == 'gather'):
+        gather(sys.argv[2])
+    elif (len(sys.argv) > 2) and (sys.argv[1] == 'track'):
+        track(sys.argv[2])
+    else:
+        sys.exit(0 if main() else 1)
@@ -0,0 +1,128 @@
+""" A test for the single precision mode of the signal processing. The ADT model of the example
+    003_multi_bunch_LHC_instability_with_ADT_model.py is run in double and single precision (ProcessorChain(...,
+    dtype=np.float32)) for a multi-bunch beam over multiple turns and the script fails if the maximum deviation
+    between the kick signals exceeds the given limit. The limit is given relative to the maximum value of the double
+    precision signal and, for the used signal amplitudes, the default limit is smaller than a step of the 16 bit ADC.
+
+    Usage: python dtype_deviation_test.py [relative deviation limit] [number of turns]
+"""
+
+import os
+import sys
+import numpy as np
+
+BIN = os.path.expanduser("../../")
+sys.path.append(BIN)
+
+from PyHEADTAIL_feedback.core import ProcessorChain, process
+from PyHEADTAIL_feedback.signal_tools.signal_generators import Beam
+from PyHEADTAIL_feedback.processors.misc import Bypass
+from PyHEADTAIL_feedback.processors.multiplication import ChargeWeighter
+from PyHEADTAIL_feedback.processors.register import TurnFIRFilter
+from PyHEADTAIL_feedback.processors.convolution import Lowpass, FIRFilter
+from PyHEADTAIL_feedback.processors.resampling import DAC, HarmonicADC, BackToOriginalBins, Upsampler
+
+Q = 59.31
+n_bunches = 24
+bunch_spacing = 25e-9
+bunch_length = 4e-9
+n_slices = 10
+
+lowpass20MHz = [38,118,182,112,-133,-389,-385,-45,318,257,-259,-665,-361,473,877,180,-996,-1187,162,1670,1329,-954,
+                -2648, -1219,2427,4007,419,-5623, -6590,2893,19575,32700,32700,19575, 2893,-6590,-5623,419,4007,2427,
+                -1219,-2648, -954, 1329,1670, 162,-1187,-996,180,877,473,-361,-665,-259, 257,318,-45,-385,-389,-133,
+                112,182,118,38]
+
+phaseEqualizer = [2,4,7,10,12,16,19,22,27,31,36,42,49,57,67,77,90,104,121,141,164,191,223,261,305, 358,422,498,589,
+                  700,836,1004,1215,1483,1832,2301, 2956,3944,5600,9184,25000,-16746,-4256,-2056,-1195,-769,-523,-372,
+                  -271,-202,-153, -118,-91,-71,-56,-44,-34,-27,-20,-15,-11,-7,-4,-1]
+
+
+def turn_phase_filter(Q, delay, additional_phase):
+    """ Three tap coefficients of the turn-by-turn phase filter (calculate_coefficients_3_tap(...) in the file
+        examples/MD4063_filter_functions.py, which requires Matplotlib).
+    """
+    ppt = 2.*np.pi
+    Q = -Q
+    c12 = np.cos(Q*1.*ppt)
+    s12 = np.sin(Q*1.*ppt)
+    c13 = np.cos(Q*2.*ppt)
+    s13 = np.sin(Q*2.*ppt)
+    c14 = np.cos((Q*(2+delay)-additional_phase)*ppt)
+    s14 = np.sin((Q*(2+delay)-additional_phase)*ppt)
+
+    divider = -1.*(-c12*s13+c13*s12-s12+s13)
+
+    cx1 = c14*(1-(c12*s13-c13*s12)/divider)+s14*(-c12+c13)/divider
+    cx2 = (c14*(-(-s13))+s14*(-c13+1))/divider
+    cx3 = (c14*(-(s12))+s14*(c12-1))/divider
+
+    return [cx3, cx2, cx1]
+
+
+def adt_processors():
+    f_RF = 1./bunch_spacing*10.
+    fc = 1.0e6
+    ADC_bits = 16
+    ADC_range = (-1e-3, 1e-3)
+    delay = 1
+
+    FIR_phase_filter = np.array(phaseEqualizer)/float(np.sum(phaseEqualizer))
+    FIR_gain_filter = np.array(lowpass20MHz)/float(np.sum(lowpass20MHz))
+
+    return [
+        Bypass(),
+        ChargeWeighter(normalization='segment_average'),
+        HarmonicADC(1*f_RF/10., ADC_bits, ADC_range, n_extras=10),
+        TurnFIRFilter(turn_phase_filter(Q, delay, 0.25), Q, delay=delay),
+        FIRFilter(FIR_phase_filter, zero_tap=40),
+        Upsampler(3, [1.5, 1.5, 0]),
+        FIRFilter(FIR_gain_filter, zero_tap=34),
+        DAC(ADC_bits, ADC_range),
+        Lowpass(fc, f_cutoff_2nd=10*fc),
+        BackToOriginalBins(),
+    ]
+
+
+def track(dtype, n_turns):
+    # The bunch positions of the signal are given by bunch_id*circumference/h_RF, which are added to the bin edges
+    # in the units of seconds, i.e. the circumference is given here in seconds
+    h_RF = 10*n_bunches
+    beam = Beam(np.arange(n_bunches), h_RF*bunch_spacing, h_RF, bunch_length, 1e11, n_slices)
+    n_bins = n_bunches*n_slices
+    beam.x = 4e-4*np.sin(np.arange(n_bins)*0.37) + 2e-4*np.cos(np.arange(n_bins)*0.05)
+    beam.xp = 4e-4*np.cos(np.arange(n_bins)*0.11)
+
+    processors = ProcessorChain(adt_processors(), dtype=dtype)
+    signals = []
+    for i in xrange(n_turns):
+        parameters, signal = beam.signal('x')
+        output_parameters, output_signal = process(parameters, signal, processors, slice_sets=beam.slice_sets)
+        signals.append(np.array(output_signal, copy=True))
+        beam.rotate(2.*np.pi*Q, 'x')
+    return signals
+
+
+def main(deviation_limit=1e-4, n_turns=10):
+    signals_64 = track(np.float64, n_turns)
+    signals_32 = track(np.float32, n_turns)
+
+    if any(signal.dtype != np.float32 for signal in signals_32):
+        print 'FAILED: the output signal is not in single precision'
+        return False
+
+    scale = max(np.max(np.abs(signal)) for signal in signals_64)
+    deviation = max(np.max(np.abs(signal_64 - signal_32)) for signal_64, signal_32 in zip(signals_64, signals_32))
+    print 'Maximum deviation: {:.3e} (relative {:.3e}, {:d} turns)'.format(deviation, deviation/scale, n_turns)
+
+    if (scale == 0.) or (deviation > deviation_limit*scale):
+        print 'FAILED: the relative deviation exceeds the limit of {:.1e}'.format(deviation_limit)
+        return False
+    print 'PASSED'
+    return True
+
+
+if __name__ == '__main__':
+    deviation_limit = float(sys.argv[1]) if len(sys.argv) > 1 else 1e-4
+    n_turns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    sys.exit(0 if main(deviation_limit, n_turns) else 1)
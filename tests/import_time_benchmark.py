@@ -0,0 +1,80 @@
+""" A benchmark for the import time of the package. The modules are imported in a fresh interpreter and the script
+    fails if an optional heavy dependency (MPI, plotting libraries or the numerical submodules of SciPy) is loaded
+    at import time or if the import takes longer than the given limit.
+
+    Usage: python import_time_benchmark.py [time limit in seconds] [number of repetitions]
+"""
+
+import os
+import sys
+import subprocess
+
+BIN = os.path.expanduser("../../")
+sys.path.append(BIN)
+
+modules = ['PyHEADTAIL_feedback.feedback',
+           'PyHEADTAIL_feedback.processors.convolution',
+           'PyHEADTAIL_feedback.processors.linear_transform',
+           'PyHEADTAIL_feedback.processors.multiplication',
+           'PyHEADTAIL_feedback.processors.resampling',
+           'PyHEADTAIL_feedback.processors.register',
+           'PyHEADTAIL_feedback.processors.misc',
+           'PyHEADTAIL_feedback.signal_tools.plotters',
+           'PyHEADTAIL_feedback.signal_tools.trackers_and_kickers']
+
+# modules which should be imported only when they are used
+lazy_modules = ['PyHEADTAIL.mpi', 'mpi4py',
+                'scipy.integrate', 'scipy.interpolate', 'scipy.sparse', 'scipy.linalg', 'scipy.signal',
+                'scipy.special',
+                'matplotlib', 'seaborn', 'mpl_toolkits.mplot3d']
+
+# NumPy is imported before the timer is started, because it is required in any case
+benchmark_code = """
+import sys, time
+import numpy
+t_start = time.time()
+for module in {modules!r}:
+    __import__(module)
+t_import = time.time() - t_start
+loaded = [module for module in {lazy_modules!r} if sys.modules.get(module) is not None]
+sys.stdout.write('\\n' + repr((t_import, loaded)) + '\\n')
+"""
+
+
+def measure_import():
+    code = benchmark_code.format(modules=modules, lazy_modules=lazy_modules)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.abspath(BIN)] + env.get('PYTHONPATH', '').split(os.pathsep))
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    return eval(output.strip().split('\n')[-1])
+
+
+def main(time_limit=0.5, n_repetitions=5):
+    times = []
+    loaded = set()
+    for i in xrange(n_repetitions):
+        t_import, loaded_modules = measure_import()
+        times.append(t_import)
+        loaded.update(loaded_modules)
+
+    times.sort()
+    t_median = times[len(times)//2]
+    print 'Import time: median {:.1f} ms, min {:.1f} ms, max {:.1f} ms ({:d} repetitions)'.format(
+        t_median*1e3, times[0]*1e3, times[-1]*1e3, n_repetitions)
+
+    passed = True
+    if loaded:
+        print 'FAILED: modules loaded at import time: ' + ', '.join(sorted(loaded))
+        passed = False
+    if t_median > time_limit:
+        print 'FAILED: the median import time exceeds the limit of {:.1f} ms'.format(time_limit*1e3)
+        passed = False
+    if passed:
+        print 'PASSED'
+    return passed
+
+
+if __name__ == '__main__':
+    time_limit = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+    n_repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    sys.exit(0 if main(time_limit, n_repetitions) else 1)
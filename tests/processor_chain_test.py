@@ -0,0 +1,221 @@
+""" Tests for the fast paths of the ProcessorChain. Each check processes signals through a chain using one of
+    the fast paths (output buffers, fused operators, fixed-point codes, the initialization cache) and compares the
+    results to the reference path, i.e. the same processors called one by one without the chain. The script fails if
+    any of the checks fails.
+
+    Usage: python processor_chain_test.py
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+
+BIN = os.path.expanduser("../../")
+sys.path.append(BIN)
+
+from PyHEADTAIL_feedback.core import ProcessorChain, Parameters, FusedOperator, Profiler, process
+from PyHEADTAIL_feedback.core import set_init_cache, get_init_cache
+from PyHEADTAIL_feedback.processors.multiplication import IdealAmplifier, NoiseGate
+from PyHEADTAIL_feedback.processors.addition import Addition
+from PyHEADTAIL_feedback.processors.resampling import Quantizer
+from PyHEADTAIL_feedback.processors import convolution, linear_transform
+from PyHEADTAIL_feedback.processors.convolution import FIRFilter
+from PyHEADTAIL_feedback.processors.linear_transform import Averager
+
+
+def signal_parameters(n_segments, n_bins_per_segment, bin_width=1e-9, segment_spacing=25e-9):
+    bin_edges = np.zeros((n_segments*n_bins_per_segment, 2))
+    for i in xrange(n_segments):
+        i_from = i*n_bins_per_segment
+        i_to = (i+1)*n_bins_per_segment
+        bin_edges[i_from:i_to, 0] = i*segment_spacing + np.arange(n_bins_per_segment)*bin_width
+    bin_edges[:, 1] = bin_edges[:, 0] + bin_width
+    segment_ref_points = np.mean(bin_edges.reshape(n_segments, -1), axis=1)
+    return Parameters(0, bin_edges, n_segments, n_bins_per_segment, segment_ref_points)
+
+
+def compare(label, parameters, signal, parameters_ref, signal_ref, limit=1e-12):
+    deviation = np.max(np.abs(np.asarray(signal, dtype=np.float64) - signal_ref))
+    if (np.shape(signal) != np.shape(signal_ref)) or (parameters != parameters_ref) or \
+            (deviation > limit*max(np.max(np.abs(signal_ref)), 1e-300)):
+        print 'FAILED: ' + label + ' (maximum deviation {:.3e})'.format(deviation)
+        return False
+    return True
+
+
+def check_signal_change():
+    # The buffers of the chain are bound to the first signal. A signal with a different length or different
+    # parameters must give the same result as the processors called one by one.
+    def processors():
+        return [IdealAmplifier(2.), FIRFilter([0.5, 0.3, 0.2]), Averager()]
+
+    chain = ProcessorChain(processors())
+    random_state = np.random.RandomState(1)
+    passed = True
+    for n_segments, n_bins_per_segment in [(1, 20), (1, 20), (1, 40), (2, 20), (1, 20)]:
+        parameters = signal_parameters(n_segments, n_bins_per_segment)
+        signal = random_state.randn(n_segments*n_bins_per_segment)
+        output_parameters, output_signal = chain.process(parameters, signal)
+        reference = process(parameters, signal, processors())
+        passed &= compare('signal change ({:d}x{:d} bins)'.format(n_segments, n_bins_per_segment),
+                          output_parameters, output_signal, *reference)
+    return passed
+
+
+def check_fusion():
+    # A fused chain must give the same result as the unfused processors for two different slicings. The fused
+    # operator itself must fall back to the processors for a signal it was not fused for.
+    def processors():
+        return [IdealAmplifier(2.), FIRFilter([0.5, 0.3, 0.2]), Averager(), IdealAmplifier(0.5)]
+
+    chain = ProcessorChain(processors(), fuse=True)
+    random_state = np.random.RandomState(2)
+    passed = True
+    for n_segments, n_bins_per_segment in [(4, 10), (4, 10), (2, 16), (4, 10)]:
+        parameters = signal_parameters(n_segments, n_bins_per_segment)
+        signal = random_state.randn(n_segments*n_bins_per_segment)
+        output_parameters, output_signal = chain.process(parameters, signal)
+        reference = process(parameters, signal, processors())
+        passed &= compare('fused chain ({:d}x{:d} bins)'.format(n_segments, n_bins_per_segment),
+                          output_parameters, output_signal, *reference)
+
+    fused = [stage for stage in chain.stages if isinstance(stage, FusedOperator)]
+    if len(fused) == 0:
+        print 'FAILED: the linear processors were not fused'
+        return False
+
+    parameters = signal_parameters(3, 12)
+    signal = random_state.randn(3*12)
+    reference = process(parameters, signal, fused[0].processors)
+    passed &= compare('fused operator with other parameters', *(fused[0].process(parameters, signal) + reference))
+    return passed
+
+
+def check_init_cache():
+    # The initialization products loaded from the cache must be equal to the calculated ones, and processors
+    # differing only in the arguments of their impulse responses (e.g. the window of a Sinc filter) must not share
+    # the cached products
+    parameters = signal_parameters(2, 16, bin_width=0.5e-9)
+    signal = np.random.RandomState(3).randn(2*16)
+    filters = [(module, window_type) for module in (convolution, linear_transform)
+               for window_type in ('blackman', 'hamming')]
+
+    previous_cache = get_init_cache()
+    references = [process(parameters, signal, [module.Sinc(200e6, window_type=window_type)])
+                  for module, window_type in filters]
+
+    directory = tempfile.mkdtemp()
+    passed = True
+    try:
+        set_init_cache(directory)
+        for i in xrange(2):
+            # the products are stored to the cache on the first round and loaded from it on the second round
+            for (module, window_type), reference in zip(filters, references):
+                output = process(parameters, signal, [module.Sinc(200e6, window_type=window_type)])
+                passed &= compare('cached {:s}.Sinc ({:s} window, round {:d})'.format(module.__name__, window_type,
+                                                                                     i + 1),
+                                  *(output + reference))
+    finally:
+        set_init_cache(previous_cache)
+        shutil.rmtree(directory, ignore_errors=True)
+    return passed
+
+
+class Offset(Addition):
+    """ Adds a constant value to the signal."""
+    def __init__(self, offset, **kwargs):
+        self._offset = offset
+        super(Offset, self).__init__('bin_midpoint', **kwargs)
+
+    def addend_function(self, seed):
+        return np.zeros(len(seed)) + self._offset
+
+
+def check_fixed_point():
+    # The codes of a fixed-point signal must give the same values as the quantized floating point signal through
+    # the non-linear processors, which depend on the values of the signal
+    def processors(code_dtype):
+        return [Quantizer(16, (-1., 1.), code_dtype=code_dtype), IdealAmplifier(2.), Offset(0.1), NoiseGate(0.5)]
+
+    parameters = signal_parameters(4, 10)
+    signal = np.random.RandomState(4).uniform(-0.9, 0.9, 4*10)
+    reference = process(parameters, signal, processors(None))
+    output = ProcessorChain(processors(np.int32)).process(parameters, signal)
+    if output[0]['scale'] is not None:
+        print 'FAILED: the fixed-point output of the non-linear processors has a scale'
+        return False
+    return compare('fixed-point codes through non-linear processors', *(output + reference))
+
+
+def check_debug_data():
+    # The debug data of a processor must be copies of the signals, i.e. they must not be overwritten by the later
+    # calls through the buffers of the chain, and the debug mode must be checked on every call
+    amplifier = IdealAmplifier(2., debug=False)
+    chain = ProcessorChain([amplifier, FIRFilter([0.5, 0.5])])
+    parameters = signal_parameters(2, 10)
+    random_state = np.random.RandomState(5)
+
+    chain.process(parameters, random_state.randn(2*10))
+    if amplifier.input_signal is not None:
+        print 'FAILED: debug data were stored while the debug mode was off'
+        return False
+
+    amplifier.debug = True
+    signals = [random_state.randn(2*10) for i in xrange(3)]
+    chain.process(parameters, signals[0])
+    stored_input = amplifier.input_signal
+    stored_output = amplifier.output_signal
+    for signal in signals[1:]:
+        chain.process(parameters, signal)
+
+    passed = True
+    passed &= compare('debug input signal', parameters, stored_input, parameters, signals[0])
+    passed &= compare('debug output signal', parameters, stored_output, parameters, 2.*signals[0])
+    passed &= compare('latest debug input signal', amplifier.input_parameters, amplifier.input_signal,
+                      parameters, signals[-1])
+    return passed
+
+
+def check_profiler():
+    # The chains with equal labels must be profiled separately, the calls initializing the chains must be counted
+    # separately and the statistics must be available before the processors are called
+    profiler = Profiler()
+    chains = [ProcessorChain([IdealAmplifier(2.), FIRFilter([0.5, 0.5])]) for i in xrange(2)]
+    for chain in chains:
+        chain.profiler = profiler
+
+    parameters = signal_parameters(2, 10)
+    signal = np.random.RandomState(6).randn(2*10)
+    for i in xrange(6):
+        chains[0].process(parameters, signal)
+    chains[1].process(parameters, signal)
+    profiler.entries(chains[1])
+
+    calls = [row['calls'] for row in profiler.stats()]
+    inits = [row['inits'] for row in profiler.init_stats()]
+    if (calls != [5, 5, 0, 0]) or (inits != [1, 1]):
+        print 'FAILED: profiled calls {} and initializations {}'.format(calls, inits)
+        return False
+    if any(row['time_per_call'] != 0. for row in profiler.stats() if row['calls'] == 0):
+        print 'FAILED: time per call of the processors without calls'
+        return False
+    profiler.summary()
+    return True
+
+
+checks = [check_signal_change, check_fusion, check_init_cache, check_fixed_point, check_debug_data, check_profiler]
+
+
+def main():
+    passed = True
+    for check in checks:
+        passed &= check()
+    if passed:
+        print 'PASSED'
+    return passed
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)